@@ -0,0 +1,191 @@
+import os
+
+import numpy as np
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.vector_stores.types import VectorStoreQueryMode, VectorStoreQueryResult
+
+from QAWithPDF.vector_store import MmapVectorStore, _normalize, top_k
+from logger import logging
+
+DEFAULT_NPROBE = int(os.getenv("SMARTDOC_IVF_NPROBE", "8"))
+DEFAULT_MIN_TRAIN_SIZE = int(os.getenv("SMARTDOC_IVF_MIN_TRAIN", "4096"))
+ASSIGN_BLOCK_ROWS = 16384
+
+
+def assign(matrix, centroids):
+    """
+    Returns the index of the most similar centroid for every row, computed in
+    blocks so a million-row matrix never materializes the full score matrix.
+    """
+    labels = np.empty(len(matrix), dtype=np.int32)
+    for start in range(0, len(matrix), ASSIGN_BLOCK_ROWS):
+        block = np.asarray(matrix[start:start + ASSIGN_BLOCK_ROWS])
+        labels[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return labels
+
+
+def train_centroids(matrix, nlist, iterations=10, sample_size=None, seed=0):
+    """
+    Spherical k-means on (a sample of) the normalized rows.
+
+    Parameters:
+    - nlist: number of inverted lists / centroids
+    - sample_size: rows used for training, defaults to 64 per centroid
+
+    Returns:
+    - (nlist, dim) float32 array of unit-length centroids
+    """
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(matrix), sample_size or 64 * nlist)
+    sample = np.asarray(matrix[np.sort(rng.choice(len(matrix), sample_size, replace=False))], dtype=np.float32)
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        labels = assign(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, sample)
+        empty = ~sums.any(axis=1)
+        # Re-seed empty lists from random samples instead of letting them die.
+        sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+        centroids = _normalize(sums)
+    return centroids
+
+
+class IVFVectorStore(MmapVectorStore):
+    """
+    Approximate nearest-neighbour store: an inverted-file (IVF-Flat) index over
+    MmapVectorStore.
+
+    A spherical k-means quantizer partitions rows into nlist inverted lists; a query
+    scores only the rows in its nprobe closest lists. Rows added after training are
+    assigned to their closest list, so insertion is incremental. Until the store
+    holds min_train_size rows, or when a query carries filters / node ids, search
+    falls back to the exact scan. The quantizer is persisted next to the matrix as
+    <name>.ivf.npz.
+
+    Parameters:
+    - nprobe: lists scanned per query; higher means better recall and more latency
+    - nlist: lists to train, defaults to 4 * sqrt(rows) at training time
+    - min_train_size: rows needed before the quantizer is trained
+    - retrain_factor: retrain once the store grows this many times past the
+      training size, so lists stay balanced as documents are ingested
+    """
+
+    _nprobe = PrivateAttr()
+    _nlist = PrivateAttr()
+    _min_train_size = PrivateAttr()
+    _retrain_factor = PrivateAttr()
+    _centroids = PrivateAttr()
+    _labels = PrivateAttr()
+    _trained_on = PrivateAttr()
+    _list_order = PrivateAttr()
+    _list_bounds = PrivateAttr()
+
+    def __init__(self, nprobe=DEFAULT_NPROBE, nlist=None, min_train_size=DEFAULT_MIN_TRAIN_SIZE,
+                 retrain_factor=4.0, **kwargs):
+        super().__init__(**kwargs)
+        self._nprobe = nprobe
+        self._nlist = nlist
+        self._min_train_size = min_train_size
+        self._retrain_factor = retrain_factor
+        self._centroids = None
+        self._labels = np.empty(0, dtype=np.int32)
+        self._trained_on = 0
+        self._list_order = None
+        self._list_bounds = None
+
+    @classmethod
+    def class_name(cls):
+        return "IVFVectorStore"
+
+    @property
+    def is_trained(self):
+        return self._centroids is not None
+
+    def train(self, nlist=None):
+        """
+        (Re)trains the quantizer on the current rows and reassigns all of them.
+        """
+        with self._lock:
+            matrix = self.matrix
+            nlist = min(nlist or self._nlist or max(1, int(4 * np.sqrt(len(matrix)))), len(matrix))
+            logging.info(f"Training IVF quantizer: {len(matrix)} rows, {nlist} lists")
+            self._centroids = train_centroids(matrix, nlist)
+            self._labels = assign(matrix, self._centroids)
+            self._trained_on = len(matrix)
+            self._list_order = None
+
+    def _refresh(self):
+        """
+        Trains on first use past min_train_size, assigns rows added since the last
+        query and rebuilds the list layout if anything changed.
+        """
+        with self._lock:
+            matrix = self.matrix
+            if not self.is_trained:
+                if len(matrix) >= self._min_train_size:
+                    self.train()
+                else:
+                    return False
+            elif len(matrix) > self._trained_on * self._retrain_factor:
+                self.train()
+            if len(self._labels) < len(matrix):
+                new_labels = assign(matrix[len(self._labels):], self._centroids)
+                self._labels = np.concatenate([self._labels, new_labels])
+                self._list_order = None
+            if self._list_order is None:
+                self._list_order = np.argsort(self._labels, kind="stable")
+                self._list_bounds = np.searchsorted(self._labels[self._list_order], np.arange(len(self._centroids) + 1))
+            return True
+
+    def _keep_rows(self, keep):
+        with self._lock:
+            assigned = len(self._labels)
+            rows = super()._keep_rows(keep)
+            self._labels = self._labels[[row for row in rows if row < assigned]]
+            self._list_order = None
+            return rows
+
+    def query(self, query, **kwargs):
+        if (query.mode != VectorStoreQueryMode.DEFAULT or query.filters is not None
+                or query.node_ids is not None or not self._refresh()):
+            return super().query(query, **kwargs)
+        similarities, ids = self._search(_normalize(query.query_embedding), query.similarity_top_k, self._nprobe)
+        return VectorStoreQueryResult(similarities=similarities, ids=ids)
+
+    def _search(self, q, k, nprobe):
+        probes = top_k(self._centroids @ q, nprobe)
+        candidates = np.concatenate([
+            self._list_order[self._list_bounds[probe]:self._list_bounds[probe + 1]] for probe in probes
+        ])
+        if len(candidates) == 0:
+            return [], []
+        candidates.sort()  # sequential access into the memory-mapped matrix
+        scores = self.matrix[candidates] @ q
+        best = top_k(scores, k)
+        return scores[best].tolist(), [self._ids[row] for row in candidates[best]]
+
+    def query_batch(self, query_embeddings, similarity_top_k=2, nprobe=None):
+        if not self._refresh():
+            return super().query_batch(query_embeddings, similarity_top_k)
+        return [self._search(q, similarity_top_k, nprobe or self._nprobe) for q in _normalize(query_embeddings)]
+
+    def _persist_extra(self, persist_path):
+        self._refresh()
+        if not self.is_trained:
+            return {"ann": "ivf", "nprobe": self._nprobe}
+        base, _ = os.path.splitext(persist_path)
+        np.savez(base + ".ivf.npz", centroids=self._centroids, labels=self._labels)
+        return {
+            "ann": "ivf",
+            "ivf_file": os.path.basename(base + ".ivf.npz"),
+            "nprobe": self._nprobe,
+            "trained_on": self._trained_on,
+        }
+
+    def _load_extra(self, persist_path, table):
+        self._nprobe = table.get("nprobe", self._nprobe)
+        if table.get("ivf_file"):
+            with np.load(os.path.join(os.path.dirname(persist_path), table["ivf_file"])) as data:
+                self._centroids = data["centroids"]
+                self._labels = data["labels"]
+            self._trained_on = table.get("trained_on", len(self._labels))
@@ -0,0 +1,216 @@
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from QAWithPDF.exception import customexception
+from logger import logging
+
+DEFAULT_CACHE_PATH = os.path.join(os.getcwd(), "storage", "answer_cache.sqlite3")
+DEFAULT_MAX_ENTRIES = int(os.getenv("SMARTDOC_ANSWER_CACHE_ENTRIES", "5000"))
+DEFAULT_TTL_SECONDS = int(os.getenv("SMARTDOC_ANSWER_CACHE_TTL", str(7 * 24 * 3600)))
+DEFAULT_SIMILARITY_THRESHOLD = float(os.getenv("SMARTDOC_ANSWER_CACHE_SIMILARITY", "0.95"))
+
+
+def answer_key(doc_hash, prompt, persona, model_name):
+    payload = json.dumps([doc_hash, prompt, persona, model_name])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _scope(doc_hash, persona, model_name):
+    return f"{doc_hash}|{persona}|{model_name}"
+
+
+def sources_from_response(response, limit=3):
+    """
+    Serializable copy of a llama-index Response's source nodes.
+    """
+    return [
+        {"text": source.node.get_content(), "score": source.score, "metadata": dict(source.node.metadata)}
+        for source in (response.source_nodes or [])[:limit]
+    ]
+
+
+class AnswerCache:
+    """
+    Two-tier cache of final answers, persisted in SQLite.
+
+    The exact tier is keyed by (document content hash, final prompt, persona,
+    model). On an exact miss, the semantic tier compares the prompt's embedding
+    with the cached prompts of the same (document, persona, model) scope and
+    reuses an answer at cosine similarity >= similarity_threshold. Entries expire
+    after ttl_seconds and the least recently used ones are dropped past
+    max_entries.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=DEFAULT_MAX_ENTRIES, ttl_seconds=DEFAULT_TTL_SECONDS,
+                 similarity_threshold=DEFAULT_SIMILARITY_THRESHOLD):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._embeddings = OrderedDict()
+        self._lock = threading.RLock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS answers (key TEXT PRIMARY KEY, scope TEXT, prompt TEXT, answer TEXT, "
+                "sources TEXT, embedding BLOB, created REAL, last_used REAL)"
+            )
+        self._load()
+
+    def _load(self):
+        rows = self._conn.execute(
+            "SELECT key, scope, prompt, answer, sources, embedding, created FROM answers "
+            "WHERE created >= ? ORDER BY last_used DESC LIMIT ?",
+            (time.time() - self.ttl_seconds, self.max_entries),
+        ).fetchall()
+        for key, scope, prompt, answer, sources, embedding, created in reversed(rows):
+            self._entries[key] = {
+                "scope": scope,
+                "prompt": prompt,
+                "answer": answer,
+                "sources": json.loads(sources),
+                "embedding": np.frombuffer(embedding, dtype=np.float32) if embedding else None,
+                "created": created,
+            }
+
+    def _embed(self, prompt, embed_fn):
+        # Memoized so the embedding computed for a miss is reused by put().
+        if prompt in self._embeddings:
+            return self._embeddings[prompt]
+        vector = np.asarray(embed_fn(prompt), dtype=np.float32)
+        vector /= np.linalg.norm(vector) or 1.0
+        self._embeddings[prompt] = vector
+        if len(self._embeddings) > 256:
+            self._embeddings.popitem(last=False)
+        return vector
+
+    def _expired(self, entry):
+        return time.time() - entry["created"] > self.ttl_seconds
+
+    def _drop(self, key):
+        self._entries.pop(key, None)
+        with self._conn:
+            self._conn.execute("DELETE FROM answers WHERE key = ?", (key,))
+
+    def _touch(self, key):
+        self._entries.move_to_end(key)
+        with self._conn:
+            self._conn.execute("UPDATE answers SET last_used = ? WHERE key = ?", (time.time(), key))
+
+    def get(self, doc_hash, prompt, persona, model_name, embed_fn=None):
+        """
+        Looks up a cached answer.
+
+        Parameters:
+        - embed_fn: optional callable text -> vector enabling the semantic tier; it
+          is only called after an exact miss when the scope has candidates
+
+        Returns:
+        - dict with answer, sources and match ("exact" or "semantic"), or None
+        """
+        try:
+            with self._lock:
+                key = answer_key(doc_hash, prompt, persona, model_name)
+                entry = self._entries.get(key)
+                if entry is not None and self._expired(entry):
+                    self._drop(key)
+                    entry = None
+                if entry is not None:
+                    self._touch(key)
+                    self.exact_hits += 1
+                    return {"answer": entry["answer"], "sources": entry["sources"], "match": "exact"}
+
+                scope = _scope(doc_hash, persona, model_name)
+                has_candidates = any(
+                    other["scope"] == scope and other["embedding"] is not None for other in self._entries.values()
+                )
+
+            # The embedding call is a network round trip; keep it outside the lock.
+            if embed_fn is not None and has_candidates:
+                query = self._embed(prompt, embed_fn)
+                with self._lock:
+                    candidates = [
+                        (other_key, other) for other_key, other in self._entries.items()
+                        if other["scope"] == scope and other["embedding"] is not None and not self._expired(other)
+                    ]
+                    if candidates:
+                        scores = np.stack([other["embedding"] for _, other in candidates]) @ query
+                        best = int(np.argmax(scores))
+                        if scores[best] >= self.similarity_threshold:
+                            best_key, best_entry = candidates[best]
+                            self._touch(best_key)
+                            self.semantic_hits += 1
+                            logging.info(f"Semantic answer cache hit ({scores[best]:.3f}): {prompt!r} ~ {best_entry['prompt']!r}")
+                            return {"answer": best_entry["answer"], "sources": best_entry["sources"], "match": "semantic"}
+
+            with self._lock:
+                self.misses += 1
+            return None
+        except Exception as e:
+            raise customexception(e, sys)
+
+    def put(self, doc_hash, prompt, persona, model_name, answer, sources, embed_fn=None):
+        """
+        Stores an answer. sources is a list of dicts (see sources_from_response).
+        """
+        try:
+            embedding = self._embed(prompt, embed_fn) if embed_fn is not None else None
+            with self._lock:
+                key = answer_key(doc_hash, prompt, persona, model_name)
+                now = time.time()
+                self._entries[key] = {
+                    "scope": _scope(doc_hash, persona, model_name),
+                    "prompt": prompt,
+                    "answer": answer,
+                    "sources": sources,
+                    "embedding": embedding,
+                    "created": now,
+                }
+                self._entries.move_to_end(key)
+                with self._conn:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        (key, self._entries[key]["scope"], prompt, answer, json.dumps(sources),
+                         embedding.tobytes() if embedding is not None else None, now, now),
+                    )
+                while len(self._entries) > self.max_entries:
+                    self._drop(next(iter(self._entries)))
+        except Exception as e:
+            raise customexception(e, sys)
+
+    def stats(self):
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": (self.exact_hits + self.semantic_hits) / lookups if lookups else 0.0,
+        }
+
+
+_default_cache = None
+
+
+def get_answer_cache():
+    """
+    Returns the process-wide AnswerCache at ./storage/answer_cache.sqlite3.
+    """
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = AnswerCache()
+    return _default_cache
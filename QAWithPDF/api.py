@@ -0,0 +1,420 @@
+"""
+HTTP API service: one process holds the warm indexes and model clients and
+serves any number of frontends (the Streamlit app with SMARTDOC_API_URL set,
+scripts, other services).
+
+    smartdoc-api --port 8080                   # Gemini
+    smartdoc-api --port 8080 --backend fake    # offline, for CI and load tests
+
+Endpoints (JSON unless noted):
+    POST   /documents?name=report.pdf      upload a file (raw body, or multipart field "file"),
+                                           parse and index it; returns its doc_id
+    GET    /documents                      uploaded documents
+    DELETE /documents/{doc_id}             drop a document and cancel its jobs
+    POST   /query                          {"question", "doc_ids", "persona"} -> answer and sources
+    POST   /query/stream                   same body; text/event-stream of "token" events, then
+                                           one "done" event with sources and token usage
+    GET    /insights/{kind}?doc_ids=a,b    summary, mindmap or quiz job (404 until scheduled);
+                                           &wait=30 waits for it
+    POST   /insights/{kind}                {"doc_ids", "replace"} schedules it, again when replace is set
+    GET    /health                         documents, scheduler and job counts
+    GET    /metrics                        Prometheus text format
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import web
+
+from QAWithPDF.answer_cache import get_answer_cache, sources_from_response
+from QAWithPDF.context import context_budget, persona_prompt
+from QAWithPDF.document_store import get_document_store
+from QAWithPDF.exception import customexception
+from QAWithPDF.index_cache import content_hash
+from QAWithPDF.insights import INSIGHTS, compute_insight, scope_key
+from QAWithPDF.jobs import get_job_runner
+from QAWithPDF.scheduler import ScheduledLLM, track_usage
+from QAWithPDF.tracing import metrics, traced_query
+from logger import logging
+
+DEFAULT_HOST = os.getenv("SMARTDOC_API_HOST", "127.0.0.1")
+DEFAULT_PORT = int(os.getenv("SMARTDOC_API_PORT", "8080"))
+# Threads running the blocking parse / retrieve / synthesize work of requests.
+DEFAULT_WORKERS = int(os.getenv("SMARTDOC_API_WORKERS", "32"))
+MAX_UPLOAD_BYTES = int(os.getenv("SMARTDOC_API_MAX_UPLOAD_MB", "200")) * 1024 * 1024
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def job_to_dict(scope_id, job):
+    return {
+        "scope_id": scope_id, "kind": job.kind, "status": job.status, "result": job.result,
+        "error": job.error, "submitted": job.submitted, "elapsed": job.elapsed,
+    }
+
+
+class SmartDocService:
+    """
+    The blocking core of the API, shared by all requests: one CorpusIndex, one
+    LLM behind the process-wide scheduler, the document store and the job runner.
+
+    Parameters:
+    - llm: llama-index LLM; wrapped in ScheduledLLM unless it already is one
+    - embed_model: embedding model; GeminiEmbedding when None
+    - answer_cache: serve repeated questions from the shared AnswerCache
+    """
+
+    def __init__(self, llm, embed_model=None, corpus=None, runner=None, answer_cache=True):
+        from QAWithPDF.corpus import CorpusIndex
+        from QAWithPDF.embedding import get_embed_model
+
+        self.llm = llm if isinstance(llm, ScheduledLLM) else ScheduledLLM(llm)
+        self.embed_model = embed_model or get_embed_model()
+        self.corpus = corpus or CorpusIndex(embed_model=self.embed_model)
+        self.runner = runner or get_job_runner()
+        self.answer_cache = get_answer_cache() if answer_cache else None
+        self.started = time.time()
+        self._documents = {}
+        self._lock = threading.Lock()
+
+    def ingest(self, name, data, insights=True):
+        """
+        Parses and indexes one file. Uploading the same contents again is a no-op.
+
+        Returns:
+        - dict: doc_id (content hash), name, pages, emails and dates
+        """
+        from QAWithPDF.embedding import load_document_nodes
+
+        doc_id = content_hash(data)
+        upload = io.BytesIO(data)
+        upload.name = name
+        parsed = get_document_store().get_or_parse(upload, doc_id)
+        with self._lock:
+            self._documents[doc_id] = name
+        self.corpus.ensure_document(doc_id, lambda: load_document_nodes(self.llm, parsed.pages, doc_id,
+                                                                        embed_model=self.embed_model), name=name)
+        if insights:
+            for kind in INSIGHTS:
+                self.insight(kind, [doc_id])
+        return {"doc_id": doc_id, "name": name, "pages": len(parsed.pages),
+                "emails": parsed.emails, "dates": parsed.dates}
+
+    def documents(self):
+        with self._lock:
+            return [{"doc_id": doc_id, "name": name} for doc_id, name in self._documents.items()]
+
+    def remove(self, doc_id):
+        with self._lock:
+            if self._documents.pop(doc_id, None) is None:
+                return False
+        # Cancel first, so no job of a scope containing the document indexes it again.
+        self.runner.cancel(doc_id)
+        self.corpus.remove_document(doc_id)
+        return True
+
+    def _scope(self, doc_ids):
+        """
+        Returns [(doc_id, name, pages)] for doc_ids (all documents when empty),
+        re-indexing any the corpus has evicted since upload.
+        """
+        from QAWithPDF.embedding import load_document_nodes
+
+        with self._lock:
+            doc_ids = list(doc_ids or self._documents)
+            unknown = [doc_id for doc_id in doc_ids if doc_id not in self._documents]
+            names = {doc_id: self._documents.get(doc_id) for doc_id in doc_ids}
+        if unknown or not doc_ids:
+            raise ApiError(404, f"Unknown documents: {', '.join(unknown)}" if unknown else "No documents uploaded")
+        scope = []
+        for doc_id in doc_ids:
+            parsed = get_document_store().get(doc_id)
+            if parsed is None:
+                raise ApiError(410, f"{names[doc_id]} was evicted from the document store; upload it again")
+            self.corpus.ensure_document(doc_id, lambda: load_document_nodes(self.llm, parsed.pages, doc_id,
+                                                                            embed_model=self.embed_model),
+                                        name=names[doc_id])
+            scope.append((doc_id, names[doc_id], parsed.pages))
+        return scope
+
+    def _prepare(self, question, doc_ids, persona):
+        if not question or not question.strip():
+            raise ApiError(400, "question is required")
+        scope = self._scope(doc_ids)
+        doc_key = scope_key([doc_id for doc_id, _, _ in scope])
+        prompt = persona_prompt(question, persona)
+        cached = None
+        if self.answer_cache is not None:
+            cached = self.answer_cache.get(doc_key, prompt, persona, self.llm.model, embed_fn=self._embed_fn(prompt))
+        return scope, doc_key, prompt, cached
+
+    def _embed_query(self, text):
+        return self.embed_model.get_query_embedding(text)
+
+    def _embed_fn(self, prompt):
+        # Exact lookups skip the query embedding, so the semantic cache tier does too.
+        return None if self.corpus.skips_query_embedding(prompt) else self._embed_query
+
+    def _query_engine(self, scope, persona, streaming):
+        return self.corpus.as_query_engine(doc_ids=[doc_id for doc_id, _, _ in scope], llm=self.llm,
+                                           streaming=streaming, context_budget=context_budget(persona))
+
+    def query(self, question, doc_ids=None, persona="Standard"):
+        """
+        Returns:
+        - dict: answer, sources, usage, cached and scope_id
+        """
+        scope, doc_key, prompt, cached = self._prepare(question, doc_ids, persona)
+        if cached:
+            return {"answer": cached["answer"], "sources": cached["sources"], "usage": None, "cached": True,
+                    "scope_id": doc_key}
+        with track_usage() as usage:
+            response = traced_query(self._query_engine(scope, persona, streaming=False), prompt)
+        answer, sources = str(response), sources_from_response(response)
+        if self.answer_cache is not None:
+            self.answer_cache.put(doc_key, prompt, persona, self.llm.model, answer, sources, embed_fn=self._embed_fn(prompt))
+        return {"answer": answer, "sources": sources, "usage": usage.to_dict(), "cached": False, "scope_id": doc_key}
+
+    def stream_query(self, question, doc_ids=None, persona="Standard"):
+        """
+        Checks the request and looks up the answer cache right away, then returns
+        an iterator of ("token", text) events as the answer is generated, ending
+        with one ("done", dict) event with the fields of query() except the answer.
+        Consume the iterator on a single thread.
+        """
+        scope, doc_key, prompt, cached = self._prepare(question, doc_ids, persona)
+        return self._stream_events(scope, doc_key, prompt, cached, persona)
+
+    def _stream_events(self, scope, doc_key, prompt, cached, persona):
+        if cached:
+            yield "token", cached["answer"]
+            yield "done", {"sources": cached["sources"], "usage": None, "cached": True, "scope_id": doc_key}
+            return
+        tokens = []
+        with track_usage() as usage:
+            response = traced_query(self._query_engine(scope, persona, streaming=True), prompt)
+            for token in response.response_gen:
+                tokens.append(token)
+                yield "token", token
+        sources = sources_from_response(response)
+        if self.answer_cache is not None:
+            self.answer_cache.put(doc_key, prompt, persona, self.llm.model, "".join(tokens), sources,
+                                  embed_fn=self._embed_fn(prompt))
+        yield "done", {"sources": sources, "usage": usage.to_dict(), "cached": False, "scope_id": doc_key}
+
+    def insight(self, kind, doc_ids=None, replace=False, schedule=True):
+        """
+        Returns:
+        - (scope_id, Job or None): the summary / mindmap / quiz job of the documents,
+          scheduled first when schedule is set
+        """
+        if kind not in INSIGHTS:
+            raise ApiError(404, f"Unknown insight: {kind} (expected one of {', '.join(INSIGHTS)})")
+        scope = self._scope(doc_ids)
+        scope_id = scope_key([doc_id for doc_id, _, _ in scope])
+        if not schedule:
+            return scope_id, self.runner.get(scope_id, kind)
+        return scope_id, self.runner.submit(scope_id, kind, compute_insight, kind, self.corpus, scope, self.llm,
+                                            replace=replace, members=[doc_id for doc_id, _, _ in scope])
+
+    def health(self):
+        return {
+            "status": "ok", "uptime_s": time.time() - self.started, "documents": len(self.documents()),
+            "corpus_documents": len(self.corpus.document_ids()), "scheduler": self.llm.scheduler.stats(),
+            "jobs": self.runner.stats(),
+        }
+
+
+def _doc_ids(value):
+    if isinstance(value, str):
+        value = value.split(",")
+    return [doc_id.strip() for doc_id in value or [] if doc_id.strip()]
+
+
+async def _json_body(request):
+    try:
+        return await request.json() if request.can_read_body else {}
+    except ValueError:
+        raise ApiError(400, "body must be JSON")
+
+
+@web.middleware
+async def _errors_and_metrics(request, handler):
+    # Latency per route lands in the same stage histograms as the pipeline spans.
+    route = request.match_info.route.resource.canonical if request.match_info.route.resource else "unmatched"
+    stage = "api " + request.method + " " + route
+    start = time.perf_counter()
+    error = False
+    try:
+        return await handler(request)
+    except ApiError as e:
+        return web.json_response({"error": str(e)}, status=e.status)
+    except web.HTTPException:
+        raise
+    except Exception as e:
+        error = True
+        logging.error(f"API {stage} failed: {e}")
+        return web.json_response({"error": str(e)}, status=500)
+    finally:
+        metrics.observe(stage, time.perf_counter() - start, error=error)
+
+
+def create_app(service, workers=DEFAULT_WORKERS):
+    """
+    Returns the aiohttp Application serving a SmartDocService. Blocking work runs
+    on a pool of workers threads; LLM calls are further limited by the scheduler.
+    """
+    executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="api")
+
+    async def blocking(fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+
+    async def upload(request):
+        name = request.query.get("name")
+        if request.content_type.startswith("multipart/"):
+            async for part in await request.multipart():
+                if part.name == "file":
+                    name = name or part.filename
+                    data = await part.read(decode=False)
+                    break
+            else:
+                raise ApiError(400, 'multipart upload needs a "file" field')
+        else:
+            data = await request.read()
+        if not name or not data:
+            raise ApiError(400, "upload needs a file name (?name=) and contents")
+        if name.rsplit(".", 1)[-1].lower() not in ("pdf", "docx", "txt"):
+            raise ApiError(415, f"Unsupported file type: {name}")
+        insights = request.query.get("insights", "1") != "0"
+        return web.json_response(await blocking(service.ingest, name, bytes(data), insights), status=201)
+
+    async def list_documents(request):
+        return web.json_response({"documents": service.documents()})
+
+    async def delete_document(request):
+        if not await blocking(service.remove, request.match_info["doc_id"]):
+            raise ApiError(404, "Unknown document")
+        return web.json_response({"deleted": request.match_info["doc_id"]})
+
+    async def query(request):
+        body = await _json_body(request)
+        return web.json_response(await blocking(service.query, body.get("question"), _doc_ids(body.get("doc_ids")),
+                                                body.get("persona", "Standard")))
+
+    async def stream_query(request):
+        body = await _json_body(request)
+        # Validation errors surface here, before the 200 response is sent.
+        events = await blocking(service.stream_query, body.get("question"), _doc_ids(body.get("doc_ids")),
+                                body.get("persona", "Standard"))
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        stop = threading.Event()
+
+        def produce():
+            try:
+                for event in events:
+                    if stop.is_set():
+                        break
+                    loop.call_soon_threadsafe(queue.put_nowait, event)
+            except Exception as e:
+                logging.error(f"API stream failed: {e}")
+                loop.call_soon_threadsafe(queue.put_nowait, ("error", {"error": str(e)}))
+            finally:
+                # Closed on this thread, which iterates it; an abandoned LLM stream is
+                # then released by the scheduler.
+                events.close()
+                loop.call_soon_threadsafe(queue.put_nowait, None)
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+        try:
+            await response.prepare(request)
+            loop.run_in_executor(executor, produce)
+            event = await queue.get()
+            while event is not None:
+                kind, data = event
+                await response.write(f"event: {kind}\ndata: {json.dumps(data)}\n\n".encode("utf-8"))
+                event = await queue.get()
+            await response.write_eof()
+        finally:
+            # The client may have disconnected: stop pulling tokens nobody will read.
+            stop.set()
+        return response
+
+    async def get_insight(request):
+        kind, doc_ids = request.match_info["kind"], _doc_ids(request.query.get("doc_ids"))
+        scope_id, job = await blocking(lambda: service.insight(kind, doc_ids, schedule=False))
+        if job is None:
+            raise ApiError(404, f"No {kind} job for these documents")
+        wait = float(request.query.get("wait", "0"))
+        if wait > 0 and job.pending:
+            try:
+                await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(job.future)), timeout=wait)
+            except (asyncio.TimeoutError, asyncio.CancelledError):
+                pass
+        return web.json_response(job_to_dict(scope_id, job))
+
+    async def post_insight(request):
+        body = await _json_body(request)
+        scope_id, job = await blocking(lambda: service.insight(request.match_info["kind"], _doc_ids(body.get("doc_ids")),
+                                                               replace=body.get("replace", False)))
+        return web.json_response(job_to_dict(scope_id, job), status=202)
+
+    async def health(request):
+        return web.json_response(await blocking(service.health))
+
+    async def metrics_text(request):
+        return web.Response(text=metrics.render(), content_type="text/plain", charset="utf-8")
+
+    async def close_executor(app):
+        executor.shutdown(wait=False)
+
+    app = web.Application(middlewares=[_errors_and_metrics], client_max_size=MAX_UPLOAD_BYTES)
+    app.add_routes([
+        web.post("/documents", upload),
+        web.get("/documents", list_documents),
+        web.delete("/documents/{doc_id}", delete_document),
+        web.post("/query", query),
+        web.post("/query/stream", stream_query),
+        web.get("/insights/{kind}", get_insight),
+        web.post("/insights/{kind}", post_insight),
+        web.get("/health", health),
+        web.get("/metrics", metrics_text),
+    ])
+    app["service"] = service
+    app.on_cleanup.append(close_executor)
+    return app
+
+
+def main(argv=None):
+    from QAWithPDF.batch import load_backend
+
+    parser = argparse.ArgumentParser(prog="smartdoc-api", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--backend", default="gemini", help="gemini, fake, or package.module:factory")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="threads for blocking request work")
+    parser.add_argument("--no-answer-cache", action="store_true", help="always ask the LLM")
+    args = parser.parse_args(argv)
+
+    try:
+        llm, embed_model = load_backend(args.backend)
+        service = SmartDocService(llm, embed_model, answer_cache=not args.no_answer_cache)
+    except Exception as e:
+        raise customexception(e, sys)
+    logging.info(f"SmartDoc API on {args.host}:{args.port} ({args.backend} backend, {args.workers} workers)")
+    web.run_app(create_app(service, args.workers), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
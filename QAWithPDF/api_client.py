@@ -0,0 +1,173 @@
+import json
+import os
+import sys
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from QAWithPDF.exception import customexception
+from QAWithPDF.jobs import QUEUED, RUNNING
+
+DEFAULT_API_URL = os.getenv("SMARTDOC_API_URL", "")
+DEFAULT_TIMEOUT = float(os.getenv("SMARTDOC_API_TIMEOUT", "300"))
+
+
+class RemoteJob:
+    """
+    A job of the API service, with the attributes of jobs.Job the app reads.
+    """
+
+    def __init__(self, data):
+        self.scope_id = data["scope_id"]
+        self.kind = data["kind"]
+        self.status = data["status"]
+        self.result = data["result"]
+        self.error = data["error"]
+        self.submitted = data["submitted"]
+        self._elapsed = data["elapsed"]
+        self._fetched = time.time()
+        # JSON has no tuples; mind-map edges are (concept, concept) pairs.
+        if self.kind == "mindmap" and self.result:
+            self.result = [tuple(edge) for edge in self.result]
+
+    @property
+    def pending(self):
+        return self.status in (QUEUED, RUNNING)
+
+    @property
+    def elapsed(self):
+        return self._elapsed + (time.time() - self._fetched if self.pending else 0.0)
+
+
+class StreamedAnswer:
+    """
+    A streamed /query/stream answer. Iterate response_gen for the tokens;
+    sources, usage and cached are set once it is exhausted.
+    """
+
+    def __init__(self, lines):
+        self.sources = []
+        self.usage = None
+        self.cached = False
+        self.response_gen = self._tokens(lines)
+
+    def _tokens(self, lines):
+        event = None
+        for raw in lines:
+            line = raw.decode("utf-8").rstrip("\n")
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                data = json.loads(line[len("data: "):])
+                if event == "token":
+                    yield data
+                elif event == "done":
+                    self.sources, self.usage, self.cached = data["sources"], data["usage"], data["cached"]
+                elif event == "error":
+                    raise RuntimeError(data["error"])
+
+
+class SmartDocClient:
+    """
+    Blocking client of the smartdoc-api service (see QAWithPDF/api.py), for
+    frontends such as the Streamlit app that hold no indexes or model clients.
+    """
+
+    def __init__(self, base_url=DEFAULT_API_URL, timeout=DEFAULT_TIMEOUT):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+    def _open(self, method, path, body=None, params=None, content_type="application/json", missing=False):
+        # missing: return None on 404 instead of raising
+        url = self.base_url + path
+        if params:
+            url += "?" + urllib.parse.urlencode({k: v for k, v in params.items() if v is not None})
+        data = json.dumps(body).encode("utf-8") if content_type == "application/json" and body is not None else body
+        request = urllib.request.Request(url, data=data, method=method, headers={"Content-Type": content_type})
+        try:
+            return urllib.request.urlopen(request, timeout=self.timeout)
+        except urllib.error.HTTPError as e:
+            if missing and e.code == 404:
+                return None
+            try:
+                message = json.loads(e.read()).get("error", e.reason)
+            except ValueError:
+                message = e.reason
+            raise customexception(f"{method} {path}: HTTP {e.code}: {message}", sys)
+        except urllib.error.URLError as e:
+            raise customexception(f"{method} {path}: API service unreachable at {self.base_url}: {e.reason}", sys)
+
+    def _json(self, method, path, body=None, params=None, content_type="application/json", missing=False):
+        response = self._open(method, path, body, params, content_type, missing)
+        if response is None:
+            return None
+        with response:
+            return json.loads(response.read())
+
+    def ingest(self, name, data, insights=True):
+        """
+        Uploads a file. Returns {"doc_id", "name", "pages", "emails", "dates"}.
+        """
+        return self._json("POST", "/documents", data, {"name": name, "insights": "1" if insights else "0"},
+                          content_type="application/octet-stream")
+
+    def documents(self):
+        return self._json("GET", "/documents")["documents"]
+
+    def remove(self, doc_id):
+        return self._json("DELETE", f"/documents/{urllib.parse.quote(doc_id)}")
+
+    def query(self, question, doc_ids=None, persona="Standard"):
+        """
+        Returns:
+        - dict: answer, sources, usage, cached and scope_id
+        """
+        return self._json("POST", "/query", {"question": question, "doc_ids": doc_ids, "persona": persona})
+
+    def stream_query(self, question, doc_ids=None, persona="Standard"):
+        """
+        Returns:
+        - StreamedAnswer
+        """
+        response = self._open("POST", "/query/stream", {"question": question, "doc_ids": doc_ids, "persona": persona})
+
+        def lines():
+            with response:
+                yield from response
+
+        return StreamedAnswer(lines())
+
+    def insight(self, kind, doc_ids, replace=False, wait=0):
+        """
+        Returns the summary / mindmap / quiz RemoteJob of the documents, or None when
+        it has not been scheduled. replace schedules it (again). wait seconds are
+        spent waiting for the result.
+        """
+        if replace:
+            self.schedule_insight(kind, doc_ids, replace=True)
+        data = self._json("GET", f"/insights/{kind}", params={"doc_ids": ",".join(doc_ids), "wait": wait}, missing=True)
+        return RemoteJob(data) if data is not None else None
+
+    def schedule_insight(self, kind, doc_ids, replace=False):
+        """
+        Schedules the job unless it exists (replace: always). Returns its RemoteJob.
+        """
+        return RemoteJob(self._json("POST", f"/insights/{kind}", {"doc_ids": doc_ids, "replace": replace}))
+
+    def health(self):
+        return self._json("GET", "/health")
+
+
+_default_client = None
+
+
+def get_api_client():
+    """
+    Returns a SmartDocClient for SMARTDOC_API_URL, or None when the app should run
+    the pipeline in process.
+    """
+    global _default_client
+    if _default_client is None and DEFAULT_API_URL:
+        _default_client = SmartDocClient(DEFAULT_API_URL)
+    return _default_client
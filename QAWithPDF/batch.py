@@ -0,0 +1,259 @@
+"""
+Headless batch mode: index every document under a directory and answer a fixed
+question set over each of them, writing one JSON line per result.
+
+    smartdoc-batch Data/ --questions questions.txt --out results.jsonl
+    smartdoc-batch Data/ --out index.jsonl                  # pre-index only
+    smartdoc-batch Data/ --questions q.txt --backend fake   # offline, for CI
+
+The output file doubles as the checkpoint: rerunning the same command skips every
+(file, question) pair already answered for the file's current contents, so a
+crashed run resumes where it stopped.
+"""
+import argparse
+import importlib
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from QAWithPDF.answer_cache import sources_from_response
+from QAWithPDF.context import context_budget
+from QAWithPDF.data_ingestion import SUPPORTED_TYPES, load_data
+from QAWithPDF.embedding import download_gemini_embedding
+from QAWithPDF.exception import customexception
+from QAWithPDF.index_cache import content_hash
+from QAWithPDF.scheduler import track_usage
+from QAWithPDF.tracing import traced_query, write_metrics
+from logger import logging
+
+DEFAULT_CONCURRENCY = int(os.getenv("SMARTDOC_BATCH_CONCURRENCY", "4"))
+
+
+def load_backend(name):
+    """
+    Returns (llm, embed_model) for a backend name: "gemini" for the real models,
+    "fake" for offline deterministic stand-ins, or "package.module:factory" for a
+    callable returning such a pair. embed_model None means GeminiEmbedding.
+
+    Every llm is wrapped in ScheduledLLM like load_model's Gemini, so its calls are
+    queued, coalesced and counted into the records' usage.
+    """
+    from QAWithPDF.scheduler import ScheduledLLM
+
+    if name == "gemini":
+        from QAWithPDF.model_api import load_model
+        return load_model(), None
+    if name == "fake":
+        from QAWithPDF.fakes import FakeEmbedding, FakeGemini
+        return ScheduledLLM(FakeGemini()), FakeEmbedding()
+    module_name, _, attr = name.partition(":")
+    if not attr:
+        raise ValueError(f"Unknown backend: {name} (expected gemini, fake or module:factory)")
+    llm, embed_model = getattr(importlib.import_module(module_name), attr)()
+    return (llm if isinstance(llm, ScheduledLLM) else ScheduledLLM(llm)), embed_model
+
+
+def discover_files(input_dir):
+    """
+    Supported documents under input_dir, recursively, in a stable order.
+    """
+    paths = []
+    for root, dirs, names in os.walk(input_dir):
+        dirs.sort()
+        for name in sorted(names):
+            if name.rsplit(".", 1)[-1].lower() in SUPPORTED_TYPES:
+                paths.append(os.path.join(root, name))
+    return paths
+
+
+def read_questions(path):
+    """
+    One question per line; blank lines and lines starting with # are ignored.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+
+
+def read_checkpoint(out_path):
+    """
+    Returns the (file, digest, question) triples already written to out_path
+    without an error. question is None for a file's index record. A truncated last
+    line from a crash is ignored.
+    """
+    done = set()
+    if not os.path.exists(out_path):
+        return done
+    with open(out_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if "error" not in record:
+                done.add((record["file"], record["digest"], record.get("question")))
+    return done
+
+
+def _load_file(path):
+    """
+    Process-pool worker: parses one file with load_data, keeping its pages /
+    sections apart for the structure-aware chunker.
+    """
+    start = time.perf_counter()
+    with open(path, "rb") as f:
+        document_data = load_data(f, pages=True)
+    return [d for d in document_data if getattr(d, "text", None)], time.perf_counter() - start
+
+
+class _ResultWriter:
+    def __init__(self, out_path):
+        os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+        self._file = open(out_path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+        self.counts = {"answered": 0, "indexed": 0, "errors": 0}
+
+    def write(self, record):
+        with self._lock:
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._file.flush()
+            if "error" in record:
+                self.counts["errors"] += 1
+            elif record.get("question") is None:
+                self.counts["indexed"] += 1
+            else:
+                self.counts["answered"] += 1
+
+    def close(self):
+        self._file.close()
+
+
+def _answer(query_engine, question, base_record, timings, writer):
+    record = dict(base_record, question=question)
+    try:
+        start = time.perf_counter()
+        with track_usage() as usage:
+            response = traced_query(query_engine, question)
+        record.update(
+            answer=str(response),
+            sources=sources_from_response(response),
+            usage=usage.to_dict(),
+            timings=dict(timings, query_s=time.perf_counter() - start),
+        )
+    except Exception as e:
+        logging.error(f"Batch: {base_record['file']}: {question!r} failed: {e}")
+        record["error"] = str(e)
+    writer.write(record)
+
+
+def run_batch(input_dir, questions, out_path, backend="gemini", workers=None,
+              concurrency=DEFAULT_CONCURRENCY, resume=True):
+    """
+    Indexes every supported file under input_dir and answers questions over each.
+
+    Files are parsed with a process pool (workers processes, default CPU count)
+    while the main thread builds indexes through download_gemini_embedding, so
+    they land in the on-disk index cache. At most concurrency questions are in
+    flight at once across all files. Each question gets the Standard context
+    budget, and its record carries the LLM token usage.
+
+    Parameters:
+    - questions: list of questions; empty to only pre-index
+    - out_path: JSONL file of results, also read as the checkpoint when resume is set
+    - backend: see load_backend
+
+    Returns:
+    - dict: counts of files, skipped files, answers, index records and errors
+    """
+    try:
+        files = discover_files(input_dir)
+        if not resume and os.path.exists(out_path):
+            os.remove(out_path)
+        done = read_checkpoint(out_path)
+
+        todo = []
+        for path in files:
+            with open(path, "rb") as f:
+                digest = content_hash(f.read())
+            relpath = os.path.relpath(path, input_dir)
+            if questions:
+                pending = [q for q in questions if (relpath, digest, q) not in done]
+            else:
+                pending = [] if (relpath, digest, None) in done else [None]
+            if pending:
+                todo.append((path, relpath, digest, [q for q in pending if q is not None]))
+        logging.info(f"Batch: {len(files)} files under {input_dir}, {len(files) - len(todo)} already done")
+
+        llm, embed_model = load_backend(backend)
+        writer = _ResultWriter(out_path)
+        window = max(1, workers or os.cpu_count() or 1) * 2
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as parse_pool, \
+                    ThreadPoolExecutor(max_workers=max(1, concurrency)) as query_pool:
+                pending_loads = deque()
+                remaining = iter(todo)
+
+                def submit_next():
+                    item = next(remaining, None)
+                    if item is not None:
+                        pending_loads.append((item, parse_pool.submit(_load_file, item[0])))
+
+                # Keep only a bounded number of parsed files waiting for indexing.
+                for _ in range(window):
+                    submit_next()
+                in_flight = threading.BoundedSemaphore(max(1, concurrency) * 2)
+                while pending_loads:
+                    (path, relpath, digest, file_questions), future = pending_loads.popleft()
+                    submit_next()
+                    base_record = {"file": relpath, "digest": digest}
+                    try:
+                        document_data, load_s = future.result()
+                        start = time.perf_counter()
+                        query_engine = download_gemini_embedding(llm, document_data, content_digest=digest,
+                                                                 embed_model=embed_model,
+                                                                 context_budget=context_budget())
+                        timings = {"load_s": load_s, "index_s": time.perf_counter() - start}
+                    except Exception as e:
+                        logging.error(f"Batch: indexing {relpath} failed: {e}")
+                        writer.write(dict(base_record, question=None, error=str(e)))
+                        continue
+                    writer.write(dict(base_record, question=None, pages=len(document_data), timings=timings))
+                    for question in file_questions:
+                        in_flight.acquire()
+                        query_pool.submit(_answer, query_engine, question, base_record, timings, writer) \
+                            .add_done_callback(lambda _: in_flight.release())
+        finally:
+            writer.close()
+
+        write_metrics()
+        summary = dict(files=len(files), skipped=len(files) - len(todo), **writer.counts)
+        logging.info(f"Batch finished: {summary}")
+        return summary
+    except Exception as e:
+        raise customexception(e, sys)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="smartdoc-batch", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input_dir", help="directory of .pdf, .docx and .txt files (searched recursively)")
+    parser.add_argument("--questions", help="text file with one question per line; omit to only build indexes")
+    parser.add_argument("--out", default="results.jsonl", help="JSONL results and checkpoint file")
+    parser.add_argument("--backend", default="gemini", help="gemini, fake, or package.module:factory")
+    parser.add_argument("--workers", type=int, help="parsing processes (default: CPU count)")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="questions in flight at once")
+    parser.add_argument("--no-resume", action="store_true", help="discard existing results and start over")
+    args = parser.parse_args(argv)
+
+    questions = read_questions(args.questions) if args.questions else []
+    summary = run_batch(args.input_dir, questions, args.out, backend=args.backend, workers=args.workers,
+                        concurrency=args.concurrency, resume=not args.no_resume)
+    print(json.dumps(summary))
+    return 1 if summary["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
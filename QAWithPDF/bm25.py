@@ -0,0 +1,271 @@
+import json
+import math
+import os
+import re
+import sys
+import threading
+from collections import Counter
+
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import MetadataMode, NodeWithScore
+
+from QAWithPDF.exception import customexception
+from QAWithPDF.tracing import span
+from logger import logging
+
+BM25_FILE = "bm25.json"
+RETRIEVAL_MODE = os.getenv("SMARTDOC_RETRIEVAL", "hybrid")
+LEXICAL_FAST_PATH = os.getenv("SMARTDOC_LEXICAL_FAST_PATH", "1") != "0"
+RRF_K = 60
+# Results taken from each side before fusion.
+HYBRID_CANDIDATES = 10
+# BM25 hits scoring below this fraction of the best hit only matched common words
+# and are left out of the fusion, where their rank would otherwise count in full.
+MIN_RELATIVE_SCORE = 0.2
+# Words, numbers and identifiers such as 4.2.1, AB-1234 or name@example.com, kept whole.
+TOKEN_RE = re.compile(r"[a-z0-9](?:[a-z0-9@._/-]*[a-z0-9])?")
+# Query tokens that only make sense as exact lookups: emails, and digits joined to other
+# characters by a separator (4.2.1, inv-2024-001, 2024/03/01). Plain numbers such as the
+# "5" in "Explain like I'm 5" are ordinary words and leave the query to fusion.
+IDENTIFIER_RE = re.compile(r"[^@]+@[^@]+|(?=.*[0-9]).*[._/-].*")
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+class BM25Index:
+    """
+    In-memory inverted index with Okapi BM25 scoring over node texts.
+
+    Postings map each term to {node_id: term frequency}. Per-node term lists are
+    kept so nodes can be removed again, e.g. when CorpusIndex drops a document.
+    """
+
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings = {}
+        self._lengths = {}
+        self._terms = {}
+        self._total_length = 0
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._lengths)
+
+    def add(self, node_id, text):
+        counts = Counter(tokenize(text))
+        with self._lock:
+            if node_id in self._lengths:
+                self.remove([node_id])
+            for term, tf in counts.items():
+                self._postings.setdefault(term, {})[node_id] = tf
+            length = sum(counts.values())
+            self._lengths[node_id] = length
+            self._terms[node_id] = list(counts)
+            self._total_length += length
+
+    def add_nodes(self, nodes):
+        """
+        Indexes nodes by the same text the embedding model sees.
+        """
+        for node in nodes:
+            self.add(node.node_id, node.get_content(metadata_mode=MetadataMode.EMBED))
+        return self
+
+    def remove(self, node_ids):
+        with self._lock:
+            for node_id in node_ids:
+                if node_id not in self._lengths:
+                    continue
+                for term in self._terms.pop(node_id):
+                    postings = self._postings[term]
+                    postings.pop(node_id, None)
+                    if not postings:
+                        del self._postings[term]
+                self._total_length -= self._lengths.pop(node_id)
+
+    def has_term(self, term):
+        return term in self._postings
+
+    def query(self, text, top_k=2, allowed=None):
+        """
+        Returns:
+        - List[(node_id, score)], best first. allowed restricts results to a set of
+          node ids (used for per-document filtering).
+        """
+        with self._lock:
+            n = len(self._lengths)
+            if not n:
+                return []
+            avg_length = self._total_length / n
+            scores = {}
+            for term in set(tokenize(text)):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                for node_id, tf in postings.items():
+                    if allowed is not None and node_id not in allowed:
+                        continue
+                    norm = tf + self.k1 * (1 - self.b + self.b * self._lengths[node_id] / avg_length)
+                    scores[node_id] = scores.get(node_id, 0.0) + idf * tf * (self.k1 + 1) / norm
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:top_k]
+
+    def to_dict(self):
+        with self._lock:
+            return {"k1": self.k1, "b": self.b, "postings": self._postings, "lengths": self._lengths}
+
+    @classmethod
+    def from_dict(cls, data):
+        index = cls(k1=data["k1"], b=data["b"])
+        index._postings = data["postings"]
+        index._lengths = data["lengths"]
+        index._total_length = sum(index._lengths.values())
+        terms = {}
+        for term, postings in index._postings.items():
+            for node_id in postings:
+                terms.setdefault(node_id, []).append(term)
+        index._terms = terms
+        return index
+
+    def persist(self, persist_dir):
+        try:
+            path = os.path.join(persist_dir, BM25_FILE)
+            tmp_path = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.to_dict(), f)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            raise customexception(e, sys)
+
+    @classmethod
+    def from_persist_dir(cls, persist_dir):
+        """
+        Returns the BM25Index persisted in persist_dir, or None if there is none.
+        """
+        path = os.path.join(persist_dir, BM25_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
+
+
+def is_exact_lookup(query, bm25):
+    """
+    True when the query contains an identifier-like token (see IDENTIFIER_RE: a
+    clause number, part code or email) that occurs in the index. Such queries are
+    answered from BM25 alone.
+    """
+    return any(IDENTIFIER_RE.fullmatch(term) and bm25.has_term(term) for term in tokenize(query))
+
+
+def skips_query_embedding(query, bm25, mode=None, fast_path=None):
+    """
+    True when HybridRetriever answers the query without embedding it (lexical
+    mode, or the exact-lookup fast path), so callers such as the answer cache can
+    skip their own query embedding too.
+    """
+    mode = mode or RETRIEVAL_MODE
+    fast_path = LEXICAL_FAST_PATH if fast_path is None else fast_path
+    return mode == "lexical" or (mode == "hybrid" and fast_path and is_exact_lookup(query, bm25))
+
+
+def reciprocal_rank_fusion(rankings, top_k, k=RRF_K):
+    """
+    Fuses ranked lists of NodeWithScore by reciprocal rank: score = sum 1 / (k + rank).
+    """
+    fused, nodes = {}, {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, 1):
+            node_id = item.node.node_id
+            fused[node_id] = fused.get(node_id, 0.0) + 1.0 / (k + rank)
+            nodes.setdefault(node_id, item.node)
+    best = sorted(fused.items(), key=lambda entry: -entry[1])[:top_k]
+    return [NodeWithScore(node=nodes[node_id], score=score) for node_id, score in best]
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Combines a vector retriever with BM25.
+
+    mode "vector" uses only the vector retriever, "lexical" only BM25 (no
+    query-embedding call) and "hybrid" fuses both with reciprocal rank fusion.
+    In hybrid mode with fast_path set, queries for which is_exact_lookup() holds
+    are answered from BM25 alone when it finds a match.
+
+    Parameters:
+    - vector_retriever: e.g. index.as_retriever(filters=...)
+    - bm25: BM25Index over the same nodes
+    - docstore: where BM25 hits are fetched from
+    - allowed: optional set of node ids BM25 may return (mirrors the vector filters)
+    """
+
+    def __init__(self, vector_retriever, bm25, docstore, similarity_top_k=2, mode=None,
+                 fast_path=None, allowed=None, candidates=HYBRID_CANDIDATES):
+        super().__init__()
+        self.vector_retriever = vector_retriever
+        self.bm25 = bm25
+        self.docstore = docstore
+        self.similarity_top_k = similarity_top_k
+        self.mode = mode or RETRIEVAL_MODE
+        self.fast_path = LEXICAL_FAST_PATH if fast_path is None else fast_path
+        self.allowed = allowed
+        self.candidates = max(candidates, similarity_top_k)
+        if self.mode not in ("vector", "lexical", "hybrid"):
+            raise ValueError(f"Unknown retrieval mode: {self.mode}")
+
+    def _lexical(self, query, top_k):
+        with span("bm25") as s:
+            found = []
+            for node_id, score in self.bm25.query(query, top_k, allowed=self.allowed):
+                node = self.docstore.get_node(node_id, raise_error=False)
+                if node is not None:
+                    found.append(NodeWithScore(node=node, score=score))
+            s.set(chunks=len(found))
+        return found
+
+    def _retrieve(self, query_bundle):
+        query = query_bundle.query_str
+        mode = self.mode
+        if mode == "hybrid" and self.fast_path and is_exact_lookup(query, self.bm25):
+            hits = self._lexical(query, self.similarity_top_k)
+            # The identifier may only occur outside the allowed documents.
+            if hits:
+                logging.info("Lexical fast path: skipping query embedding")
+                return hits
+        if mode == "lexical":
+            return self._lexical(query, self.similarity_top_k)
+        vector_hits = self.vector_retriever.retrieve(query_bundle)
+        if mode == "vector":
+            return vector_hits[:self.similarity_top_k]
+        lexical_hits = self._lexical(query, self.candidates)
+        if lexical_hits:
+            cutoff = lexical_hits[0].score * MIN_RELATIVE_SCORE
+            lexical_hits = [hit for hit in lexical_hits if hit.score >= cutoff]
+        return reciprocal_rank_fusion([vector_hits, lexical_hits], self.similarity_top_k)
+
+
+def build_query_engine(index, bm25, llm=None, streaming=False, filters=None, allowed=None, similarity_top_k=2,
+                       context_budget=None):
+    """
+    Query engine over index that retrieves with HybridRetriever instead of the
+    plain vector retriever.
+
+    With context_budget set, CONTEXT_CANDIDATES chunks are retrieved and
+    context.ContextPacker reranks, dedupes and packs them into that many tokens;
+    otherwise the top similarity_top_k chunks are sent as they are.
+    """
+    from llama_index.core.query_engine import RetrieverQueryEngine
+
+    node_postprocessors = []
+    if context_budget is not None:
+        from QAWithPDF.context import CONTEXT_CANDIDATES, ContextPacker
+        similarity_top_k = max(similarity_top_k, CONTEXT_CANDIDATES)
+        node_postprocessors.append(ContextPacker(budget=context_budget))
+    vector_retriever = index.as_retriever(similarity_top_k=max(HYBRID_CANDIDATES, similarity_top_k), filters=filters)
+    retriever = HybridRetriever(vector_retriever, bm25, index.docstore, similarity_top_k=similarity_top_k,
+                                allowed=allowed)
+    return RetrieverQueryEngine.from_args(retriever, llm=llm, streaming=streaming,
+                                          node_postprocessors=node_postprocessors)
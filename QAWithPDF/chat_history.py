@@ -0,0 +1,159 @@
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+
+from QAWithPDF.exception import customexception
+from QAWithPDF.tracing import span
+
+DEFAULT_HISTORY_PATH = os.getenv("SMARTDOC_HISTORY_DB", os.path.join(os.getcwd(), "storage", "chat_history.sqlite3"))
+PAGE_SIZE = int(os.getenv("SMARTDOC_HISTORY_PAGE_SIZE", "10"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session TEXT NOT NULL,
+    doc_key TEXT NOT NULL,
+    created REAL NOT NULL,
+    question TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    lang TEXT NOT NULL,
+    answer_shown TEXT NOT NULL,
+    source TEXT NOT NULL,
+    usage TEXT
+);
+CREATE INDEX IF NOT EXISTS messages_by_doc ON messages (session, doc_key, id);
+CREATE TABLE IF NOT EXISTS documents (
+    session TEXT NOT NULL,
+    doc_key TEXT NOT NULL,
+    doc_name TEXT NOT NULL,
+    created REAL NOT NULL,
+    PRIMARY KEY (session, doc_key)
+);
+"""
+
+
+def new_session_id():
+    return uuid.uuid4().hex
+
+
+def _entry(row):
+    message_id, question, answer, lang, answer_shown, source, usage, created = row
+    return {
+        "id": message_id, "q": question, "a": answer_shown, "a_en": answer, "lang": lang, "src": source,
+        "usage": json.loads(usage) if usage else None, "created": created,
+    }
+
+
+class ChatHistoryStore:
+    """
+    Append-only chat history in a SQLite file, keyed by (session, document key).
+
+    The document key is the content hash of the document (or of the set of
+    documents) the question was asked about. Messages are never updated:
+    a re-translation is applied when they are displayed. Pages are read newest
+    first by message id, so fetching the latest page costs the same at 10 or
+    10,000 messages. Several processes can share the file (WAL mode), e.g. app
+    replicas on one volume.
+    """
+
+    def __init__(self, path=DEFAULT_HISTORY_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def append(self, session, doc_key, doc_name, entry):
+        """
+        Stores one Q/A pair.
+
+        Parameters:
+        - entry: {"q", "a_en" (English answer), "a" (answer as shown), "lang", "src", "usage"}
+
+        Returns:
+        - int: the message id
+        """
+        try:
+            now = time.time()
+            conn = self._connect()
+            with conn:
+                conn.execute("INSERT OR IGNORE INTO documents (session, doc_key, doc_name, created) VALUES (?, ?, ?, ?)",
+                             (session, doc_key, doc_name, now))
+                cursor = conn.execute(
+                    "INSERT INTO messages (session, doc_key, created, question, answer, lang, answer_shown, source, usage)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (session, doc_key, now, entry["q"], entry.get("a_en") or entry.get("a", ""),
+                     entry.get("lang", "English"), entry.get("a", ""), entry.get("src", ""),
+                     json.dumps(entry["usage"]) if entry.get("usage") else None),
+                )
+            return cursor.lastrowid
+        except Exception as e:
+            raise customexception(e, sys)
+
+    def latest(self, session, doc_key, limit=PAGE_SIZE, before=None, after=None):
+        """
+        Returns:
+        - (List[dict], bool): up to limit entries, newest first, with ids below
+          before and above after (when set), and whether more such entries exist
+        """
+        with span("history_page", limit=limit) as s:
+            query = ("SELECT id, question, answer, lang, answer_shown, source, usage, created FROM messages"
+                     " WHERE session = ? AND doc_key = ?")
+            params = [session, doc_key]
+            if before is not None:
+                query += " AND id < ?"
+                params.append(before)
+            if after is not None:
+                query += " AND id > ?"
+                params.append(after)
+            rows = self._connect().execute(query + " ORDER BY id DESC LIMIT ?", params + [limit + 1]).fetchall()
+            s.set(entries=min(len(rows), limit))
+        return [_entry(row) for row in rows[:limit]], len(rows) > limit
+
+    def entries(self, session, doc_key):
+        """
+        Returns:
+        - List[dict]: every entry of the document, oldest first, e.g. for a PDF export
+        """
+        rows = self._connect().execute(
+            "SELECT id, question, answer, lang, answer_shown, source, usage, created FROM messages"
+            " WHERE session = ? AND doc_key = ? ORDER BY id", (session, doc_key),
+        ).fetchall()
+        return [_entry(row) for row in rows]
+
+    def documents(self, session):
+        """
+        Returns:
+        - List[(doc_key, doc_name)]: the documents with history in a session, in the
+          order they were first asked about
+        """
+        return self._connect().execute(
+            "SELECT doc_key, doc_name FROM documents WHERE session = ? ORDER BY created", (session,),
+        ).fetchall()
+
+
+_default_store = None
+_default_lock = threading.Lock()
+
+
+def get_history_store():
+    """
+    Returns the process-wide ChatHistoryStore at SMARTDOC_HISTORY_DB.
+    """
+    global _default_store
+    with _default_lock:
+        if _default_store is None:
+            _default_store = ChatHistoryStore()
+        return _default_store
@@ -0,0 +1,163 @@
+import os
+import re
+
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.schema import NodeRelationship, TextNode
+
+DEFAULT_STRATEGY = os.getenv("SMARTDOC_CHUNKER", "structure")
+DEFAULT_CHUNK_TOKENS = int(os.getenv("SMARTDOC_CHUNK_TOKENS", "800"))
+# Settings of the SentenceSplitter used before structure-aware chunking.
+SENTENCE_CHUNK_SIZE = 800
+SENTENCE_CHUNK_OVERLAP = 20
+# A new page or section starts a new chunk once the current one is this full.
+SOFT_BOUNDARY = 0.5
+# Blank lines and form feeds separate blocks; within an oversized block, lines do.
+BLOCK_BOUNDARY = re.compile(r"\n[ \t]*\n+|\f")
+LINE_BOUNDARY = re.compile(r"\n+")
+TOKENS_KEY = "tokens"
+PAGE_END_KEY = "page_end"
+# Part of the index cache key; bump when the chunker's input or output changes.
+# 2: page / section Documents from data_ingestion.stream_documents instead of one
+#    Document per file, and line-level token counts.
+CHUNKER_VERSION = 2
+
+
+class ChunkingConfig:
+    """
+    How an index splits documents into nodes. Passed to each index build instead of
+    being set on llama-index's global Settings, and part of the index cache key.
+
+    Parameters:
+    - strategy: "structure" (StructureChunker) or "sentence" (the SentenceSplitter
+      with SENTENCE_CHUNK_SIZE / SENTENCE_CHUNK_OVERLAP used previously)
+    - chunk_tokens: token budget per chunk for "structure"
+    """
+
+    def __init__(self, strategy=DEFAULT_STRATEGY, chunk_tokens=DEFAULT_CHUNK_TOKENS):
+        if strategy not in ("structure", "sentence"):
+            raise ValueError(f"Unknown chunking strategy: {strategy}")
+        self.strategy = strategy
+        self.chunk_tokens = chunk_tokens
+
+    def __repr__(self):
+        return f"ChunkingConfig(strategy={self.strategy!r}, chunk_tokens={self.chunk_tokens})"
+
+    def key_params(self):
+        """
+        Returns:
+        - (chunk_size, chunk_overlap, chunker) for index_cache.index_key; chunker
+          names the strategy and CHUNKER_VERSION, so entries built from other inputs
+          (e.g. one whole-file Document) are not reused
+        """
+        chunker = f"{self.strategy}-v{CHUNKER_VERSION}"
+        if self.strategy == "sentence":
+            return SENTENCE_CHUNK_SIZE, SENTENCE_CHUNK_OVERLAP, chunker
+        return self.chunk_tokens, 0, chunker
+
+    def make_parser(self):
+        if self.strategy == "sentence":
+            return SentenceSplitter(chunk_size=SENTENCE_CHUNK_SIZE, chunk_overlap=SENTENCE_CHUNK_OVERLAP)
+        return StructureChunker(self.chunk_tokens)
+
+
+class _Piece:
+    def __init__(self, text, tokens, document, starts_section):
+        self.text = text
+        self.tokens = tokens
+        self.document = document
+        self.starts_section = starts_section
+
+
+class StructureChunker:
+    """
+    Splits documents along their structure and packs the pieces into chunks of at
+    most chunk_tokens tokens.
+
+    Each input Document is one PDF page, DOCX heading section or TXT section (see
+    data_ingestion.stream_documents); a whole-file Document from load_data works
+    too. Documents are split into blocks at blank lines and form feeds. Blocks
+    over budget are split at line breaks, then at sentences. Consecutive pieces
+    are merged while they fit, and a page or section boundary ends the chunk once
+    it is SOFT_BOUNDARY full, so chunks rarely straddle a heading or page break.
+
+    Text is split before it is counted: each line is tokenized once, and a
+    block's count is the sum of its lines plus one per line break. Only a line
+    over budget is tokenized again, as its sentence pieces. A chunk's count is the
+    sum of its pieces and is stored in metadata["tokens"] for later context
+    budgeting.
+    """
+
+    def __init__(self, chunk_tokens=DEFAULT_CHUNK_TOKENS, tokenizer=None):
+        from llama_index.core.utils import get_tokenizer
+
+        self.chunk_tokens = chunk_tokens
+        self._tokenize = tokenizer or get_tokenizer()
+        self._sentences = SentenceSplitter(chunk_size=chunk_tokens, chunk_overlap=0)
+
+    def _count(self, text):
+        return len(self._tokenize(text))
+
+    def _split(self, text):
+        """
+        Yields (text, tokens) pieces of at most chunk_tokens tokens: whole blocks
+        where they fit, otherwise their lines, otherwise sentences.
+        """
+        for block in BLOCK_BOUNDARY.split(text):
+            lines = [line for line in LINE_BOUNDARY.split(block.strip()) if line.strip()]
+            if not lines:
+                continue
+            counts = [self._count(line) for line in lines]
+            tokens = sum(counts) + len(lines) - 1
+            if tokens <= self.chunk_tokens:
+                yield "\n".join(lines), tokens
+                continue
+            for line, line_tokens in zip(lines, counts):
+                if line_tokens <= self.chunk_tokens:
+                    yield line, line_tokens
+                else:
+                    for part in self._sentences.split_text(line):
+                        yield part, self._count(part)
+
+    def _pieces(self, documents):
+        for document in documents:
+            first = True
+            for text, tokens in self._split(document.text.strip()):
+                if text:
+                    yield _Piece(text, tokens, document, first)
+                    first = False
+
+    def _node(self, pieces):
+        first, last = pieces[0].document, pieces[-1].document
+        metadata = dict(first.metadata)
+        if last.metadata.get("page_number") != first.metadata.get("page_number"):
+            metadata[PAGE_END_KEY] = last.metadata.get("page_number")
+        metadata[TOKENS_KEY] = sum(piece.tokens for piece in pieces)
+        node = TextNode(
+            text="\n\n".join(piece.text for piece in pieces),
+            metadata=metadata,
+            excluded_embed_metadata_keys=list(first.excluded_embed_metadata_keys) + ["page_number", PAGE_END_KEY, TOKENS_KEY],
+            excluded_llm_metadata_keys=list(first.excluded_llm_metadata_keys) + [TOKENS_KEY],
+        )
+        node.relationships[NodeRelationship.SOURCE] = first.as_related_node_info()
+        return node
+
+    def get_nodes_from_documents(self, documents, show_progress=False):
+        """
+        Returns:
+        - List[TextNode]: chunks in document order
+        """
+        nodes, current, current_tokens = [], [], 0
+        for piece in self._pieces(documents):
+            overflow = current_tokens + piece.tokens > self.chunk_tokens
+            boundary = piece.starts_section and current_tokens >= self.chunk_tokens * SOFT_BOUNDARY
+            if current and (overflow or boundary):
+                nodes.append(self._node(current))
+                current, current_tokens = [], 0
+            current.append(piece)
+            current_tokens += piece.tokens
+        if current:
+            nodes.append(self._node(current))
+        return nodes
+
+
+DEFAULT_CHUNKING = ChunkingConfig()
@@ -0,0 +1,147 @@
+import os
+from typing import Any, Optional
+
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import NodeWithScore
+
+from QAWithPDF.bm25 import tokenize
+from QAWithPDF.chunking import DEFAULT_CHUNKING
+from QAWithPDF.tracing import count_tokens, span
+
+# Context budget of each persona, in chunks of the configured chunk size, so every
+# persona gets at least two full chunks whatever SMARTDOC_CHUNK_TOKENS is.
+PERSONA_BUDGETS = {
+    "Standard": 3.0,
+    "ELI5 (Simple)": 2.5,
+    "Executive (Brief)": 2.0,
+    "Skeptic (Critical)": 6.0,
+    # Deep Dive report and the background summary / mind map / quiz prompts.
+    "Deep Dive": 8.0,
+    "Insight": 4.0,
+}
+# Fixes the Standard budget in tokens and scales the others to it; 0 derives the
+# budgets from the chunk size.
+STANDARD_CONTEXT_TOKENS = int(os.getenv("SMARTDOC_CONTEXT_TOKENS", "0"))
+# Instruction appended to the question for each persona.
+PERSONA_INSTRUCTIONS = {
+    "ELI5 (Simple)": " (Explain like I'm 5)",
+    "Executive (Brief)": " (Executive summary only)",
+    "Skeptic (Critical)": " (Analyze critically and give more elaborate answer)",
+}
+# Chunks retrieved before reranking and packing.
+CONTEXT_CANDIDATES = 12
+# Weight of query-term overlap against retrieval rank in the rerank score.
+LEXICAL_WEIGHT = 0.5
+# Chunks whose word 3-grams overlap a packed chunk's this much are dropped.
+DUPLICATE_SIMILARITY = 0.8
+SHINGLE_SIZE = 3
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from has have how i in is it its me of on or "
+    "that the this to was what when where which who why will with you your about only give "
+    "more answer explain like summary".split()
+)
+
+
+def context_budget(persona="Standard", chunk_tokens=None):
+    """
+    Parameters:
+    - persona: key of PERSONA_BUDGETS (Standard when unknown)
+    - chunk_tokens: chunk size the budget is measured in; the configured
+      chunking's when None
+
+    Returns:
+    - int: context tokens allowed for a persona
+    """
+    chunks = PERSONA_BUDGETS.get(persona, PERSONA_BUDGETS["Standard"])
+    if STANDARD_CONTEXT_TOKENS:
+        return int(STANDARD_CONTEXT_TOKENS * chunks / PERSONA_BUDGETS["Standard"])
+    return int((chunk_tokens or DEFAULT_CHUNKING.key_params()[0]) * chunks)
+
+
+def persona_prompt(question, persona="Standard"):
+    return question + PERSONA_INSTRUCTIONS.get(persona, "")
+
+
+def query_terms(text):
+    return {term for term in tokenize(text) if term not in STOPWORDS and len(term) > 1}
+
+
+def shingles(text, size=SHINGLE_SIZE):
+    words = tokenize(text)
+    if len(words) <= size:
+        return {tuple(words)}
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def similarity(a, b):
+    """
+    Jaccard similarity of two shingle sets.
+    """
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def chunk_tokens(node):
+    # Set by chunking.StructureChunker; chunks from older indexes are counted here.
+    return node.metadata.get("tokens") or count_tokens(node.get_content())
+
+
+class ContextPacker(BaseNodePostprocessor):
+    """
+    Node postprocessor that decides what retrieved context reaches the LLM.
+
+    1. Rerank: each candidate scores LEXICAL_WEIGHT * (share of the query's terms
+       it contains) + (1 - LEXICAL_WEIGHT) / (1 + its retrieval rank).
+    2. Dedupe: a chunk whose word 3-grams are DUPLICATE_SIMILARITY similar to an
+       already packed chunk is dropped.
+    3. Pack: chunks are taken best first while they fit in budget tokens. Smaller
+       chunks further down may still fill the remaining space. The best chunk is
+       always kept, even when it alone exceeds the budget.
+
+    The counts of each call (candidates, duplicates, packed chunks and tokens) are
+    attributes of its "context_packing" span; the packer itself keeps no state, so
+    one query engine can serve concurrent queries.
+
+    Parameters:
+    - budget: context tokens, e.g. context_budget(persona); the Standard budget
+      when None
+    """
+
+    budget: int
+
+    def __init__(self, budget=None, **kwargs):
+        super().__init__(budget=budget or context_budget(), **kwargs)
+
+    @classmethod
+    def class_name(cls):
+        return "ContextPacker"
+
+    def rerank(self, nodes, query):
+        terms = query_terms(query)
+        scored = []
+        for rank, item in enumerate(nodes):
+            overlap = len(terms & query_terms(item.node.get_content())) / len(terms) if terms else 0.0
+            score = LEXICAL_WEIGHT * overlap + (1 - LEXICAL_WEIGHT) / (1 + rank)
+            scored.append(NodeWithScore(node=item.node, score=score))
+        scored.sort(key=lambda item: -item.score)
+        return scored
+
+    def _postprocess_nodes(self, nodes, query_bundle: Optional[Any] = None):
+        with span("context_packing", candidates=len(nodes), budget=self.budget) as s:
+            ranked = self.rerank(nodes, query_bundle.query_str if query_bundle else "")
+            packed, packed_shingles = [], []
+            used = duplicates = 0
+            for item in ranked:
+                tokens = chunk_tokens(item.node)
+                if packed and used + tokens > self.budget:
+                    continue
+                item_shingles = shingles(item.node.get_content())
+                if any(similarity(item_shingles, other) >= DUPLICATE_SIMILARITY for other in packed_shingles):
+                    duplicates += 1
+                    continue
+                packed.append(item)
+                packed_shingles.append(item_shingles)
+                used += tokens
+            s.set(duplicates=duplicates, chunks=len(packed), context_tokens=used)
+        return packed
@@ -0,0 +1,158 @@
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+from llama_index.core import StorageContext, VectorStoreIndex
+from llama_index.core.vector_stores.types import FilterOperator, MetadataFilter, MetadataFilters
+
+from QAWithPDF.bm25 import BM25Index, build_query_engine, skips_query_embedding
+from QAWithPDF.exception import customexception
+from QAWithPDF.vector_store import create_vector_store
+from logger import logging
+
+# "doc_id" itself is reserved by llama-index (it overwrites it with ref_doc_id).
+DOC_ID_KEY = "doc_hash"
+DEFAULT_MAX_DOCUMENTS = int(os.getenv("SMARTDOC_CORPUS_MAX_DOCS", "200"))
+
+
+def doc_filters(doc_ids):
+    """
+    Metadata filter restricting retrieval to the given document ids.
+    """
+    doc_ids = list(doc_ids)
+    if len(doc_ids) == 1:
+        return MetadataFilters(filters=[MetadataFilter(key=DOC_ID_KEY, value=doc_ids[0])])
+    return MetadataFilters(filters=[MetadataFilter(key=DOC_ID_KEY, value=doc_ids, operator=FilterOperator.IN)])
+
+
+class CorpusIndex:
+    """
+    One VectorStoreIndex shared by every uploaded document.
+
+    Each node is tagged with its document id (the upload's content hash) in
+    metadata, so querying one document is metadata-filtered retrieval over the
+    shared index and querying several is an IN filter. A BM25Index over the same
+    nodes serves lexical and hybrid retrieval. Adding a document costs its
+    nodes only - there is no per-document index or query engine. Past
+    max_documents, the least recently used document is removed.
+
+    Queries are embedded with embed_model (GeminiEmbedding when None), which must
+    be the model the inserted nodes were embedded with.
+    """
+
+    def __init__(self, max_documents=DEFAULT_MAX_DOCUMENTS, vector_store=None, embed_model=None):
+        if embed_model is None:
+            from QAWithPDF.embedding import get_embed_model
+            embed_model = get_embed_model()
+        self.max_documents = max_documents
+        self.embed_model = embed_model
+        storage_context = StorageContext.from_defaults(vector_store=vector_store or create_vector_store())
+        self._index = VectorStoreIndex(nodes=[], storage_context=storage_context, embed_model=embed_model)
+        self._bm25 = BM25Index()
+        self._documents = OrderedDict()
+        self._lock = threading.RLock()
+        self._loading = {}
+        # Documents removed while ensure_document was loading them.
+        self._removed_while_loading = set()
+
+    @property
+    def index(self):
+        return self._index
+
+    def embed_query(self, text):
+        return self.embed_model.get_query_embedding(text)
+
+    def has_document(self, doc_id):
+        with self._lock:
+            return doc_id in self._documents
+
+    def document_ids(self):
+        with self._lock:
+            return list(self._documents)
+
+    def add_document(self, doc_id, nodes, name=None):
+        """
+        Inserts already-embedded nodes of one document (see
+        embedding.load_document_nodes), tagging each with doc_id. A document that
+        is already present is left as is.
+        """
+        try:
+            with self._lock:
+                if doc_id in self._documents:
+                    self._documents.move_to_end(doc_id)
+                    return
+                for node in nodes:
+                    node.metadata[DOC_ID_KEY] = doc_id
+                    for excluded in (node.excluded_embed_metadata_keys, node.excluded_llm_metadata_keys):
+                        if DOC_ID_KEY not in excluded:
+                            excluded.append(DOC_ID_KEY)
+                self._index.insert_nodes(nodes)
+                self._bm25.add_nodes(nodes)
+                self._documents[doc_id] = {"name": name, "node_ids": [node.node_id for node in nodes]}
+                logging.info(f"Corpus: added {name or doc_id} ({len(nodes)} nodes, {len(self._documents)} documents)")
+                while len(self._documents) > self.max_documents:
+                    self.remove_document(next(iter(self._documents)))
+        except Exception as e:
+            raise customexception(e, sys)
+
+    def ensure_document(self, doc_id, load_nodes, name=None):
+        """
+        Adds a document unless it is already present. load_nodes() is called at most
+        once per document at a time, so concurrent callers (e.g. background jobs for
+        the same upload) wait for one embedding run instead of each starting one.
+        A document removed while it is loading is not added.
+        """
+        with self._lock:
+            if doc_id in self._documents:
+                self._documents.move_to_end(doc_id)
+                return
+            loading = self._loading.setdefault(doc_id, threading.Lock())
+        with loading:
+            try:
+                if not self.has_document(doc_id):
+                    nodes = load_nodes()
+                    with self._lock:
+                        if doc_id in self._removed_while_loading:
+                            logging.info(f"Corpus: {name or doc_id} was removed while loading; not added")
+                            return
+                        self.add_document(doc_id, nodes, name=name)
+            finally:
+                with self._lock:
+                    self._loading.pop(doc_id, None)
+                    self._removed_while_loading.discard(doc_id)
+
+    def remove_document(self, doc_id):
+        with self._lock:
+            if doc_id in self._loading:
+                self._removed_while_loading.add(doc_id)
+            entry = self._documents.pop(doc_id, None)
+            if entry is None:
+                return
+            self._index.delete_nodes(entry["node_ids"], delete_from_docstore=True)
+            self._bm25.remove(entry["node_ids"])
+            logging.info(f"Corpus: removed {entry['name'] or doc_id}")
+
+    def skips_query_embedding(self, query):
+        """
+        True when retrieval answers the query from BM25 alone (see
+        bm25.skips_query_embedding).
+        """
+        return skips_query_embedding(query, self._bm25)
+
+    def as_query_engine(self, doc_ids=None, **kwargs):
+        """
+        Query engine over the given documents (all documents when doc_ids is None),
+        retrieving with bm25.HybridRetriever. Extra keyword arguments (llm,
+        streaming, similarity_top_k, context_budget) go to bm25.build_query_engine.
+        """
+        allowed = None
+        with self._lock:
+            if doc_ids is not None:
+                allowed = set()
+                for doc_id in doc_ids:
+                    if doc_id in self._documents:
+                        self._documents.move_to_end(doc_id)
+                        allowed.update(self._documents[doc_id]["node_ids"])
+        filters = doc_filters(doc_ids) if doc_ids is not None else None
+        return build_query_engine(self._index, self._bm25, filters=filters, allowed=allowed, **kwargs)
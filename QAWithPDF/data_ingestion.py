@@ -1,47 +1,224 @@
+import io
+import os
 import sys
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
 from QAWithPDF.exception import customexception
+from QAWithPDF.tracing import span
 from logger import logging
 from llama_index.core import Document
 
 import docx
 import fitz  # PyMuPDF
 
-def load_data(uploaded_file):
-    """
-    Load and parse text from uploaded .txt, .pdf, or .docx file.
+SUPPORTED_TYPES = ("txt", "pdf", "docx")
+SPOOL_THRESHOLD_BYTES = int(os.getenv("SMARTDOC_SPOOL_MB", "16")) * 1024 * 1024
+PARALLEL_PAGE_THRESHOLD = int(os.getenv("SMARTDOC_PARALLEL_PAGES", "200"))
+PAGES_PER_TASK = 50
+TXT_SECTION_CHARS = 64 * 1024
 
-    Parameters:
-    - uploaded_file: Streamlit uploaded file (BytesIO)
 
-    Returns:
-    - List[Document]: A list containing one LlamaIndex Document object
+def _file_type(uploaded_file):
+    file_type = uploaded_file.name.split('.')[-1].lower()
+    if file_type not in SUPPORTED_TYPES:
+        raise ValueError("Unsupported file type. Please upload a .txt, .pdf, or .docx file.")
+    return file_type
+
+
+def _file_size(uploaded_file):
+    size = getattr(uploaded_file, "size", None)
+    if size is None:
+        position = uploaded_file.tell()
+        size = uploaded_file.seek(0, os.SEEK_END)
+        uploaded_file.seek(position)
+    return size
+
+
+def _write_temp(chunks, suffix):
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+        for chunk in chunks:
+            tmp.write(chunk)
+        return tmp.name
+
+
+@contextmanager
+def _spooled(uploaded_file, spool_threshold):
+    """
+    Yields a filesystem path for uploads larger than spool_threshold (copied in 1 MB
+    blocks to a temp file that is removed afterwards), or None for small uploads
+    that are fine to parse from memory.
     """
+    uploaded_file.seek(0)
+    if _file_size(uploaded_file) <= spool_threshold:
+        yield None
+        return
+    suffix = "." + uploaded_file.name.split('.')[-1].lower()
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+        shutil.copyfileobj(uploaded_file, tmp, 1024 * 1024)
+        path = tmp.name
     try:
-        logging.info(f"Loading file: {uploaded_file.name}")
+        yield path
+    finally:
+        os.remove(path)
+
 
-        file_type = uploaded_file.name.split('.')[-1].lower()
+def _extract_pdf_pages(path, start, stop):
+    """
+    Process-pool worker: returns the text of pages [start, stop) of the PDF at path.
+    """
+    with fitz.open(path) as pdf_doc:
+        return [pdf_doc[i].get_text() for i in range(start, stop)]
 
-        if file_type == "txt":
-            content = uploaded_file.read().decode("utf-8")
 
-        elif file_type == "pdf":
-            pdf_doc = fitz.open(stream=uploaded_file.read(), filetype="pdf")
-            content = ""
+def _iter_pdf_pages(uploaded_file, path, parallel_page_threshold, max_workers):
+    data = None if path else uploaded_file.read()
+    pdf_doc = fitz.open(path) if path else fitz.open(stream=data, filetype="pdf")
+    page_count = pdf_doc.page_count
+    if page_count < parallel_page_threshold:
+        try:
             for page in pdf_doc:
-                content += page.get_text()
+                yield page.get_text()
+        finally:
             pdf_doc.close()
+        return
+
+    temp_path = None
+    if path is None:
+        # Workers open the file by path; write the in-memory upload out once.
+        temp_path = path = _write_temp([data], ".pdf")
+    pdf_doc.close()
+    starts = list(range(0, page_count, PAGES_PER_TASK))
+    stops = [min(start + PAGES_PER_TASK, page_count) for start in starts]
+    logging.info(f"Extracting {page_count} pages with a process pool ({len(starts)} tasks)")
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            # map() yields in page order as soon as each leading range is done.
+            for texts in pool.map(_extract_pdf_pages, [path] * len(starts), starts, stops):
+                yield from texts
+    finally:
+        if temp_path:
+            os.remove(temp_path)
 
-        elif file_type == "docx":
-            doc = docx.Document(uploaded_file)
-            content = "\n".join([para.text for para in doc.paragraphs])
 
+def _iter_docx_sections(uploaded_file, path):
+    """
+    Yields (heading, text) per section; a section starts at every Heading paragraph.
+    """
+    doc = docx.Document(path or uploaded_file)
+    heading, paragraphs = None, []
+    for para in doc.paragraphs:
+        if para.style is not None and para.style.name.startswith("Heading"):
+            if paragraphs:
+                yield heading, "\n".join(paragraphs)
+                paragraphs = []
+            heading = para.text
+        paragraphs.append(para.text)
+    if paragraphs:
+        yield heading, "\n".join(paragraphs)
+
+
+def _iter_txt_sections(uploaded_file, path):
+    """
+    Yields sections of roughly TXT_SECTION_CHARS, cut at blank lines or page breaks,
+    without decoding the whole file up front.
+    """
+    raw = open(path, "rb") if path else uploaded_file
+    reader = io.TextIOWrapper(raw, encoding="utf-8", newline="")
+    try:
+        lines, size = [], 0
+        for line in reader:
+            lines.append(line)
+            size += len(line)
+            boundary = not line.strip() or "\f" in line
+            if size >= TXT_SECTION_CHARS and boundary:
+                yield "".join(lines)
+                lines, size = [], 0
+        if lines:
+            yield "".join(lines)
+    finally:
+        # Closing the wrapper would also close the caller's upload object.
+        if path:
+            reader.close()
         else:
-            raise ValueError("Unsupported file type. Please upload a .txt, .pdf, or .docx file.")
+            reader.detach()
+
+
+def stream_documents(uploaded_file, spool_threshold=SPOOL_THRESHOLD_BYTES,
+                     parallel_page_threshold=PARALLEL_PAGE_THRESHOLD, max_workers=None):
+    """
+    Streaming counterpart of load_data: yields one Document per PDF page, DOCX
+    heading section or TXT section as soon as it is extracted.
+
+    Parameters:
+    - uploaded_file: Streamlit uploaded file or any binary file object with a .name
+    - spool_threshold: uploads larger than this many bytes are copied to a temp file
+      and opened by path instead of being held in memory
+    - parallel_page_threshold: PDFs with at least this many pages are extracted with
+      a process pool
+    - max_workers: process pool size (defaults to the CPU count)
+
+    Yields:
+    - Document with metadata filename, page_number (1-based page or section number)
+      and, for DOCX, heading
+    """
+    try:
+        file_type = _file_type(uploaded_file)
+        logging.info(f"Streaming file: {uploaded_file.name}")
+        with _spooled(uploaded_file, spool_threshold) as path:
+            if file_type == "pdf":
+                sections = ((None, text) for text in _iter_pdf_pages(uploaded_file, path, parallel_page_threshold, max_workers))
+            elif file_type == "docx":
+                sections = _iter_docx_sections(uploaded_file, path)
+            else:
+                sections = ((None, text) for text in _iter_txt_sections(uploaded_file, path))
+
+            for number, (heading, text) in enumerate(sections, 1):
+                metadata = {"filename": uploaded_file.name, "page_number": number}
+                if heading:
+                    metadata["heading"] = heading
+                yield Document(text=text, metadata=metadata)
+        logging.info(f"File streamed successfully: {uploaded_file.name}")
+
+    except Exception as e:
+        logging.error("Error during document streaming.")
+        raise customexception(e, sys)
+
+
+def load_data(uploaded_file, pages=False):
+    """
+    Load and parse text from uploaded .txt, .pdf, or .docx file.
+
+    Parameters:
+    - uploaded_file: Streamlit uploaded file (BytesIO)
+    - pages: return the page / section Documents of stream_documents, which the
+      structure-aware chunker keeps apart, instead of one joined Document
+
+    Returns:
+    - List[Document]: A list containing one LlamaIndex Document object, or one per
+      page / section with pages=True
+    """
+    try:
+        logging.info(f"Loading file: {uploaded_file.name}")
+
+        with span("load_data", file=uploaded_file.name) as s:
+            file_type = _file_type(uploaded_file)
+            separator = "\n" if file_type == "docx" else ""
+            documents = list(stream_documents(uploaded_file))
+            content = separator.join(doc.text for doc in documents)
+            s.set(pages=len(documents), chars=len(content))
 
-        document = Document(text=content, metadata={"filename": uploaded_file.name})
         logging.info(f"File loaded successfully: {uploaded_file.name}")
-        return [document]
+        if pages:
+            return documents
+        return [Document(text=content, metadata={"filename": uploaded_file.name})]
 
+    except customexception:
+        # Already wrapped, with its origin, by stream_documents.
+        logging.error("Error during document loading.")
+        raise
     except Exception as e:
         logging.error("Error during document loading.")
         raise customexception(e, sys)
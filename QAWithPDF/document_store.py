@@ -0,0 +1,172 @@
+import os
+import re
+import sys
+import threading
+from collections import OrderedDict
+
+from llama_index.core import Document
+
+from QAWithPDF.data_ingestion import _file_type, stream_documents
+from QAWithPDF.exception import customexception
+from QAWithPDF.index_cache import content_hash
+from QAWithPDF.tracing import span
+from logger import logging
+
+DEFAULT_MAX_BYTES = int(os.getenv("SMARTDOC_DOC_STORE_MB", "256")) * 1024 * 1024
+XRAY_LIMIT = 5
+EMAIL_RE = re.compile(r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}')
+DATE_RE = re.compile(r'\d{4}-\d{2}-\d{2}|\d{2}/\d{2}/\d{4}')
+
+
+def extract_xray(texts, limit=XRAY_LIMIT):
+    """
+    Collects the first `limit` distinct emails and dates from an iterable of texts
+    in one pass, stopping as soon as both lists are full.
+
+    Returns:
+    - (List[str], List[str]): emails, dates
+    """
+    emails, dates = {}, {}
+    for text in texts:
+        for pattern, found in ((EMAIL_RE, emails), (DATE_RE, dates)):
+            if len(found) < limit:
+                for match in pattern.finditer(text):
+                    found.setdefault(match.group(), None)
+                    if len(found) >= limit:
+                        break
+        if len(emails) >= limit and len(dates) >= limit:
+            break
+    return list(emails), list(dates)
+
+
+class ParsedDocument:
+    """
+    Everything extracted from one upload: the page Documents from
+    stream_documents and the X-ray emails and dates. The joined text is built from
+    the pages when asked for rather than held next to them.
+    """
+
+    def __init__(self, digest, name, pages, emails, dates, separator=""):
+        self.digest = digest
+        self.name = name
+        self.pages = pages
+        self.emails = emails
+        self.dates = dates
+        self.separator = separator
+
+    @property
+    def text(self):
+        """
+        The whole upload as load_data extracts it.
+        """
+        return self.separator.join(page.text for page in self.pages)
+
+    @property
+    def documents(self):
+        """
+        The upload as load_data returns it: one Document holding the whole text.
+        """
+        text = self.text
+        return [Document(text=text, metadata={"filename": self.name})] if text else []
+
+    @property
+    def size(self):
+        # Approximate bytes held by the page texts.
+        return sum(len(page.text) for page in self.pages)
+
+
+class DocumentStore:
+    """
+    Process-wide cache of parsed uploads keyed by content hash, so every view,
+    rerun and session reuses one extraction per file. Holds at most max_bytes of
+    text and drops the least recently used documents beyond that.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self._parsing = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, digest):
+        with self._lock:
+            parsed = self._entries.get(digest)
+            if parsed is not None:
+                self._entries.move_to_end(digest)
+            return parsed
+
+    def get_or_parse(self, uploaded_file, digest=None):
+        """
+        Returns the ParsedDocument for an upload, parsing it only the first time
+        its contents are seen. Concurrent callers for the same contents wait for one
+        parse instead of each starting one.
+
+        Parameters:
+        - uploaded_file: Streamlit uploaded file or any binary file object with a .name
+        - digest: content_hash() of the upload, if the caller already has it
+        """
+        try:
+            digest = digest or content_hash(uploaded_file.getvalue())
+            with self._lock:
+                parsed = self.get(digest)
+                if parsed is not None:
+                    self.hits += 1
+                    return parsed
+                parsing = self._parsing.setdefault(digest, threading.Lock())
+            with parsing:
+                try:
+                    with self._lock:
+                        parsed = self.get(digest)
+                        if parsed is not None:
+                            self.hits += 1
+                            return parsed
+                        self.misses += 1
+                    parsed = self._parse(uploaded_file, digest)
+                    self._put(parsed)
+                    return parsed
+                finally:
+                    with self._lock:
+                        self._parsing.pop(digest, None)
+        except Exception as e:
+            raise customexception(e, sys)
+
+    def _parse(self, uploaded_file, digest):
+        with span("load_data", file=uploaded_file.name) as s:
+            file_type = _file_type(uploaded_file)
+            pages = list(stream_documents(uploaded_file))
+            separator = "\n" if file_type == "docx" else ""
+            emails, dates = extract_xray(page.text for page in pages)
+            s.set(pages=len(pages), chars=sum(len(page.text) for page in pages))
+        logging.info(f"Document store: parsed {uploaded_file.name} ({len(pages)} pages)")
+        return ParsedDocument(digest, uploaded_file.name, pages, emails, dates, separator=separator)
+
+    def _put(self, parsed):
+        with self._lock:
+            if parsed.digest in self._entries:
+                return
+            self._entries[parsed.digest] = parsed
+            self._bytes += parsed.size
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.size
+                logging.info(f"Document store evicted: {evicted.name}")
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "documents": len(self._entries), "bytes": self._bytes}
+
+
+_default_store = None
+
+
+def get_document_store():
+    """
+    Returns the process-wide DocumentStore.
+    """
+    global _default_store
+    if _default_store is None:
+        _default_store = DocumentStore()
+    return _default_store
@@ -1,36 +1,160 @@
 from llama_index.core import VectorStoreIndex
-from llama_index.core import ServiceContext
-from llama_index.core import StorageContext, load_index_from_storage
-from llama_index.embeddings.gemini import GeminiEmbedding
+from llama_index.core import StorageContext
 
-from QAWithPDF.data_ingestion import load_data
-from QAWithPDF.model_api import load_model
+from QAWithPDF.index_cache import get_index_cache, index_key
+from QAWithPDF.embedding_pipeline import EmbeddingPipeline, get_embedding_cache
+from QAWithPDF.vector_store import VECTOR_STORE_BACKEND, create_vector_store
+from QAWithPDF.bm25 import BM25Index, build_query_engine
+from QAWithPDF.chunking import DEFAULT_CHUNKING
+from QAWithPDF import tracing
+from QAWithPDF.tracing import span
 
 import sys
+import threading
 from QAWithPDF.exception import customexception
 from logger import logging
-from llama_index.core import Settings
 
-def download_gemini_embedding(model,document):
+EMBED_MODEL_NAME = "text-embedding-004"
+
+_embed_model = None
+_embed_lock = threading.Lock()
+
+def get_embed_model():
+    """
+    Returns the process-wide GeminiEmbedding client, creating it on the first call.
+    """
+    global _embed_model
+    if _embed_model is None:
+        with _embed_lock:
+            if _embed_model is None:
+                logging.info("Initializing Gemini embedding model...")
+                from QAWithPDF.model_api import configure_genai
+                from llama_index.embeddings.gemini import GeminiEmbedding
+                configure_genai()
+                _embed_model = GeminiEmbedding(model_name=EMBED_MODEL_NAME)
+    return _embed_model
+
+def _load_or_build_index(document, content_digest=None, embed_model=None, chunking=None):
+    """
+    Returns (index, cache key, BM25Index). The BM25 index is built alongside a new
+    vector index and is None when the vector index came from the cache.
+
+    Parameters:
+    - chunking: ChunkingConfig for this index (DEFAULT_CHUNKING when None)
+    """
+    if embed_model is None:
+        embed_model = get_embed_model()
+    chunking = chunking or DEFAULT_CHUNKING
+    embed_model_name = embed_model.model_name or EMBED_MODEL_NAME
+
+    index = None
+    key = None
+    bm25 = None
+    with span("index_build", embed_model=embed_model_name) as s:
+        if content_digest:
+            cache = get_index_cache()
+            key = index_key(content_digest, embed_model_name, *chunking.key_params())
+            index = cache.load_index(key, embed_model=embed_model)
+        s.set(cache_hit=index is not None)
+
+        if index is None:
+            logging.info("Building vector index...")
+            with span("chunking", strategy=chunking.strategy) as chunk_span:
+                nodes = chunking.make_parser().get_nodes_from_documents(document)
+                chunk_span.set(chunks=len(nodes))
+                if tracing.TRACING_ENABLED:
+                    chunk_span.set(tokens=sum(node.metadata.get("tokens") or tracing.count_tokens(node.get_content())
+                                              for node in nodes))
+            pipeline = EmbeddingPipeline(
+                embed_model.get_text_embedding_batch,
+                embed_model_name,
+                cache=get_embedding_cache(),
+            )
+            with span("embedding") as embed_span:
+                pipeline.embed_nodes(nodes)
+                embed_span.set(chunks=len(nodes), embedded=pipeline.last_run["embedded"],
+                               cached=pipeline.last_run["cached"], batches=pipeline.last_run["batches"])
+            logging.info(f"Embedded {len(nodes)} chunks at {pipeline.last_run['chunks_per_sec']:.1f} chunks/sec")
+            storage_context = StorageContext.from_defaults(vector_store=create_vector_store())
+            index = VectorStoreIndex(nodes, storage_context=storage_context, embed_model=embed_model)
+            with span("bm25_build", chunks=len(nodes)):
+                bm25 = BM25Index().add_nodes(nodes)
+            if key:
+                cache.save_index(key, index, metadata={"embed_model": embed_model_name, "vector_store": VECTOR_STORE_BACKEND,
+                                                 "chunking": repr(chunking)},
+                                 lexical_index=bm25)
+        s.set(chunks=len(index.index_struct.nodes_dict))
+    return index, key, bm25
+
+def _index_nodes(index):
+    return index.docstore.get_nodes(list(index.index_struct.nodes_dict.values()))
+
+def _load_bm25(index, key):
+    """
+    BM25 index of a cached vector index, read from its cache entry. Entries written
+    before BM25 existed get one built from the docstore and added to the entry.
+    """
+    cache = get_index_cache()
+    bm25 = cache.load_lexical_index(key) if key else None
+    if bm25 is None:
+        bm25 = BM25Index().add_nodes(_index_nodes(index))
+        if key:
+            cache.save_lexical_index(key, bm25)
+    return bm25
+
+def download_gemini_embedding(model,document,content_digest=None,streaming=False,embed_model=None,chunking=None,
+                              context_budget=None):
     """
     Downloads and initializes a Gemini Embedding model for vector embeddings.
 
+    Parameters:
+    - model: LLM used by the query engine
+    - document: List[Document] to index
+    - content_digest: content_hash() of the uploaded bytes. When given, the index is
+      loaded from the on-disk index cache if present and stored there otherwise.
+    - streaming: build a query engine whose query() returns a StreamingResponse
+    - embed_model: llama-index embedding model to use instead of GeminiEmbedding
+      (e.g. fakes.FakeEmbedding for offline runs)
+    - chunking: chunking.ChunkingConfig (SMARTDOC_CHUNKER / SMARTDOC_CHUNK_TOKENS
+      defaults when None)
+    - context_budget: context tokens per question, packed by context.ContextPacker;
+      None sends the top 2 retrieved chunks as they are
+
     Returns:
-    - VectorStoreIndex: An index of vector embeddings for efficient similarity queries.
+    - RetrieverQueryEngine retrieving with bm25.HybridRetriever (SMARTDOC_RETRIEVAL
+      selects vector, lexical or hybrid).
     """
     try:
-        logging.info("")
-        gemini_embed_model = GeminiEmbedding(model_name="text-embedding-004")
-        Settings.llm = model
-        Settings.embed_model = gemini_embed_model
-        Settings.chunk_size = 800
-        Settings.chunk_overlap = 20
-        
-        logging.info("")
-        index = VectorStoreIndex.from_documents(document)
-        
-        logging.info("")
-        query_engine = index.as_query_engine()
+        index, key, bm25 = _load_or_build_index(document, content_digest, embed_model, chunking)
+        if bm25 is None:
+            bm25 = _load_bm25(index, key)
+        logging.info("Creating query engine...")
+        query_engine = build_query_engine(index, bm25, llm=model, streaming=streaming, context_budget=context_budget)
         return query_engine
     except Exception as e:
         raise customexception(e,sys)
+
+def load_document_nodes(model, document, content_digest=None, embed_model=None, chunking=None):
+    """
+    Returns the embedded chunks of a document without keeping a per-document index,
+    for insertion into a shared CorpusIndex. Uses the same on-disk index cache as
+    download_gemini_embedding, so a cached document is never re-embedded.
+
+    Returns:
+    - List[BaseNode]: nodes with their embedding set
+    """
+    try:
+        index, _, _ = _load_or_build_index(document, content_digest, embed_model, chunking)
+        nodes = _index_nodes(index)
+        for node in nodes:
+            node.embedding = index.vector_store.get(node.node_id)
+        return nodes
+    except Exception as e:
+        raise customexception(e,sys)
+
+
+def embed_query(text, embed_model=None):
+    """
+    Embeds a query with embed_model, or the Gemini embedding model when None.
+    """
+    return (embed_model or get_embed_model()).get_query_embedding(text)
@@ -0,0 +1,172 @@
+import hashlib
+import os
+import sqlite3
+import sys
+import threading
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+
+from llama_index.core.schema import MetadataMode
+
+from QAWithPDF.exception import customexception
+from QAWithPDF.ratelimit import call_with_backoff
+from logger import logging
+
+DEFAULT_CACHE_PATH = os.path.join(os.getcwd(), "storage", "embedding_cache.sqlite3")
+DEFAULT_BATCH_SIZE = int(os.getenv("SMARTDOC_EMBED_BATCH_SIZE", "100"))
+DEFAULT_CONCURRENCY = int(os.getenv("SMARTDOC_EMBED_CONCURRENCY", "4"))
+
+
+def chunk_key(model_name, text):
+    """
+    Cache key of one chunk: the embedding model name plus a hash of the chunk text.
+    """
+    return hashlib.sha256(f"{model_name}\0{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Persistent chunk-text -> vector cache in a SQLite file. Vectors are stored as
+    packed float32 so a cached 768-d vector costs ~3 KB.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get_many(self, keys):
+        """
+        Returns:
+        - dict mapping each cached key to its vector; missing keys are absent
+        """
+        found = {}
+        conn = self._connect()
+        keys = list(keys)
+        for start in range(0, len(keys), 500):
+            part = keys[start:start + 500]
+            rows = conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(part))})", part
+            ).fetchall()
+            for key, blob in rows:
+                found[key] = array("f", blob).tolist()
+        return found
+
+    def put_many(self, items):
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [(key, array("f", vector).tobytes()) for key, vector in items],
+            )
+
+
+class EmbeddingPipeline:
+    """
+    Batched, concurrent and incremental embedding stage.
+
+    Texts are deduplicated and looked up in the EmbeddingCache first; only the
+    misses are sent to the embedder, in batches of batch_size with at most
+    max_concurrency batches in flight. Rate-limited batches are retried with
+    backoff. After every run, last_run holds the counts and chunks/sec.
+
+    Parameters:
+    - embedder: callable taking a list of texts and returning a list of vectors,
+      e.g. GeminiEmbedding(...).get_text_embedding_batch or fakes.HashEmbedder()
+    - model_name: part of the cache key, so vectors of different models never mix
+    """
+
+    def __init__(self, embedder, model_name, batch_size=DEFAULT_BATCH_SIZE, max_concurrency=DEFAULT_CONCURRENCY,
+                 cache=None, max_retries=5):
+        self.embedder = embedder
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.cache = cache
+        self.max_retries = max_retries
+        self.last_run = {}
+
+    def _embed_batch(self, texts):
+        vectors = call_with_backoff(self.embedder, texts, max_retries=self.max_retries)
+        if len(vectors) != len(texts):
+            raise ValueError(f"Embedder returned {len(vectors)} vectors for {len(texts)} texts")
+        return vectors
+
+    def embed(self, texts):
+        """
+        Embeds texts, reusing cached vectors.
+
+        Returns:
+        - List of vectors, one per input text, in input order
+        """
+        try:
+            start = time.perf_counter()
+            keys = [chunk_key(self.model_name, text) for text in texts]
+            vectors = self.cache.get_many(set(keys)) if self.cache else {}
+            cached = sum(1 for key in keys if key in vectors)
+
+            pending = {}
+            for key, text in zip(keys, texts):
+                if key not in vectors:
+                    pending.setdefault(key, text)
+            pending_keys = list(pending)
+            batches = [pending_keys[i:i + self.batch_size] for i in range(0, len(pending_keys), self.batch_size)]
+
+            if batches:
+                with ThreadPoolExecutor(max_workers=max(1, min(self.max_concurrency, len(batches)))) as pool:
+                    results = pool.map(lambda batch: self._embed_batch([pending[key] for key in batch]), batches)
+                    for batch, batch_vectors in zip(batches, results):
+                        new_items = list(zip(batch, batch_vectors))
+                        vectors.update(new_items)
+                        if self.cache:
+                            self.cache.put_many(new_items)
+
+            elapsed = time.perf_counter() - start
+            self.last_run = {
+                "chunks": len(texts),
+                "cached": cached,
+                "embedded": len(pending_keys),
+                "batches": len(batches),
+                "seconds": elapsed,
+                "chunks_per_sec": len(texts) / elapsed if elapsed else 0.0,
+            }
+            logging.info(f"Embedding run: {self.last_run}")
+            return [vectors[key] for key in keys]
+        except Exception as e:
+            raise customexception(e, sys)
+
+    def embed_nodes(self, nodes):
+        """
+        Sets node.embedding on every node that does not have one yet, using the same
+        text llama-index would embed. VectorStoreIndex skips nodes that already carry
+        an embedding.
+        """
+        todo = [node for node in nodes if node.embedding is None]
+        vectors = self.embed([node.get_content(metadata_mode=MetadataMode.EMBED) for node in todo])
+        for node, vector in zip(todo, vectors):
+            node.embedding = vector
+        return nodes
+
+
+_default_cache = None
+
+
+def get_embedding_cache():
+    """
+    Returns the process-wide EmbeddingCache at ./storage/embedding_cache.sqlite3.
+    """
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = EmbeddingCache()
+    return _default_cache
@@ -0,0 +1,169 @@
+import hashlib
+import math
+import struct
+import threading
+import time
+
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.llms import CompletionResponse, CustomLLM, LLMMetadata
+from llama_index.core.llms.callbacks import llm_completion_callback
+
+
+class HashEmbedder:
+    """
+    Deterministic offline stand-in for an embedding API.
+
+    Vectors are derived from a hash of each token, so equal texts always get equal
+    vectors and texts sharing words are closer than unrelated ones. Call it like the
+    embedder of an EmbeddingPipeline: a list of texts in, a list of vectors out.
+    """
+
+    def __init__(self, dim=768):
+        self.dim = dim
+        self.calls = 0
+        self.texts_embedded = 0
+        self._token_vectors = {}
+
+    def _token_vector(self, token):
+        if token in self._token_vectors:
+            return self._token_vectors[token]
+        digest = hashlib.sha256(token.encode("utf-8")).digest()
+        while len(digest) < self.dim * 2:
+            digest += hashlib.sha256(digest).digest()
+        vector = [v / 32768.0 for v in struct.unpack(f"<{self.dim}h", digest[: self.dim * 2])]
+        self._token_vectors[token] = vector
+        return vector
+
+    def embed(self, text):
+        vector = [0.0] * self.dim
+        for token in text.lower().split() or [""]:
+            for i, v in enumerate(self._token_vector(token)):
+                vector[i] += v
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def __call__(self, texts):
+        self.calls += 1
+        self.texts_embedded += len(texts)
+        return [self.embed(text) for text in texts]
+
+
+class FakeEmbedding(BaseEmbedding):
+    """
+    llama-index embedding model backed by HashEmbedder, usable wherever a
+    GeminiEmbedding is expected (Settings.embed_model, VectorStoreIndex, ...).
+    latency is slept once per embedding call to imitate a network round trip.
+    """
+
+    dim: int = 768
+    latency: float = 0.0
+    _embedder = PrivateAttr()
+
+    def __init__(self, dim=768, latency=0.0, **kwargs):
+        super().__init__(dim=dim, latency=latency, model_name=f"fake-hash-{dim}", **kwargs)
+        self._embedder = HashEmbedder(dim)
+
+    @classmethod
+    def class_name(cls):
+        return "FakeEmbedding"
+
+    def _get_query_embedding(self, query):
+        time.sleep(self.latency)
+        return self._embedder.embed(query)
+
+    def _get_text_embedding(self, text):
+        time.sleep(self.latency)
+        return self._embedder.embed(text)
+
+    def _get_text_embeddings(self, texts):
+        time.sleep(self.latency)
+        return self._embedder(texts)
+
+    async def _aget_query_embedding(self, query):
+        return self._get_query_embedding(query)
+
+
+class FakeGemini(CustomLLM):
+    """
+    Deterministic offline stand-in for the Gemini LLM.
+
+    The answer is a short fingerprint of the prompt followed by the first
+    max_words words of the retrieved context, so equal prompts always get equal
+    answers. latency is slept before the first token; stream_complete yields one
+    word at a time.
+    """
+
+    max_words: int = 60
+    latency: float = 0.0
+
+    @classmethod
+    def class_name(cls):
+        return "FakeGemini"
+
+    @property
+    def metadata(self):
+        return LLMMetadata(model_name="fake-gemini", context_window=32768, num_output=self.max_words * 2)
+
+    def _answer_words(self, prompt):
+        # Default llama-index QA prompts put the context between two dashed rules.
+        parts = prompt.split("---------------------")
+        context = parts[1] if len(parts) > 2 else prompt
+        fingerprint = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:8]
+        return [f"[{fingerprint}]"] + context.split()[: self.max_words]
+
+    @llm_completion_callback()
+    def complete(self, prompt, formatted=False, **kwargs):
+        time.sleep(self.latency)
+        return CompletionResponse(text=" ".join(self._answer_words(prompt)))
+
+    @llm_completion_callback()
+    def stream_complete(self, prompt, formatted=False, **kwargs):
+        words = self._answer_words(prompt)
+
+        def gen():
+            time.sleep(self.latency)
+            text = ""
+            for i, word in enumerate(words):
+                delta = word if i == 0 else " " + word
+                text += delta
+                yield CompletionResponse(text=text, delta=delta)
+
+        return gen()
+
+
+class FakeTranslator:
+    """
+    Deterministic offline stand-in for the translation backend: prefixes the text
+    with the target code, e.g. "[es] Hello." latency is slept per request; calls
+    counts requests.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, text, target_code):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.latency)
+        return f"[{target_code}] {text}"
+
+
+class FakeSpeech:
+    """
+    Deterministic offline stand-in for the TTS backend. Returns a short tagged byte
+    string per segment instead of MP3 audio; latency is slept per request.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, text, lang, slow):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.latency)
+        return f"[{lang}{'/slow' if slow else ''}] {text}\n".encode("utf-8")
@@ -0,0 +1,230 @@
+import hashlib
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+
+from llama_index.core import StorageContext, load_index_from_storage
+
+from QAWithPDF.bm25 import BM25Index
+from QAWithPDF.exception import customexception
+from QAWithPDF.tracing import metrics
+from QAWithPDF.vector_store import load_vector_store
+from logger import logging
+
+DEFAULT_CACHE_DIR = os.path.join(os.getcwd(), "storage")
+DEFAULT_MAX_BYTES = int(os.getenv("SMARTDOC_INDEX_CACHE_MB", "1024")) * 1024 * 1024
+MARKER_FILE = "cache_meta.json"
+# Entries being written; they get a marker before they are renamed into place.
+TMP_PREFIX = ".tmp-"
+
+
+def content_hash(data):
+    """
+    Returns the SHA-256 hex digest of the raw uploaded bytes.
+    """
+    return hashlib.sha256(data).hexdigest()
+
+
+def index_key(content_digest, embed_model_name, chunk_size, chunk_overlap, chunker=None):
+    """
+    Builds the cache key for an index from the document digest and every setting
+    that changes the stored vectors.
+
+    Parameters:
+    - content_digest: content_hash() of the uploaded file
+    - embed_model_name: name of the embedding model
+    - chunk_size, chunk_overlap: node parser settings
+    - chunker: chunking strategy and version (ChunkingConfig.key_params()); None
+      keeps the keys of entries written before strategies existed
+
+    Returns:
+    - str: hex digest used as the directory name under the cache root
+    """
+    params = {
+        "content": content_digest,
+        "embed_model": embed_model_name,
+        "chunk_size": chunk_size,
+        "chunk_overlap": chunk_overlap,
+    }
+    if chunker is not None:
+        params["chunker"] = chunker
+    payload = json.dumps(params, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+def _dir_size(path):
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, name))
+            except OSError:
+                pass
+    return total
+
+
+class IndexCache:
+    """
+    Content-addressed on-disk cache of persisted VectorStoreIndex storage contexts.
+
+    Each entry lives in <root>/<key>/ next to a marker file whose mtime is bumped on
+    every hit, so eviction removes the least recently used entries first once the
+    total size goes over max_bytes.
+
+    Hits, misses and evictions are also exported as smartdoc_stage_items_total
+    counters of the index_cache stage, and the cache size as gauges.
+    """
+
+    def __init__(self, root=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    def _count(self, kind):
+        with self._lock:
+            setattr(self, kind, getattr(self, kind) + 1)
+        metrics.increment("index_cache", kind)
+
+    def path(self, key):
+        return os.path.join(self.root, key)
+
+    def contains(self, key):
+        return os.path.exists(os.path.join(self.path(key), MARKER_FILE))
+
+    def load_index(self, key, embed_model=None):
+        """
+        Loads the index stored under key.
+
+        Parameters:
+        - embed_model: embedding model the index queries with; llama-index's global
+          Settings.embed_model when None
+
+        Returns:
+        - VectorStoreIndex, or None on a miss
+        """
+        if not self.contains(key):
+            self._count("misses")
+            logging.info(f"Index cache miss: {key}")
+            return None
+        try:
+            storage_context = StorageContext.from_defaults(
+                persist_dir=self.path(key),
+                vector_store=load_vector_store(self.path(key)),
+            )
+            index = load_index_from_storage(storage_context, embed_model=embed_model)
+        except Exception as e:
+            # A half-written or incompatible entry is treated as a miss and rebuilt.
+            logging.warning(f"Discarding unreadable index cache entry {key}: {e}")
+            shutil.rmtree(self.path(key), ignore_errors=True)
+            self._count("misses")
+            return None
+        os.utime(os.path.join(self.path(key), MARKER_FILE))
+        self._count("hits")
+        logging.info(f"Index cache hit: {key}")
+        return index
+
+    def save_index(self, key, index, metadata=None, lexical_index=None):
+        """
+        Persists the index (and its BM25Index, if given) under key, then evicts old
+        entries if over the size cap.
+        The entry is written to a temporary directory and renamed into place so a
+        concurrent reader never sees a partial entry.
+        """
+        try:
+            tmp_dir = os.path.join(self.root, f"{TMP_PREFIX}{key}-{os.getpid()}-{threading.get_ident()}")
+            index.storage_context.persist(persist_dir=tmp_dir)
+            if lexical_index is not None:
+                lexical_index.persist(tmp_dir)
+            with open(os.path.join(tmp_dir, MARKER_FILE), "w") as f:
+                json.dump({"key": key, "created": time.time(), **(metadata or {})}, f)
+            try:
+                os.replace(tmp_dir, self.path(key))
+            except OSError:
+                # Another worker stored the same key first; keep theirs.
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+            logging.info(f"Index cache stored: {key}")
+            self.evict(keep=key)
+        except Exception as e:
+            raise customexception(e, sys)
+
+    def load_lexical_index(self, key):
+        """
+        Returns the BM25Index stored with the entry, or None.
+        """
+        try:
+            return BM25Index.from_persist_dir(self.path(key))
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable BM25 index in {key}: {e}")
+            return None
+
+    def save_lexical_index(self, key, lexical_index):
+        """
+        Adds a BM25Index to an existing entry.
+        """
+        if self.contains(key):
+            lexical_index.persist(self.path(key))
+
+    def entries(self):
+        """
+        Returns:
+        - List[(key, last_used, size_bytes)] for every complete entry, oldest first;
+          entries still being written are skipped
+        """
+        found = []
+        for name in os.listdir(self.root):
+            if name.startswith(TMP_PREFIX):
+                continue
+            marker = os.path.join(self.root, name, MARKER_FILE)
+            if os.path.exists(marker):
+                found.append((name, os.path.getmtime(marker), _dir_size(self.path(name))))
+        found.sort(key=lambda entry: entry[1])
+        return found
+
+    def evict(self, keep=None):
+        """
+        Removes least recently used entries until the cache fits in max_bytes.
+        """
+        with self._lock:
+            entries = self.entries()
+            total = sum(size for _, _, size in entries)
+            for key, _, size in entries:
+                if total <= self.max_bytes:
+                    break
+                if key == keep:
+                    continue
+                shutil.rmtree(self.path(key), ignore_errors=True)
+                total -= size
+                self.evictions += 1
+                metrics.increment("index_cache", "evictions")
+                logging.info(f"Index cache evicted: {key}")
+            metrics.set_gauge("index_cache_bytes", total, "Bytes held by the on-disk index cache.")
+
+    def stats(self):
+        entries = self.entries()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(entries),
+            "bytes": sum(size for _, _, size in entries),
+        }
+
+
+_default_cache = None
+
+
+def get_index_cache():
+    """
+    Returns the process-wide IndexCache rooted at ./storage.
+    """
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = IndexCache()
+    return _default_cache
@@ -0,0 +1,95 @@
+from QAWithPDF.index_cache import content_hash
+from QAWithPDF.jobs import cancelled
+from QAWithPDF.tracing import traced_query
+
+DEEP_DIVE_PROMPT = "Generate a comprehensive investigation report: 1. Introduction, 2.Main info , 3. Hidden Details, 4. Conclusion."
+SUMMARY_PROMPT = "Summarize the main points of this document in 5 short bullet points."
+MINDMAP_PROMPT = "Identify the top 10 most important concepts in this document. Then, identify how they are related. Format the output strictly as: Concept A -> Concept B. Return only 5 lines of these relationships."
+QUIZ_PROMPT = """
+Generate 5 multiple choice questions based on the document.
+Return the output in this strict format:
+Q1: [Question Text] | [Option1, Option2, Option3, Option4] | [Correct Option]
+Q2: ...
+Q3: ...
+Do not add markdown formatting like ** or ##.
+"""
+
+
+def scope_key(doc_ids):
+    """
+    Returns:
+    - str: id of a set of documents, under which its insights and chat history are
+      kept; a single document's id is its own content hash
+    """
+    doc_ids = list(doc_ids)
+    return doc_ids[0] if len(doc_ids) == 1 else content_hash("|".join(sorted(doc_ids)).encode())
+
+
+def parse_mindmap_edges(text):
+    """
+    Returns:
+    - List[(str, str)]: the "Concept A -> Concept B" lines of an answer
+    """
+    edges = []
+    for edge in text.split('\n'):
+        if "->" in edge:
+            parts = edge.split("->")
+            if len(parts) == 2:
+                edges.append((parts[0].strip(), parts[1].strip()))
+    return edges
+
+
+def parse_quiz(text):
+    """
+    Returns:
+    - List[dict]: {"q", "opts", "ans"} for each "Q: text | [options] | [answer]" line
+    """
+    quiz = []
+    for line in text.split('\n'):
+        if "|" in line:
+            parts = line.split("|")
+            if len(parts) >= 3:
+                q_text = parts[0].split(":")[1].strip() if ":" in parts[0] else parts[0].strip()
+                options = parts[1].replace("[", "").replace("]", "").split(",")
+                correct = parts[2].replace("[", "").replace("]", "").strip()
+                quiz.append({"q": q_text, "opts": [o.strip() for o in options], "ans": correct})
+    return quiz
+
+
+# kind -> (prompt, parser of the answer text)
+INSIGHTS = {
+    "summary": (SUMMARY_PROMPT, str.strip),
+    "mindmap": (MINDMAP_PROMPT, parse_mindmap_edges),
+    "quiz": (QUIZ_PROMPT, parse_quiz),
+}
+
+
+def compute_insight(kind, corpus, scope, model=None):
+    """
+    Runs one INSIGHTS prompt over a set of documents, indexing any of them that
+    are not in the corpus yet.
+
+    Parameters:
+    - kind: "summary", "mindmap" or "quiz"
+    - corpus: CorpusIndex
+    - scope: List[(doc_id, name, documents)], e.g. ParsedDocument.pages or load_data output
+    - model: LLM; load_model() when None
+
+    Returns:
+    - the parsed result: str, list of edges or list of quiz questions
+    """
+    from QAWithPDF.context import context_budget
+    from QAWithPDF.embedding import load_document_nodes
+    from QAWithPDF.model_api import load_model
+
+    model = model or load_model()
+    for doc_id, name, documents in scope:
+        # A removed member must not be indexed again by its scope's job.
+        if cancelled():
+            return None
+        corpus.ensure_document(doc_id, lambda: load_document_nodes(model, documents, doc_id, embed_model=corpus.embed_model),
+                               name=name)
+    prompt, parse = INSIGHTS[kind]
+    query_engine = corpus.as_query_engine(doc_ids=[doc_id for doc_id, _, _ in scope], llm=model,
+                                          context_budget=context_budget("Insight"))
+    return parse(str(traced_query(query_engine, prompt).response))
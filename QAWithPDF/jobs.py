@@ -0,0 +1,168 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from QAWithPDF.scheduler import BACKGROUND, priority
+from QAWithPDF.tracing import span
+from logger import logging
+
+DEFAULT_WORKERS = int(os.getenv("SMARTDOC_JOB_WORKERS", "4"))
+# Finished jobs kept for lookup; older ones are forgotten as new jobs are submitted.
+DEFAULT_MAX_FINISHED = int(os.getenv("SMARTDOC_JOB_HISTORY", "1000"))
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+
+
+_current = threading.local()
+
+
+class Job:
+    """
+    One background computation for a document, e.g. its quiz. status moves from
+    queued to running to done/failed, or to cancelled. members are the documents
+    the job reads: just doc_id, or every document of a combined scope.
+    """
+
+    def __init__(self, doc_id, kind, members=None):
+        self.doc_id = doc_id
+        self.kind = kind
+        self.members = frozenset(members or (doc_id,))
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        self.future = None
+        self.submitted = time.time()
+        self.finished = None
+
+    @property
+    def pending(self):
+        return self.status in (QUEUED, RUNNING)
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.time()) - self.submitted
+
+
+def cancelled():
+    """
+    True inside a job that has been cancelled since it started, so long-running
+    job functions can stop early.
+    """
+    job = getattr(_current, "job", None)
+    return job is not None and job.status == CANCELLED
+
+
+class JobRunner:
+    """
+    Runs document jobs on a thread pool outside the Streamlit script thread and
+    keeps their results per (document id, kind), so any session or rerun can pick
+    them up. Submitting a (document, kind) that is already queued, running or done
+    returns the existing job unless replace is set. At most max_finished finished
+    jobs are kept, oldest dropped first.
+    """
+
+    def __init__(self, max_workers=DEFAULT_WORKERS, max_finished=DEFAULT_MAX_FINISHED):
+        self._pool = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="jobs")
+        self.max_finished = max_finished
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, doc_id, kind, fn, *args, replace=False, members=None):
+        """
+        Schedules fn(*args) as the (doc_id, kind) job. members lists the documents
+        of a combined scope, whose removal cancels the job (see cancel).
+
+        Returns:
+        - Job
+        """
+        with self._lock:
+            existing = self._jobs.get((doc_id, kind))
+            if existing is not None and existing.status in (QUEUED, RUNNING, DONE) and not replace:
+                return existing
+            if existing is not None:
+                self._cancel(existing)
+            job = Job(doc_id, kind, members)
+            self._jobs.pop((doc_id, kind), None)
+            self._jobs[(doc_id, kind)] = job
+            self._prune()
+            job.future = self._pool.submit(self._run, job, fn, args)
+            return job
+
+    def _run(self, job, fn, args):
+        if job.status == CANCELLED:
+            return
+        job.status = RUNNING
+        _current.job = job
+        try:
+            # LLM calls made by jobs queue behind interactive requests.
+            with span("job", kind=job.kind), priority(BACKGROUND):
+                result = fn(*args)
+            if job.status != CANCELLED:
+                job.result, job.status = result, DONE
+        except Exception as e:
+            logging.warning(f"Job {job.kind} for {job.doc_id} failed: {e}")
+            if job.status != CANCELLED:
+                job.error, job.status = str(e), FAILED
+        finally:
+            _current.job = None
+            job.finished = time.time()
+
+    def _prune(self):
+        # Dicts keep insertion order, so the first finished jobs are the oldest.
+        finished = [key for key, job in self._jobs.items() if not job.pending]
+        for key in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[key]
+
+    def _cancel(self, job):
+        # A running job cannot be interrupted; its result is discarded when it ends.
+        if job.pending:
+            job.future.cancel()
+            job.status = CANCELLED
+            job.finished = time.time()
+
+    def get(self, doc_id, kind):
+        with self._lock:
+            return self._jobs.get((doc_id, kind))
+
+    def jobs(self, doc_id):
+        with self._lock:
+            return {kind: job for (job_doc, kind), job in self._jobs.items() if job_doc == doc_id}
+
+    def cancel(self, doc_id):
+        """
+        Cancels the queued and running jobs of a document, including combined
+        scopes it is a member of, and forgets all of them. Returns the number of
+        jobs cancelled.
+        """
+        with self._lock:
+            dropped = [key for key, job in self._jobs.items() if key[0] == doc_id or doc_id in job.members]
+            cancelled = 0
+            for key in dropped:
+                job = self._jobs.pop(key)
+                cancelled += job.pending
+                self._cancel(job)
+        if cancelled:
+            logging.info(f"Cancelled {cancelled} jobs for {doc_id}")
+        return cancelled
+
+    def stats(self):
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+            return counts
+
+
+_default_runner = None
+_default_lock = threading.Lock()
+
+
+def get_job_runner():
+    """
+    Returns the process-wide JobRunner with SMARTDOC_JOB_WORKERS threads.
+    """
+    global _default_runner
+    with _default_lock:
+        if _default_runner is None:
+            _default_runner = JobRunner()
+        return _default_runner
@@ -1,28 +1,46 @@
 import os
-from dotenv import load_dotenv
 import sys
-import google.generativeai as genai
-from llama_index.llms.gemini import Gemini
+import threading
+from dotenv import load_dotenv
 from QAWithPDF.exception import customexception
 from logger import logging
 
-load_dotenv()
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-if not GOOGLE_API_KEY:
-    raise ValueError("GOOGLE_API_KEY not found in environment variables or .env file.")
+MODEL_NAME = "gemini-2.0-flash"
 
-# Configure SDK
-genai.configure(api_key=GOOGLE_API_KEY)
+_model = None
+_lock = threading.Lock()
 
-def load_model():
+def configure_genai():
     """
-    Loads the Gemini 2.0 Flash model using Google Generative AI API.
+    Reads GOOGLE_API_KEY (environment or .env) and configures the Gemini SDK.
+    Called on first use rather than at import, so importing this module is cheap.
     """
-    try:
-        logging.info("Loading Gemini 2.0 Flash model...")
-        model = Gemini(model="gemini-2.0-flash", temperature=0.2)
-        logging.info("Gemini 2.0 Flash model loaded successfully.")
-        return model
-    except Exception as e:
-        raise customexception(e, sys)
+    load_dotenv()
+    api_key = os.getenv("GOOGLE_API_KEY")
+    if not api_key:
+        raise ValueError("GOOGLE_API_KEY not found in environment variables or .env file.")
+    import google.generativeai as genai
+    genai.configure(api_key=api_key)
 
+def load_model():
+    """
+    Returns the process-wide Gemini 2.0 Flash client, creating it on the first call.
+    Reusing one client keeps its HTTP/gRPC connections warm across queries. Calls go
+    through the process-wide scheduler.LLMScheduler, which coalesces identical
+    requests, rate-limits and retries them and runs chat before background jobs.
+    """
+    global _model
+    if _model is not None:
+        return _model
+    with _lock:
+        if _model is None:
+            try:
+                logging.info("Loading Gemini 2.0 Flash model...")
+                configure_genai()
+                from llama_index.llms.gemini import Gemini
+                from QAWithPDF.scheduler import ScheduledLLM
+                _model = ScheduledLLM(Gemini(model=MODEL_NAME, temperature=0.2))
+                logging.info("Gemini 2.0 Flash model loaded successfully.")
+            except Exception as e:
+                raise customexception(e, sys)
+    return _model
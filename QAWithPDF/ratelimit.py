@@ -0,0 +1,89 @@
+import random
+import threading
+import time
+
+from logger import logging
+
+RATE_LIMIT_MARKERS = ("429", "rate limit", "ratelimit", "quota", "resource exhausted", "resourceexhausted")
+
+
+def is_rate_limit_error(exc):
+    """
+    Returns True when exc looks like a provider rate-limit / quota error (HTTP 429).
+    """
+    if getattr(exc, "code", None) == 429 or getattr(exc, "status_code", None) == 429:
+        return True
+    text = f"{type(exc).__name__} {exc}".lower()
+    return any(marker in text for marker in RATE_LIMIT_MARKERS)
+
+
+def call_with_backoff(fn, *args, max_retries=5, base_delay=1.0, max_delay=30.0, retry_on=is_rate_limit_error, **kwargs):
+    """
+    Calls fn(*args, **kwargs), retrying with jittered exponential backoff while
+    retry_on(exception) is true.
+
+    Parameters:
+    - max_retries: retries after the first attempt before the error is re-raised
+    - base_delay, max_delay: backoff bounds in seconds; each sleep is drawn
+      uniformly from [0, min(max_delay, base_delay * 2**attempt)]
+
+    Returns:
+    - whatever fn returns
+    """
+    attempt = 0
+    while True:
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            if attempt >= max_retries or not retry_on(e):
+                raise
+            delay = random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+            logging.warning(f"Rate limited ({type(e).__name__}), retrying in {delay:.2f}s [attempt {attempt + 1}/{max_retries}]")
+            time.sleep(delay)
+            attempt += 1
+
+
+class RateLimiter:
+    """
+    Thread-safe token bucket: acquire() blocks until a request may be sent so that
+    at most `rate` units per second go out, with bursts of up to `burst`. A unit is
+    one request by default; pass amount to spend e.g. a prompt's tokens. A rate of
+    0 disables limiting.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or max(1.0, rate)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def available_in(self, amount=1):
+        """
+        Returns:
+        - float: seconds until amount can be acquired, 0 when it can be now
+        """
+        if not self.rate:
+            return 0.0
+        # A single request larger than the bucket would otherwise wait forever.
+        amount = min(amount, self.burst)
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            return max(0.0, (amount - self._tokens) / self.rate)
+
+    def acquire(self, amount=1):
+        if not self.rate:
+            return
+        amount = min(amount, self.burst)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return
+                wait = (amount - self._tokens) / self.rate
+            time.sleep(wait)
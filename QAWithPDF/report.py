@@ -0,0 +1,135 @@
+import copy
+import hashlib
+import io
+import sys
+import threading
+import zipfile
+
+from QAWithPDF.exception import customexception
+from QAWithPDF.tracing import span
+
+
+def entry_text(chat):
+    """
+    (question, answer) of a history entry, either a {"q", "a", ...} dict or a
+    legacy (q, a, src) tuple.
+    """
+    if isinstance(chat, dict):
+        return chat.get("q", ""), chat.get("a", "")
+    return chat[0], chat[1]
+
+
+def entry_fingerprint(chat):
+    q, a = entry_text(chat)
+    return hashlib.sha1(f"{q}\0{a}".encode("utf-8")).hexdigest()
+
+
+def safe_text(text):
+    # The core PDF fonts only cover latin-1.
+    if not text:
+        return ""
+    return text.encode("latin-1", "replace").decode("latin-1")
+
+
+class ReportBuilder:
+    """
+    PDF report of one document's chat history, laid out incrementally.
+
+    The FPDF document stays open between exports. render() only lays out the
+    Q/A pairs appended since the previous call and returns the cached bytes when
+    the history has not changed at all. If an earlier entry was edited (e.g. the
+    history was re-translated), the report is laid out again from scratch.
+
+    Each new version is still O(n) in the report size: fpdf2's output() rewrites
+    the page objects it serializes, so it runs on a deep copy of the open
+    document, and the copy plus serialization cover every page, not just the new
+    ones. Layout, the expensive part, is not repeated; benchmarks.report times
+    the copy ("copy_s") next to a full layout ("full_s").
+    """
+
+    def __init__(self, doc_name):
+        self.doc_name = doc_name
+        self._pdf = None
+        self._fingerprints = []
+        self._rendered = None
+        self._rendered_version = None
+        self._lock = threading.Lock()
+
+    @property
+    def version(self):
+        return len(self._fingerprints), (self._fingerprints[-1] if self._fingerprints else None)
+
+    def _start(self):
+        from fpdf import FPDF
+        pdf = FPDF()
+        pdf.add_page()
+        pdf.set_font("Arial", size=12)
+        pdf.set_font("Arial", 'B', 16)
+        pdf.cell(0, 10, txt=safe_text(f"DocQuest Report: {self.doc_name}"), ln=True, align='C')
+        pdf.ln(10)
+        pdf.set_font("Arial", size=11)
+        self._pdf = pdf
+        self._fingerprints = []
+
+    def _append(self, chat, fingerprint):
+        pdf = self._pdf
+        q, a = entry_text(chat)
+        pdf.set_font("Arial", 'B', 11)
+        if pdf.get_x() > pdf.l_margin: pdf.ln()
+        pdf.multi_cell(0, 7, txt=f"Q: {safe_text(q)}")
+        pdf.set_font("Arial", '', 11)
+        if pdf.get_x() > pdf.l_margin: pdf.ln()
+        pdf.multi_cell(0, 7, txt=f"A: {safe_text(a)}")
+        pdf.ln(5)
+        self._fingerprints.append(fingerprint)
+
+    def render(self, history):
+        """
+        Returns:
+        - bytes: the PDF report of history
+        """
+        try:
+            with self._lock, span("generate_pdf_report", turns=len(history)) as s:
+                fingerprints = [entry_fingerprint(chat) for chat in history]
+                if self._pdf is None or fingerprints[:len(self._fingerprints)] != self._fingerprints:
+                    self._start()
+                new = len(fingerprints) - len(self._fingerprints)
+                for chat, fingerprint in zip(history[len(self._fingerprints):], fingerprints[len(self._fingerprints):]):
+                    self._append(chat, fingerprint)
+                s.set(new_turns=new, cached=self._rendered_version == self.version)
+                if self._rendered_version != self.version:
+                    # output() closes the document, so render a copy and keep appending to the original.
+                    self._rendered = bytes(copy.deepcopy(self._pdf).output())
+                    self._rendered_version = self.version
+                s.set(bytes=len(self._rendered))
+                return self._rendered
+        except Exception as e:
+            raise customexception(e, sys)
+
+
+class ReportStore:
+    """
+    One ReportBuilder per document, e.g. kept in a Streamlit session.
+    """
+
+    def __init__(self):
+        self._builders = {}
+
+    def render(self, doc_name, history):
+        if doc_name not in self._builders:
+            self._builders[doc_name] = ReportBuilder(doc_name)
+        return self._builders[doc_name].render(history)
+
+    def archive(self, histories):
+        """
+        Returns:
+        - bytes: a ZIP with one "<document>.pdf" report per non-empty history in
+          histories ({document name: history})
+        """
+        buffer = io.BytesIO()
+        # PDF content streams are already compressed.
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as archive:
+            for doc_name, history in histories.items():
+                if history:
+                    archive.writestr(f"{doc_name}.pdf", self.render(doc_name, history))
+        return buffer.getvalue()
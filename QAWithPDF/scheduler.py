@@ -0,0 +1,517 @@
+import contextlib
+import contextvars
+import hashlib
+import heapq
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+import weakref
+from concurrent.futures import Future
+from typing import Any
+
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.llms import CustomLLM
+from llama_index.core.llms.callbacks import llm_chat_callback, llm_completion_callback
+
+from QAWithPDF.exception import customexception
+from QAWithPDF.ratelimit import RateLimiter, call_with_backoff
+from QAWithPDF.tracing import count_tokens, current_span, metrics, span
+from logger import logging
+
+DEFAULT_RPM = float(os.getenv("SMARTDOC_LLM_RPM", "60"))
+DEFAULT_TPM = float(os.getenv("SMARTDOC_LLM_TPM", "1000000"))
+DEFAULT_CONCURRENCY = int(os.getenv("SMARTDOC_LLM_CONCURRENCY", "4"))
+# Lower runs first: interactive chat before precomputed quiz / mind map / summary.
+INTERACTIVE, BACKGROUND = 0, 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+_priority = contextvars.ContextVar("smartdoc_llm_priority", default=INTERACTIVE)
+_usage = contextvars.ContextVar("smartdoc_llm_usage", default=None)
+
+
+@contextlib.contextmanager
+def priority(level):
+    """
+    Runs the LLM calls made inside the block at the given priority.
+
+        with priority(BACKGROUND):
+            query_engine.query(prompt)
+    """
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class TokenUsage:
+    """
+    Prompt and completion tokens of the LLM calls made inside track_usage(),
+    counted with llama-index's default tokenizer, so close to but not exactly
+    Gemini's own count. calls counts LLM requests, including coalesced ones.
+    """
+
+    def __init__(self):
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def add(self, prompt_tokens=0, completion_tokens=0, calls=0):
+        with self._lock:
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+            self.calls += calls
+
+    @property
+    def total_tokens(self):
+        return self.prompt_tokens + self.completion_tokens
+
+    def to_dict(self):
+        return {"prompt_tokens": self.prompt_tokens, "completion_tokens": self.completion_tokens, "calls": self.calls}
+
+
+@contextlib.contextmanager
+def track_usage():
+    """
+    Collects the token usage of the LLM calls started inside the block. A stream
+    started inside it keeps adding its completion tokens until it is consumed. A
+    call that joins an identical one in flight counts the shared call's tokens,
+    while the llm_tokens metrics count each upstream call once.
+    llama-index streaming responses make their LLM call lazily, so consume them
+    inside the block.
+
+        with track_usage() as usage:
+            response = query_engine.query(prompt)
+        usage.prompt_tokens, usage.completion_tokens
+    """
+    usage = TokenUsage()
+    token = _usage.set(usage)
+    try:
+        yield usage
+    finally:
+        _usage.reset(token)
+
+
+def _count_prompt(text):
+    tokens = count_tokens(text)
+    usage = _usage.get()
+    if usage is not None:
+        usage.add(prompt_tokens=tokens, calls=1)
+    return tokens, usage
+
+
+def _count_completion(usage, text):
+    if usage is not None:
+        usage.add(completion_tokens=count_tokens(text))
+
+
+def _metered(fn, prompt_tokens, text_of):
+    """
+    Wraps the upstream call fn so the llm_tokens metrics count it once, however
+    many callers share it.
+    """
+    def call():
+        metrics.increment("llm_tokens", "prompt", prompt_tokens)
+        result = fn()
+        metrics.increment("llm_tokens", "completion", count_tokens(text_of(result)))
+        return result
+
+    return call
+
+
+def _metered_stream(stream, prompt_tokens, text_of):
+    metrics.increment("llm_tokens", "prompt", prompt_tokens)
+    last = None
+    try:
+        for item in stream:
+            last = item
+            yield item
+    finally:
+        metrics.increment("llm_tokens", "completion", count_tokens(text_of(last)) if last is not None else 0)
+
+
+def _counted(stream, usage, text_of, detach):
+    # Streamed responses carry the text so far, so the last one holds the completion.
+    last = None
+    try:
+        for item in stream:
+            last = item
+            yield item
+    finally:
+        # Runs when the consumer drains or closes the generator, e.g. on a Streamlit rerun.
+        detach()
+        _count_completion(usage, text_of(last) if last is not None else "")
+
+
+class SharedStream:
+    """
+    Lets several consumers iterate one token stream. Items are pulled from the
+    source once and buffered, so a consumer that joins late replays from the start.
+    on_done is called once the source is exhausted or fails, or once every
+    attached consumer has detached before the end. An abandoned stream closes its
+    source, and like a failed one can no longer be attached.
+    """
+
+    def __init__(self, source, on_done=None):
+        self._source = iter(source)
+        self._items = []
+        self._done = False
+        self._error = None
+        self._on_done = on_done
+        self._consumers = 0
+        # Reentrant: a consumer's generator may be collected while this thread holds it.
+        self._lock = threading.RLock()
+
+    def _finish(self, error=None):
+        self._done, self._error = True, error
+        if self._on_done:
+            self._on_done()
+
+    def attach(self):
+        """
+        Registers a consumer.
+
+        Returns:
+        - callable that detaches it again (safe to call twice), or None when the
+          stream has failed or been abandoned
+        """
+        with self._lock:
+            if self._error is not None:
+                return None
+            self._consumers += 1
+        detached = []
+
+        def detach():
+            if detached:
+                return
+            detached.append(True)
+            with self._lock:
+                self._consumers -= 1
+                if self._consumers or self._done:
+                    return
+                try:
+                    close = getattr(self._source, "close", None)
+                    if close:
+                        close()
+                except ValueError:
+                    # Collected while this thread is pulling from the source.
+                    pass
+                self._finish(RuntimeError("Stream abandoned by all consumers"))
+
+        return detach
+
+    def __iter__(self):
+        position = 0
+        while True:
+            with self._lock:
+                if position < len(self._items):
+                    item = self._items[position]
+                elif self._done:
+                    if self._error is not None:
+                        raise self._error
+                    return
+                else:
+                    try:
+                        item = next(self._source)
+                    except StopIteration:
+                        self._finish()
+                        return
+                    except Exception as e:
+                        self._finish(e)
+                        raise
+                    self._items.append(item)
+            position += 1
+            yield item
+
+
+def _primed(stream):
+    """
+    Pulls the first item, so the request has really been sent (and failed, if it
+    is going to) before the stream is handed out.
+    """
+    iterator = iter(stream)
+    try:
+        first = next(iterator)
+    except StopIteration:
+        return iter(())
+    return _resumed(first, iterator)
+
+
+def _resumed(first, iterator):
+    # Closing this also closes the underlying stream and its HTTP response.
+    try:
+        yield first
+        yield from iterator
+    finally:
+        close = getattr(iterator, "close", None)
+        if close:
+            close()
+
+
+class _Request:
+    def __init__(self, key, fn, level, tokens):
+        self.key = key
+        self.fn = fn
+        self.priority = level
+        self.tokens = tokens
+        self.future = Future()
+        self.enqueued = time.perf_counter()
+        # The submitter's span, e.g. synthesis; the worker's llm_request nests under it.
+        self.parent = current_span()
+
+
+class LLMScheduler:
+    """
+    Process-wide gate in front of the LLM.
+
+    - Single flight: a request whose key matches one already queued or running
+      waits for that request's result instead of making its own call.
+    - Rate limits: token buckets for requests per minute and prompt tokens per
+      minute.
+    - Retries: rate-limit errors are retried with jittered backoff.
+    - Priorities: max_concurrency workers always take the queued request with the
+      lowest priority value first, so interactive chat overtakes background jobs.
+      Requests stay queued until their rate-limit quota is available, so this
+      holds when the limits are exhausted too.
+
+    Queue depth and in-flight requests are exported as gauges and queue wait time
+    as the llm_queue_wait stage histogram.
+    """
+
+    def __init__(self, rpm=DEFAULT_RPM, tpm=DEFAULT_TPM, max_concurrency=DEFAULT_CONCURRENCY, max_retries=5):
+        self.max_retries = max_retries
+        self._requests = RateLimiter(rpm / 60, burst=max(1.0, rpm)) if rpm else RateLimiter(0)
+        self._tokens = RateLimiter(tpm / 60, burst=max(1.0, tpm)) if tpm else RateLimiter(0)
+        self._queue = []
+        self._inflight = {}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._running = 0
+        self.coalesced = 0
+        self.completed = 0
+        for i in range(max(1, max_concurrency)):
+            threading.Thread(target=self._worker, name=f"llm-scheduler-{i}", daemon=True).start()
+
+    def _update_gauges(self):
+        metrics.set_gauge("llm_queue_depth", len(self._queue), "LLM requests waiting in the scheduler queue.")
+        metrics.set_gauge("llm_in_flight", self._running, "LLM requests currently being sent.")
+
+    def submit(self, key, fn, level=None, tokens=1):
+        """
+        Queues fn() unless a request with the same key is already pending.
+
+        Returns:
+        - concurrent.futures.Future with fn's result
+        """
+        level = _priority.get() if level is None else level
+        with self._cond:
+            request = self._inflight.get(key) if key is not None else None
+            if request is not None:
+                self.coalesced += 1
+                metrics.increment("llm_request", "coalesced")
+                if level < request.priority:
+                    # A waiting interactive caller lifts a queued background request.
+                    request.priority = level
+                    self._queue = [(level if r is request else p, seq, r) for p, seq, r in self._queue]
+                    heapq.heapify(self._queue)
+                return request.future
+            request = _Request(key, fn, level, tokens)
+            if key is not None:
+                self._inflight[key] = request
+            heapq.heappush(self._queue, (request.priority, next(self._seq), request))
+            self._update_gauges()
+            self._cond.notify()
+        return request.future
+
+    def call(self, key, fn, level=None, tokens=1):
+        return self.submit(key, fn, level, tokens).result()
+
+    def release(self, key):
+        """
+        Ends single flight for key, e.g. once a shared stream has been consumed.
+        """
+        with self._cond:
+            self._inflight.pop(key, None)
+
+    def _admit(self, request):
+        """
+        Spends the request's rate-limit quota if it is available now. Returns 0, or
+        the seconds until it will be. Called with _cond held, so workers spend the
+        quota one at a time.
+        """
+        wait = max(self._requests.available_in(), self._tokens.available_in(request.tokens))
+        if not wait:
+            self._requests.acquire()
+            self._tokens.acquire(request.tokens)
+        return wait
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while True:
+                    while not self._queue:
+                        self._cond.wait()
+                    _, _, request = self._queue[0]
+                    wait = self._admit(request)
+                    if not wait:
+                        break
+                    # Out of quota: the request stays queued, so one submitted meanwhile
+                    # with a higher priority is taken first once quota is back.
+                    self._cond.wait(wait)
+                heapq.heappop(self._queue)
+                self._running += 1
+                self._update_gauges()
+            wait = time.perf_counter() - request.enqueued
+            metrics.observe("llm_queue_wait", wait)
+            try:
+                with span("llm_request", parent=request.parent,
+                          priority=PRIORITY_NAMES.get(request.priority, request.priority)) as s:
+                    s.set(wait_ms=wait * 1000, prompt_tokens=request.tokens)
+                    result = call_with_backoff(request.fn, max_retries=self.max_retries)
+                request.future.set_result(result)
+            except Exception as e:
+                request.future.set_exception(e)
+                result = None
+            with self._cond:
+                self._running -= 1
+                self.completed += 1
+                # Shared streams stay joinable until they are drained (see release()).
+                if not isinstance(result, SharedStream):
+                    self._inflight.pop(request.key, None)
+                self._update_gauges()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "queue_depth": len(self._queue), "in_flight": self._running, "completed": self.completed,
+                "coalesced": self.coalesced,
+                "queued_background": sum(1 for p, _, _ in self._queue if p == BACKGROUND),
+            }
+
+
+def _request_key(model, method, payload, kwargs):
+    data = json.dumps([model, method, payload, sorted((k, repr(v)) for k, v in kwargs.items())])
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+class ScheduledLLM(CustomLLM):
+    """
+    Wraps an LLM so every completion and chat call goes through an LLMScheduler.
+    Streaming calls are coalesced too: followers replay the leader's SharedStream.
+    Prompt and completion tokens are counted into the llm_tokens metrics and the
+    active track_usage() block.
+
+    Parameters:
+    - llm: the wrapped llama-index LLM, e.g. Gemini
+    - scheduler: LLMScheduler; get_scheduler() when None
+    """
+
+    model: str = ""
+    _llm: Any = PrivateAttr()
+    _scheduler: Any = PrivateAttr()
+
+    def __init__(self, llm, scheduler=None, **kwargs):
+        super().__init__(model=getattr(llm, "model", "") or llm.metadata.model_name, **kwargs)
+        self._llm = llm
+        self._scheduler = scheduler or get_scheduler()
+
+    @classmethod
+    def class_name(cls):
+        return "ScheduledLLM"
+
+    @property
+    def metadata(self):
+        return self._llm.metadata
+
+    @property
+    def llm(self):
+        return self._llm
+
+    @property
+    def scheduler(self):
+        return self._scheduler
+
+    def _call(self, method, payload, fn, prompt, text_of, kwargs):
+        key = _request_key(self.model, method, payload, kwargs)
+        tokens, usage = _count_prompt(prompt)
+        result = self._scheduler.call(key, _metered(fn, tokens, text_of), tokens=max(1, tokens))
+        _count_completion(usage, text_of(result))
+        return result
+
+    def _stream(self, method, payload, fn, prompt, text_of, kwargs):
+        key = _request_key(self.model, method, payload, kwargs)
+        tokens, usage = _count_prompt(prompt)
+        scheduler = self._scheduler
+        while True:
+            shared = scheduler.call(
+                key, lambda: SharedStream(_primed(_metered_stream(fn(), tokens, text_of)),
+                                          on_done=lambda: scheduler.release(key)),
+                tokens=max(1, tokens))
+            detach = shared.attach()
+            if detach is not None:
+                break
+            # Joined a stream that failed or was abandoned meanwhile; its key has been
+            # released, so calling again starts a fresh request.
+        stream = _counted(shared, usage, text_of, detach)
+        # A generator that is never started does not run its finally block.
+        weakref.finalize(stream, detach)
+        return stream
+
+    @staticmethod
+    def _completion_text(response):
+        return response.text or ""
+
+    @staticmethod
+    def _chat_text(response):
+        return response.message.content or ""
+
+    @llm_completion_callback()
+    def complete(self, prompt, formatted=False, **kwargs):
+        return self._call("complete", [prompt, formatted], lambda: self._llm.complete(prompt, formatted=formatted, **kwargs),
+                          prompt, self._completion_text, kwargs)
+
+    @llm_completion_callback()
+    def stream_complete(self, prompt, formatted=False, **kwargs):
+        return self._stream("stream_complete", [prompt, formatted],
+                            lambda: self._llm.stream_complete(prompt, formatted=formatted, **kwargs),
+                            prompt, self._completion_text, kwargs)
+
+    @staticmethod
+    def _messages_payload(messages):
+        return [[str(message.role), message.content or ""] for message in messages]
+
+    @llm_chat_callback()
+    def chat(self, messages, **kwargs):
+        payload = self._messages_payload(messages)
+        return self._call("chat", payload, lambda: self._llm.chat(messages, **kwargs),
+                          "".join(content for _, content in payload), self._chat_text, kwargs)
+
+    @llm_chat_callback()
+    def stream_chat(self, messages, **kwargs):
+        payload = self._messages_payload(messages)
+        return self._stream("stream_chat", payload, lambda: self._llm.stream_chat(messages, **kwargs),
+                            "".join(content for _, content in payload), self._chat_text, kwargs)
+
+
+_default_scheduler = None
+_default_lock = threading.Lock()
+
+
+def get_scheduler():
+    """
+    Returns the process-wide LLMScheduler configured by SMARTDOC_LLM_RPM,
+    SMARTDOC_LLM_TPM and SMARTDOC_LLM_CONCURRENCY.
+    """
+    global _default_scheduler
+    with _default_lock:
+        if _default_scheduler is None:
+            try:
+                _default_scheduler = LLMScheduler()
+                logging.info(f"LLM scheduler: {DEFAULT_RPM:g} rpm, {DEFAULT_TPM:g} tpm, {DEFAULT_CONCURRENCY} workers")
+            except Exception as e:
+                raise customexception(e, sys)
+        return _default_scheduler
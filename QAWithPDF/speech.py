@@ -0,0 +1,249 @@
+import hashlib
+import importlib
+import io
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from QAWithPDF.exception import customexception
+from QAWithPDF.streaming import split_sentences
+from QAWithPDF.tracing import span
+from logger import logging
+
+DEFAULT_CACHE_DIR = os.path.join(os.getcwd(), "storage", "tts")
+DEFAULT_BACKEND = os.getenv("SMARTDOC_TTS", "gtts")
+DEFAULT_CONCURRENCY = int(os.getenv("SMARTDOC_TTS_CONCURRENCY", "4"))
+DEFAULT_MAX_BYTES = int(os.getenv("SMARTDOC_TTS_CACHE_MB", "256")) * 1024 * 1024
+# Sentences after the first are packed into segments of up to this many characters,
+# so a long report is not one request per short sentence.
+SEGMENT_CHARS = 300
+
+
+def speech_key(text, lang, slow):
+    """
+    Cache key of one segment: a hash of (text, language, slow).
+    """
+    return hashlib.sha256(f"{lang}\0{int(bool(slow))}\0{text}".encode("utf-8")).hexdigest()
+
+
+def split_segments(text, max_chars=SEGMENT_CHARS):
+    """
+    Splits text into speech segments at sentence boundaries. The first sentence is
+    its own segment so playback can start as early as possible; later sentences
+    are packed together up to max_chars.
+    """
+    sentences = split_sentences(text or "")
+    if not sentences:
+        return []
+    segments = [sentences[0]]
+    current = ""
+    for sentence in sentences[1:]:
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            segments.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        segments.append(current)
+    return segments
+
+
+class SpeechCache:
+    """
+    On-disk cache of synthesized segments, one MP3 file per speech_key under
+    cache_dir. Files are written to a temp name and renamed, so readers never see
+    a partial segment. A hit bumps the file's mtime, and once the segments take
+    more than max_bytes the least recently used ones are deleted.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._bytes = sum(size for _, _, size in self.entries())
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.mp3")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                audio = f.read()
+            os.utime(path)
+            return audio
+        except FileNotFoundError:
+            return None
+
+    def put(self, key, audio):
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(audio)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._bytes += len(audio)
+            if self._bytes > self.max_bytes:
+                self._evict()
+
+    def entries(self):
+        """
+        Returns:
+        - List[(path, last_used, size_bytes)] of the cached segments, oldest first
+        """
+        found = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".mp3"):
+                path = os.path.join(self.cache_dir, name)
+                try:
+                    found.append((path, os.path.getmtime(path), os.path.getsize(path)))
+                except FileNotFoundError:
+                    pass
+        found.sort(key=lambda entry: entry[1])
+        return found
+
+    def _evict(self):
+        # Recounted from disk: other processes may share the directory.
+        entries = self.entries()
+        total = sum(size for _, _, size in entries)
+        for path, _, size in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            self.evictions += 1
+        self._bytes = total
+
+
+class GTTSBackend:
+    """
+    gTTS as a backend(text, lang, slow) -> MP3 bytes callable.
+    """
+
+    def __call__(self, text, lang, slow):
+        from gtts import gTTS
+        fp = io.BytesIO()
+        gTTS(text=text, lang=lang, slow=slow).write_to_fp(fp)
+        return fp.getvalue()
+
+
+class SpeechJob:
+    """
+    Segments of one text being synthesized in the background, in reading order.
+    """
+
+    def __init__(self, segments, futures):
+        self.segments = segments
+        self.futures = futures
+
+    def __len__(self):
+        return len(self.futures)
+
+    def first(self):
+        """
+        MP3 bytes of the first segment, as soon as that segment is ready.
+        """
+        return self.futures[0].result() if self.futures else b""
+
+    def iter_audio(self, start=0):
+        """
+        MP3 bytes of each segment from index start on, as each one is ready.
+        """
+        for future in self.futures[start:]:
+            yield future.result()
+
+    def rest(self):
+        """
+        The clip after the first segment, to play once first() has been played.
+        """
+        return b"".join(self.iter_audio(1))
+
+    def audio(self):
+        """
+        The whole clip. MP3 frames can be concatenated as they are, so the segments
+        are joined straight into one bytes object.
+        """
+        return b"".join(self.iter_audio())
+
+
+class SpeechService:
+    """
+    Sentence-segmented, cached and concurrent text-to-speech.
+
+    synthesize() splits the text, then synthesizes the segments on a pool of at
+    most max_concurrency threads, reusing any segment already in the SpeechCache.
+    It returns a SpeechJob immediately, so the first segment can be played while
+    the rest are still being produced.
+
+    Parameters:
+    - backend: callable (text, lang, slow) -> MP3 bytes, e.g. GTTSBackend() or
+      fakes.FakeSpeech()
+    - cache: optional SpeechCache
+    """
+
+    def __init__(self, backend, cache=None, max_concurrency=DEFAULT_CONCURRENCY):
+        self.backend = backend
+        self.cache = cache
+        self._pool = ThreadPoolExecutor(max_workers=max(1, max_concurrency), thread_name_prefix="tts")
+
+    def _segment_audio(self, text, lang, slow):
+        key = speech_key(text, lang, slow)
+        with span("text_to_speech", chars=len(text), lang=lang) as s:
+            audio = self.cache.get(key) if self.cache else None
+            s.set(cached=audio is not None)
+            if audio is None:
+                audio = self.backend(text, lang, slow)
+                if self.cache:
+                    self.cache.put(key, audio)
+            s.set(bytes=len(audio))
+        return audio
+
+    def synthesize(self, text, lang="en", slow=False):
+        """
+        Returns:
+        - SpeechJob whose segments are being synthesized in the background
+        """
+        try:
+            segments = split_segments(text)
+            futures = [self._pool.submit(self._segment_audio, segment, lang, slow) for segment in segments]
+            return SpeechJob(segments, futures)
+        except Exception as e:
+            raise customexception(e, sys)
+
+
+def load_speech_backend(name=DEFAULT_BACKEND):
+    """
+    Returns the backend callable for "gtts", "fake" or "package.module:factory".
+    """
+    if name == "gtts":
+        return GTTSBackend()
+    if name == "fake":
+        from QAWithPDF.fakes import FakeSpeech
+        return FakeSpeech()
+    module_name, _, attr = name.partition(":")
+    if not attr:
+        raise ValueError(f"Unknown TTS backend: {name} (expected gtts, fake or module:factory)")
+    return getattr(importlib.import_module(module_name), attr)()
+
+
+_default_service = None
+_default_lock = threading.Lock()
+
+
+def get_speech_service():
+    """
+    Returns the process-wide SpeechService, using the SMARTDOC_TTS backend and
+    ./storage/tts/ as segment cache.
+    """
+    global _default_service
+    with _default_lock:
+        if _default_service is None:
+            _default_service = SpeechService(load_speech_backend(), cache=SpeechCache())
+            logging.info(f"TTS backend: {DEFAULT_BACKEND}")
+        return _default_service
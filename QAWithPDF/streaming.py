@@ -0,0 +1,78 @@
+import re
+
+# A sentence ends at . ! ? (optionally followed by closing quotes/brackets) and
+# whitespace, or at a line break.
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])[\"')\]]*\s+|\n+")
+
+
+def split_sentences(text):
+    """
+    Splits text into sentences, dropping empty pieces.
+    """
+    return [piece.strip() for piece in SENTENCE_BOUNDARY.split(text) if piece.strip()]
+
+
+def split_segments(text):
+    """
+    Splits text at sentence boundaries, keeping the separators so the translated
+    sentences can be joined back with the original spacing and line breaks.
+
+    Returns:
+    - List[(sentence, separator)]; sentence may be empty at the very start
+    """
+    segments, start = [], 0
+    for match in SENTENCE_BOUNDARY.finditer(text):
+        segments.append((text[start:match.start()], match.group()))
+        start = match.end()
+    if start < len(text):
+        segments.append((text[start:], ""))
+    return segments
+
+
+def _sentences(segments):
+    return [sentence.strip() for sentence, _ in segments if sentence.strip()]
+
+
+class SentenceBuffer:
+    """
+    Accumulates streamed tokens and releases whole sentences as soon as they end.
+
+    feed() returns the sentences completed by a token; flush() returns whatever is
+    left once the stream is over. feed_segments() and flush_segments() return
+    (sentence, separator) pairs instead (see split_segments), for callers that
+    rebuild the text with its line breaks and markdown.
+    """
+
+    def __init__(self):
+        self._pending = ""
+
+    def feed_segments(self, token):
+        self._pending += token
+        last_end = None
+        for match in SENTENCE_BOUNDARY.finditer(self._pending):
+            last_end = match.end()
+        if last_end is None:
+            return []
+        complete, self._pending = self._pending[:last_end], self._pending[last_end:]
+        return split_segments(complete)
+
+    def flush_segments(self):
+        rest, self._pending = self._pending, ""
+        return split_segments(rest)
+
+    def feed(self, token):
+        return _sentences(self.feed_segments(token))
+
+    def flush(self):
+        return _sentences(self.flush_segments())
+
+
+def iter_sentences(tokens):
+    """
+    Yields complete sentences from a token generator such as
+    StreamingResponse.response_gen.
+    """
+    buffer = SentenceBuffer()
+    for token in tokens:
+        yield from buffer.feed(token)
+    yield from buffer.flush()
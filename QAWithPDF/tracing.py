@@ -0,0 +1,381 @@
+"""
+Lightweight tracing for the query pipeline.
+
+    with span("retrieval", top_k=2) as s:
+        nodes = retriever.retrieve(question)
+        s.set(chunks=len(nodes))
+
+Each finished span is logged as one structured record (JSON lines when
+SMARTDOC_LOG_FORMAT=json), kept in a bounded in-memory ring for the diagnostics
+panel and added to per-stage latency histograms that render in the Prometheus
+text format. SMARTDOC_TRACING=0 turns span() into a shared no-op.
+"""
+import bisect
+import contextlib
+import contextvars
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from logger import logging
+
+TRACING_ENABLED = os.getenv("SMARTDOC_TRACING", "1") != "0"
+METRICS_FILE = os.getenv("SMARTDOC_METRICS_FILE", os.path.join(os.getcwd(), "storage", "metrics.prom"))
+METRICS_PORT = int(os.getenv("SMARTDOC_METRICS_PORT", "0"))
+METRICS_WRITE_INTERVAL = 10.0
+RECENT_SPANS = 200
+# Seconds; covers cache hits (ms) up to long uncached LLM calls.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+trace_logger = logging.getLogger("smartdoc.trace")
+_current = contextvars.ContextVar("smartdoc_span", default=None)
+_ids = itertools.count(1)
+
+
+def count_tokens(text):
+    """
+    Token count of text with llama-index's default tokenizer. It is not free: span
+    attributes only use it while tracing is enabled.
+    """
+    from llama_index.core.utils import get_tokenizer
+    return len(get_tokenizer()(text or ""))
+
+
+class _Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+
+class Metrics:
+    """
+    Per-stage latency histograms and item counters (tokens, chunks, ...).
+    """
+
+    def __init__(self):
+        self._histograms = {}
+        self._counters = {}
+        self._gauges = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds, error=False, counts=None):
+        with self._lock:
+            histogram = self._histograms.setdefault(stage, _Histogram())
+            histogram.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+            histogram.total += seconds
+            histogram.count += 1
+            if error:
+                self._counters[(stage, "errors")] = self._counters.get((stage, "errors"), 0) + 1
+            for kind, value in (counts or {}).items():
+                self._counters[(stage, kind)] = self._counters.get((stage, kind), 0) + value
+
+    def increment(self, stage, kind, value=1):
+        with self._lock:
+            self._counters[(stage, kind)] = self._counters.get((stage, kind), 0) + value
+
+    def set_gauge(self, name, value, help_text=""):
+        """
+        Sets the current value of smartdoc_<name>, e.g. a queue depth.
+        """
+        with self._lock:
+            self._gauges[name] = (value, help_text)
+
+    def render(self):
+        """
+        Returns the metrics in the Prometheus text exposition format.
+        """
+        lines = [
+            "# HELP smartdoc_stage_duration_seconds Latency of each pipeline stage.",
+            "# TYPE smartdoc_stage_duration_seconds histogram",
+        ]
+        with self._lock:
+            for stage, histogram in sorted(self._histograms.items()):
+                cumulative = 0
+                for bound, count in zip(BUCKETS + ("+Inf",), histogram.counts):
+                    cumulative += count
+                    lines.append(f'smartdoc_stage_duration_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'smartdoc_stage_duration_seconds_sum{{stage="{stage}"}} {histogram.total:.6f}')
+                lines.append(f'smartdoc_stage_duration_seconds_count{{stage="{stage}"}} {histogram.count}')
+            lines += [
+                "# HELP smartdoc_stage_items_total Tokens, chunks and other counts attached to stage spans.",
+                "# TYPE smartdoc_stage_items_total counter",
+            ]
+            for (stage, kind), value in sorted(self._counters.items()):
+                lines.append(f'smartdoc_stage_items_total{{stage="{stage}",kind="{kind}"}} {value}')
+            for name, (value, help_text) in sorted(self._gauges.items()):
+                lines += [f"# HELP smartdoc_{name} {help_text}", f"# TYPE smartdoc_{name} gauge", f"smartdoc_{name} {value}"]
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self._gauges.clear()
+
+
+metrics = Metrics()
+_recent = deque(maxlen=RECENT_SPANS)
+_last_write = [0.0]
+
+
+class Span:
+    """
+    One timed pipeline stage. Use span() rather than creating it directly; call
+    end() yourself only for work that outlives a with block, like a token stream.
+    """
+
+    def __init__(self, name, attrs, parent=None):
+        parent = parent or _current.get()
+        self.name = name
+        self.attrs = dict(attrs)
+        self.counts = {}
+        self.span_id = next(_ids)
+        self.parent_id = parent.span_id if parent else None
+        self.trace_id = parent.trace_id if parent else self.span_id
+        self.error = None
+        self.duration = None
+        self._token = None
+        self.start = time.perf_counter()
+        self.started_at = time.time()
+
+    def set(self, **values):
+        """
+        Attaches attributes; int values (tokens, chunks, pages, ...) also feed the
+        smartdoc_stage_items_total counters.
+        """
+        for key, value in values.items():
+            if isinstance(value, int) and not isinstance(value, bool):
+                self.counts[key] = value
+            else:
+                self.attrs[key] = value
+        return self
+
+    def end(self, error=None):
+        if self.duration is not None:
+            return
+        self.duration = time.perf_counter() - self.start
+        self.error = error
+        record = self.to_dict()
+        _recent.append(record)
+        metrics.observe(self.name, self.duration, error=error is not None, counts=self.counts)
+        trace_logger.info(f"span {self.name} {self.duration * 1000:.1f} ms", extra={"span": record})
+        _maybe_write_metrics()
+
+    def to_dict(self):
+        record = {
+            "name": self.name, "trace_id": self.trace_id, "span_id": self.span_id, "parent_id": self.parent_id,
+            "started_at": self.started_at, "duration_ms": (self.duration or 0.0) * 1000,
+        }
+        record.update(self.attrs)
+        record.update(self.counts)
+        if self.error is not None:
+            record["error"] = self.error
+        return record
+
+    @contextlib.contextmanager
+    def activate(self):
+        """
+        Makes this span the parent of spans started in the block, without ending it.
+        """
+        token = _current.set(self)
+        try:
+            yield self
+        finally:
+            _current.reset(token)
+
+    def __enter__(self):
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current.reset(self._token)
+        self.end(error=f"{exc_type.__name__}: {exc}" if exc_type else None)
+        return False
+
+
+class _NoopSpan:
+    def set(self, **values):
+        return self
+
+    def end(self, error=None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+def span(name, parent=None, **attrs):
+    """
+    Context manager timing one stage. Returns a shared no-op when tracing is off.
+
+    Parameters:
+    - parent: Span to nest under instead of the current one, for work handed to
+      another thread (see current_span())
+    """
+    if not TRACING_ENABLED:
+        return _NOOP
+    return Span(name, attrs, parent=parent)
+
+
+def current_span():
+    """
+    The innermost open span of this context, or None.
+    """
+    return _current.get()
+
+
+def recent_spans(limit=50):
+    """
+    The most recent finished spans, newest first.
+    """
+    return list(_recent)[::-1][:limit]
+
+
+def stage_summary():
+    """
+    Per-stage count and p50/p95 latency (ms) over the recent spans.
+    """
+    by_stage = {}
+    for record in list(_recent):
+        by_stage.setdefault(record["name"], []).append(record["duration_ms"])
+    summary = []
+    for stage, durations in sorted(by_stage.items()):
+        durations.sort()
+        summary.append({
+            "stage": stage,
+            "count": len(durations),
+            "p50_ms": durations[len(durations) // 2],
+            "p95_ms": durations[min(len(durations) - 1, int(len(durations) * 0.95))],
+        })
+    return summary
+
+
+def write_metrics(path=METRICS_FILE):
+    """
+    Writes the Prometheus text output atomically, e.g. for node_exporter's
+    textfile collector.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(metrics.render())
+    os.replace(tmp_path, path)
+    _last_write[0] = time.monotonic()
+
+
+def _maybe_write_metrics():
+    if not METRICS_FILE or time.monotonic() - _last_write[0] < METRICS_WRITE_INTERVAL:
+        return
+    try:
+        write_metrics(METRICS_FILE)
+    except OSError as e:
+        logging.warning(f"Could not write metrics to {METRICS_FILE}: {e}")
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port=METRICS_PORT):
+    """
+    Serves /metrics on port from a daemon thread. Does nothing when port is 0 or
+    the server is already running, so it is safe to call on every app rerun.
+    """
+    global _server
+    if not port:
+        return None
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+            except OSError as e:
+                logging.warning(f"Metrics server not started on port {port}: {e}")
+                return None
+            threading.Thread(target=_server.serve_forever, name="smartdoc-metrics", daemon=True).start()
+            logging.info(f"Serving Prometheus metrics on :{port}/metrics")
+    return _server
+
+
+def traced_query(query_engine, prompt):
+    """
+    Runs query_engine.query(prompt) as separate retrieval and synthesis spans.
+    For a streaming engine, the synthesis span stays open until the token stream
+    is exhausted, so it covers generation rather than just the first byte. The
+    scheduler's llm_request spans nest under synthesis.
+    """
+    from llama_index.core.base.response.schema import StreamingResponse
+    from llama_index.core.schema import QueryBundle
+
+    if not TRACING_ENABLED or not hasattr(query_engine, "synthesize"):
+        return query_engine.query(prompt)
+    query_bundle = QueryBundle(prompt)
+    with span("retrieval") as s:
+        nodes = query_engine.retrieve(query_bundle)
+        s.set(chunks=len(nodes), context_tokens=sum(n.node.metadata.get("tokens") or count_tokens(n.node.get_content())
+                                                        for n in nodes))
+    synthesis = Span("synthesis", {"streaming": False})
+    synthesis.set(prompt_tokens=count_tokens(prompt))
+    try:
+        # LLM calls made while synthesizing nest under this span.
+        with synthesis.activate():
+            response = query_engine.synthesize(query_bundle, nodes)
+    except Exception as e:
+        synthesis.end(error=f"{type(e).__name__}: {e}")
+        raise
+    if not isinstance(response, StreamingResponse) or response.response_gen is None:
+        synthesis.set(output_tokens=count_tokens(str(response)))
+        synthesis.end()
+        return response
+
+    synthesis.attrs["streaming"] = True
+    tokens = iter(response.response_gen)
+
+    def gen():
+        output = []
+        error = None
+        try:
+            while True:
+                # The LLM request starts on the first pull, so pulls run under the span.
+                with synthesis.activate():
+                    token = next(tokens, None)
+                if token is None:
+                    break
+                if not output:
+                    synthesis.set(first_token_ms=(time.perf_counter() - synthesis.start) * 1000)
+                output.append(token)
+                yield token
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            synthesis.set(output_tokens=count_tokens("".join(output)))
+            synthesis.end(error=error)
+
+    response.response_gen = gen()
+    return response
@@ -0,0 +1,224 @@
+import hashlib
+import importlib
+import os
+import sqlite3
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from QAWithPDF.exception import customexception
+from QAWithPDF.ratelimit import RateLimiter, call_with_backoff
+from QAWithPDF.streaming import split_segments
+from QAWithPDF.tracing import span
+from logger import logging
+
+DEFAULT_CACHE_PATH = os.path.join(os.getcwd(), "storage", "translation_cache.sqlite3")
+DEFAULT_BACKEND = os.getenv("SMARTDOC_TRANSLATOR", "google")
+DEFAULT_CONCURRENCY = int(os.getenv("SMARTDOC_TRANSLATE_CONCURRENCY", "4"))
+# Requests per second sent to the translation backend; 0 disables the limit.
+DEFAULT_RATE = float(os.getenv("SMARTDOC_TRANSLATE_RPS", "5"))
+LANGUAGE_CODES = {"English": "en", "Spanish": "es", "French": "fr", "German": "de", "Hindi": "hi", "Telugu": "te"}
+
+
+def language_code(target_lang):
+    """
+    Maps an Output Language name ("Spanish") to its code ("es"); codes pass through.
+    """
+    return LANGUAGE_CODES.get(target_lang, target_lang)
+
+
+def translation_key(target_code, text):
+    """
+    Cache key of one sentence: the target language plus a hash of the text.
+    """
+    return hashlib.sha256(f"{target_code}\0{text}".encode("utf-8")).hexdigest()
+
+
+class TranslationCache:
+    """
+    Persistent (text hash, target language) -> translation cache in a SQLite file.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS translations (key TEXT PRIMARY KEY, translation TEXT NOT NULL)")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get_many(self, keys):
+        """
+        Returns:
+        - dict mapping each cached key to its translation; missing keys are absent
+        """
+        found = {}
+        conn = self._connect()
+        keys = list(keys)
+        for start in range(0, len(keys), 500):
+            part = keys[start:start + 500]
+            rows = conn.execute(
+                f"SELECT key, translation FROM translations WHERE key IN ({','.join('?' * len(part))})", part
+            ).fetchall()
+            found.update(rows)
+        return found
+
+    def put_many(self, items):
+        conn = self._connect()
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO translations (key, translation) VALUES (?, ?)", list(items))
+
+
+class GoogleTranslatorBackend:
+    """
+    deep_translator's GoogleTranslator as a backend(text, target_code) callable.
+    GoogleTranslator keeps request state on the instance, so one client is reused
+    per thread and target language rather than built per call.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def __call__(self, text, target_code):
+        clients = self._local.__dict__.setdefault("clients", {})
+        if target_code not in clients:
+            from deep_translator import GoogleTranslator
+            clients[target_code] = GoogleTranslator(source="auto", target=target_code)
+        return clients[target_code].translate(text)
+
+
+class TranslationService:
+    """
+    Sentence-level, cached and concurrent translation.
+
+    Text is split into sentences; sentences already in the TranslationCache are
+    reused and the remaining distinct ones are sent to the backend concurrently,
+    at most max_concurrency at a time and no more than rate requests per second.
+    Rate-limited requests are retried with backoff.
+
+    Parameters:
+    - backend: callable (text, target_code) -> translated text, e.g.
+      GoogleTranslatorBackend() or fakes.FakeTranslator()
+    - cache: optional TranslationCache
+    """
+
+    def __init__(self, backend, cache=None, max_concurrency=DEFAULT_CONCURRENCY, rate=DEFAULT_RATE, max_retries=3):
+        self.backend = backend
+        self.cache = cache
+        self.max_retries = max_retries
+        self._limiter = RateLimiter(rate)
+        self._pool = ThreadPoolExecutor(max_workers=max(1, max_concurrency), thread_name_prefix="translate")
+        # submit() jobs wait on _pool, so they run on their own threads.
+        self._jobs = ThreadPoolExecutor(max_workers=max(1, max_concurrency), thread_name_prefix="translate-job")
+        self._lock = threading.Lock()
+        self.cache_hits = 0
+        self.requests = 0
+
+    def _request(self, sentence, target_code):
+        self._limiter.acquire()
+        with self._lock:
+            self.requests += 1
+        return call_with_backoff(self.backend, sentence, target_code, max_retries=self.max_retries)
+
+    def translate_sentences(self, sentences, target_lang):
+        """
+        Returns:
+        - List[str]: one translation per input sentence, in input order
+        """
+        code = language_code(target_lang)
+        if code == "en":
+            return list(sentences)
+        with span("translation", target=code) as s:
+            keys = [translation_key(code, sentence) for sentence in sentences]
+            found = self.cache.get_many(set(keys)) if self.cache else {}
+            pending = {}
+            for key, sentence in zip(keys, sentences):
+                if key not in found:
+                    pending.setdefault(key, sentence)
+            self.cache_hits += len(keys) - sum(1 for key in keys if key in pending)
+            if pending:
+                results = self._pool.map(lambda key: self._request(pending[key], code), list(pending))
+                new_items = list(zip(pending, results))
+                found.update(new_items)
+                if self.cache:
+                    self.cache.put_many(new_items)
+            s.set(sentences=len(sentences), requests=len(pending), chars=sum(len(x) for x in sentences))
+        return [found[key] for key in keys]
+
+    def translate_many(self, texts, target_lang):
+        """
+        Translates several texts (e.g. a whole chat history) with one pass over
+        their distinct sentences.
+
+        Returns:
+        - List[str]: one translation per input text, in input order
+        """
+        try:
+            if language_code(target_lang) == "en":
+                return list(texts)
+            segmented = [split_segments(text or "") for text in texts]
+            sentences = [sentence.strip() for segments in segmented for sentence, _ in segments if sentence.strip()]
+            translated = iter(self.translate_sentences(sentences, target_lang))
+            out = []
+            for segments in segmented:
+                parts = []
+                for sentence, separator in segments:
+                    parts.append((next(translated) if sentence.strip() else sentence) + separator)
+                out.append("".join(parts))
+            return out
+        except Exception as e:
+            raise customexception(e, sys)
+
+    def translate(self, text, target_lang):
+        return self.translate_many([text], target_lang)[0]
+
+    def submit(self, text, target_lang):
+        """
+        Translates text in the background.
+
+        Returns:
+        - concurrent.futures.Future resolving to the translation
+        """
+        return self._jobs.submit(self.translate, text, target_lang)
+
+    def stats(self):
+        return {"cache_hits": self.cache_hits, "requests": self.requests}
+
+
+def load_translator(name=DEFAULT_BACKEND):
+    """
+    Returns the backend callable for "google", "fake" or "package.module:factory".
+    """
+    if name == "google":
+        return GoogleTranslatorBackend()
+    if name == "fake":
+        from QAWithPDF.fakes import FakeTranslator
+        return FakeTranslator()
+    module_name, _, attr = name.partition(":")
+    if not attr:
+        raise ValueError(f"Unknown translator: {name} (expected google, fake or module:factory)")
+    return getattr(importlib.import_module(module_name), attr)()
+
+
+_default_service = None
+_default_lock = threading.Lock()
+
+
+def get_translation_service():
+    """
+    Returns the process-wide TranslationService, using the SMARTDOC_TRANSLATOR
+    backend and ./storage/translation_cache.sqlite3.
+    """
+    global _default_service
+    with _default_lock:
+        if _default_service is None:
+            _default_service = TranslationService(load_translator(), cache=TranslationCache())
+            logging.info(f"Translation backend: {DEFAULT_BACKEND}")
+        return _default_service
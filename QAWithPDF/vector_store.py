@@ -0,0 +1,335 @@
+import json
+import os
+import shutil
+import sys
+import threading
+
+import numpy as np
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.vector_stores.simple import SimpleVectorStore
+from llama_index.core.vector_stores.types import (
+    DEFAULT_PERSIST_FNAME,
+    BasePydanticVectorStore,
+    VectorStoreQuery,
+    VectorStoreQueryMode,
+    VectorStoreQueryResult,
+)
+from llama_index.core.vector_stores.utils import build_metadata_filter_fn, node_to_metadata_dict
+
+from QAWithPDF.exception import customexception
+from logger import logging
+
+STORE_FORMAT = "mmap_vector_store"
+DEFAULT_NAMESPACE = "default"
+VECTOR_STORE_BACKEND = os.getenv("SMARTDOC_VECTOR_STORE", "simple")
+
+
+def _normalize(matrix):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def top_k(scores, k):
+    """
+    Returns the indices of the k largest scores, best first, using argpartition so
+    the cost is O(n) plus a sort of only k elements.
+    """
+    k = min(k, scores.shape[-1])
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < scores.shape[-1]:
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(scores.shape[-1])
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def _matrix_path(persist_path):
+    base, _ = os.path.splitext(persist_path)
+    return base + ".npy"
+
+
+class MmapVectorStore(BasePydanticVectorStore):
+    """
+    Vector store backed by one contiguous, L2-normalized float32 matrix.
+
+    Persisted as <name>.npy (the matrix, memory-mapped read-only on load) plus the
+    usual <name>.json holding the node-id side table, so a cached index opens without
+    parsing any floats. Because rows are normalized, cosine top-k is a single
+    matrix-vector product followed by argpartition.
+    """
+
+    stores_text: bool = False
+
+    _matrix = PrivateAttr()
+    _pending = PrivateAttr()
+    _ids = PrivateAttr()
+    _ref_doc_ids = PrivateAttr()
+    _metadata = PrivateAttr()
+    _row_of = PrivateAttr()
+    _lock = PrivateAttr()
+
+    def __init__(self, matrix=None, ids=None, ref_doc_ids=None, metadata=None, **kwargs):
+        super().__init__(**kwargs)
+        self._matrix = matrix
+        self._pending = []
+        self._ids = list(ids or [])
+        self._ref_doc_ids = list(ref_doc_ids or [])
+        self._metadata = list(metadata or [{} for _ in self._ids])
+        self._row_of = {node_id: row for row, node_id in enumerate(self._ids)}
+        self._lock = threading.RLock()
+
+    @classmethod
+    def class_name(cls):
+        return "MmapVectorStore"
+
+    @property
+    def client(self):
+        return None
+
+    @property
+    def node_count(self):
+        # Deliberately not __len__: StorageContext tests stores for truthiness.
+        return len(self._ids)
+
+    @property
+    def matrix(self):
+        """
+        The normalized (n, dim) float32 matrix, folding in rows added since the last
+        call. Appends are buffered so inserting nodes one by one stays O(n) overall.
+        """
+        with self._lock:
+            if self._pending:
+                parts = ([np.asarray(self._matrix)] if self._matrix is not None and len(self._matrix) else []) + self._pending
+                self._matrix = np.ascontiguousarray(np.vstack(parts), dtype=np.float32)
+                self._pending = []
+            if self._matrix is None:
+                return np.zeros((0, 0), dtype=np.float32)
+            return self._matrix
+
+    def add(self, nodes, **add_kwargs):
+        if not nodes:
+            return []
+        with self._lock:
+            self._pending.append(_normalize([node.get_embedding() for node in nodes]))
+            for node in nodes:
+                metadata = node_to_metadata_dict(node, remove_text=True, flat_metadata=False)
+                metadata.pop("_node_content", None)
+                self._row_of[node.node_id] = len(self._ids)
+                self._ids.append(node.node_id)
+                self._ref_doc_ids.append(node.ref_doc_id or "None")
+                self._metadata.append(metadata)
+        return [node.node_id for node in nodes]
+
+    def _keep_rows(self, keep):
+        with self._lock:
+            matrix = self.matrix
+            rows = [row for row in range(len(self._ids)) if keep(row)]
+            self._matrix = np.ascontiguousarray(matrix[rows]) if len(matrix) else None
+            self._ids = [self._ids[row] for row in rows]
+            self._ref_doc_ids = [self._ref_doc_ids[row] for row in rows]
+            self._metadata = [self._metadata[row] for row in rows]
+            self._row_of = {node_id: row for row, node_id in enumerate(self._ids)}
+            return rows
+
+    def delete(self, ref_doc_id, **delete_kwargs):
+        self._keep_rows(lambda row: self._ref_doc_ids[row] != ref_doc_id)
+
+    def delete_nodes(self, node_ids=None, filters=None, **delete_kwargs):
+        filter_fn = build_metadata_filter_fn(lambda node_id: self._metadata[self._row_of[node_id]], filters)
+        node_id_set = set(node_ids) if node_ids is not None else None
+
+        def matches(row):
+            node_id = self._ids[row]
+            return (node_id_set is None or node_id in node_id_set) and filter_fn(node_id)
+
+        self._keep_rows(lambda row: not matches(row))
+
+    def clear(self):
+        self._keep_rows(lambda row: False)
+
+    def get(self, text_id):
+        return self.matrix[self._row_of[text_id]].tolist()
+
+    def _candidate_rows(self, query):
+        """
+        Rows allowed by query.node_ids / query.filters, or None when unrestricted.
+        """
+        if query.node_ids is None and query.filters is None:
+            return None
+        filter_fn = build_metadata_filter_fn(lambda node_id: self._metadata[self._row_of[node_id]], query.filters)
+        if query.node_ids is not None:
+            ids = [node_id for node_id in query.node_ids if node_id in self._row_of]
+        else:
+            ids = self._ids
+        return np.array([self._row_of[node_id] for node_id in ids if filter_fn(node_id)], dtype=np.int64)
+
+    def query(self, query, **kwargs):
+        if query.mode != VectorStoreQueryMode.DEFAULT:
+            raise ValueError(f"{self.class_name()} only supports the default query mode, got {query.mode}")
+        matrix = self.matrix
+        rows = self._candidate_rows(query)
+        if len(matrix) == 0 or (rows is not None and len(rows) == 0):
+            return VectorStoreQueryResult(similarities=[], ids=[])
+        q = _normalize(query.query_embedding)
+        scores = (matrix if rows is None else matrix[rows]) @ q
+        best = top_k(scores, query.similarity_top_k)
+        best_rows = best if rows is None else rows[best]
+        return VectorStoreQueryResult(
+            similarities=scores[best].tolist(),
+            ids=[self._ids[row] for row in best_rows],
+        )
+
+    def query_batch(self, query_embeddings, similarity_top_k=2):
+        """
+        Exact cosine top-k for many queries at once with one matrix-matrix product.
+
+        Returns:
+        - List[(similarities, ids)], one pair per query
+        """
+        matrix = self.matrix
+        if len(matrix) == 0:
+            return [([], []) for _ in query_embeddings]
+        scores = _normalize(query_embeddings) @ matrix.T
+        results = []
+        for row_scores in scores:
+            best = top_k(row_scores, similarity_top_k)
+            results.append((row_scores[best].tolist(), [self._ids[row] for row in best]))
+        return results
+
+    def persist(self, persist_path=os.path.join("storage", f"{DEFAULT_NAMESPACE}__{DEFAULT_PERSIST_FNAME}"), fs=None):
+        """
+        Writes the matrix to <persist_path minus .json>.npy and the side table to
+        persist_path. fs is accepted for interface compatibility; only the local
+        filesystem is supported because the matrix is memory-mapped.
+        """
+        try:
+            os.makedirs(os.path.dirname(persist_path) or ".", exist_ok=True)
+            matrix = self.matrix
+            matrix_path = _matrix_path(persist_path)
+            tmp_path = matrix_path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                np.save(f, matrix)
+            os.replace(tmp_path, matrix_path)
+            table = {
+                "format": STORE_FORMAT,
+                "version": 1,
+                "dim": int(matrix.shape[1]) if matrix.ndim == 2 else 0,
+                "matrix_file": os.path.basename(matrix_path),
+                "ids": self._ids,
+                "ref_doc_ids": self._ref_doc_ids,
+                "metadata": self._metadata,
+            }
+            table.update(self._persist_extra(persist_path))
+            with open(persist_path, "w", encoding="utf-8") as f:
+                json.dump(table, f)
+        except Exception as e:
+            raise customexception(e, sys)
+
+    def _persist_extra(self, persist_path):
+        """
+        Hook for subclasses: write any extra files next to persist_path and return
+        keys to add to the side table.
+        """
+        return {}
+
+    def _load_extra(self, persist_path, table):
+        """
+        Hook for subclasses: restore what _persist_extra wrote.
+        """
+
+    @classmethod
+    def from_persist_path(cls, persist_path, fs=None):
+        with open(persist_path, "r", encoding="utf-8") as f:
+            table = json.load(f)
+        if table.get("format") != STORE_FORMAT:
+            raise ValueError(f"{persist_path} is not a {STORE_FORMAT} side table")
+        if cls is MmapVectorStore and table.get("ann") == "ivf":
+            from QAWithPDF.ann_index import IVFVectorStore
+            cls = IVFVectorStore
+        matrix_path = os.path.join(os.path.dirname(persist_path), table["matrix_file"])
+        matrix = np.load(matrix_path, mmap_mode="r") if table["ids"] else None
+        store = cls(matrix=matrix, ids=table["ids"], ref_doc_ids=table["ref_doc_ids"], metadata=table["metadata"])
+        store._load_extra(persist_path, table)
+        return store
+
+    @classmethod
+    def from_persist_dir(cls, persist_dir, namespace=DEFAULT_NAMESPACE, fs=None):
+        return cls.from_persist_path(os.path.join(persist_dir, f"{namespace}__{DEFAULT_PERSIST_FNAME}"))
+
+
+def _persisted_format(persist_path):
+    with open(persist_path, "rb") as f:
+        head = f.read(64)
+    return STORE_FORMAT if f'"format": "{STORE_FORMAT}"'.encode() in head else "simple"
+
+
+def load_vector_store(persist_dir, namespace=DEFAULT_NAMESPACE):
+    """
+    Opens the vector store persisted in persist_dir, whichever backend wrote it.
+    """
+    persist_path = os.path.join(persist_dir, f"{namespace}__{DEFAULT_PERSIST_FNAME}")
+    if _persisted_format(persist_path) == STORE_FORMAT:
+        return MmapVectorStore.from_persist_path(persist_path)
+    return SimpleVectorStore.from_persist_path(persist_path)
+
+
+def create_vector_store(backend=None):
+    """
+    Returns an empty vector store for the configured backend (SMARTDOC_VECTOR_STORE):
+    "simple" for llama-index's JSON store, "mmap" for MmapVectorStore, "ivf" for the
+    approximate IVFVectorStore.
+    """
+    backend = backend or VECTOR_STORE_BACKEND
+    if backend == "simple":
+        return SimpleVectorStore()
+    if backend == "mmap":
+        return MmapVectorStore()
+    if backend == "ivf":
+        from QAWithPDF.ann_index import IVFVectorStore
+        return IVFVectorStore()
+    raise ValueError(f"Unknown vector store backend: {backend}")
+
+
+def convert_simple_store(persist_dir, out_dir=None):
+    """
+    One-shot conversion of a persisted llama-index storage context from the JSON
+    vector store to MmapVectorStore. The docstore, index store and graph store are
+    copied unchanged.
+
+    Parameters:
+    - persist_dir: directory with default__vector_store.json (e.g. storage/)
+    - out_dir: destination, defaults to <persist_dir>_mmap
+
+    Returns:
+    - str: the output directory
+    """
+    try:
+        out_dir = out_dir or persist_dir.rstrip("/\\") + "_mmap"
+        os.makedirs(out_dir, exist_ok=True)
+        simple = SimpleVectorStore.from_persist_dir(persist_dir)
+        data = simple.data
+        ids = list(data.embedding_dict)
+        metadata_dict = data.metadata_dict or {}
+        store = MmapVectorStore(
+            matrix=_normalize([data.embedding_dict[node_id] for node_id in ids]) if ids else None,
+            ids=ids,
+            ref_doc_ids=[data.text_id_to_ref_doc_id.get(node_id, "None") for node_id in ids],
+            metadata=[metadata_dict.get(node_id, {}) for node_id in ids],
+        )
+        for name in os.listdir(persist_dir):
+            if name.endswith(".json") and name != f"{DEFAULT_NAMESPACE}__{DEFAULT_PERSIST_FNAME}":
+                shutil.copy2(os.path.join(persist_dir, name), os.path.join(out_dir, name))
+        store.persist(os.path.join(out_dir, f"{DEFAULT_NAMESPACE}__{DEFAULT_PERSIST_FNAME}"))
+        logging.info(f"Converted {len(ids)} vectors from {persist_dir} to {out_dir}")
+        return out_dir
+    except Exception as e:
+        raise customexception(e, sys)
+
+
+if __name__ == "__main__":
+    # python -m QAWithPDF.vector_store storage notebook/storage
+    for directory in sys.argv[1:] or ["storage", os.path.join("notebook", "storage")]:
+        print(f"{directory} -> {convert_simple_store(directory)}")
@@ -2,18 +2,28 @@ import streamlit as st
 import io
 import time
 import random
-import re
 import json
 from collections import Counter
-from gtts import gTTS
-from fpdf import FPDF
-from deep_translator import GoogleTranslator
-import graphviz 
 
 # NOTE: Ensure these modules exist in your environment
-from QAWithPDF.data_ingestion import load_data
+from QAWithPDF.document_store import get_document_store
 from QAWithPDF.model_api import load_model
-from QAWithPDF.embedding import download_gemini_embedding
+from QAWithPDF.embedding import load_document_nodes
+from QAWithPDF.corpus import CorpusIndex
+from QAWithPDF.index_cache import content_hash
+from QAWithPDF.answer_cache import get_answer_cache, sources_from_response
+from QAWithPDF.streaming import SentenceBuffer
+from QAWithPDF.translation import get_translation_service, language_code
+from QAWithPDF.speech import get_speech_service
+from QAWithPDF.report import ReportStore
+from QAWithPDF.chat_history import get_history_store, new_session_id
+from QAWithPDF.jobs import get_job_runner, DONE, FAILED
+from QAWithPDF.scheduler import get_scheduler, track_usage
+from QAWithPDF.context import context_budget, persona_prompt
+from QAWithPDF.insights import INSIGHTS, DEEP_DIVE_PROMPT, compute_insight, scope_key
+from QAWithPDF.tracing import span, traced_query, recent_spans, stage_summary, start_metrics_server, TRACING_ENABLED
+from QAWithPDF.api_client import get_api_client
+from logger import logging
 
 # ===================== GLOBAL PAGE CONFIG =====================
 st.set_page_config(
@@ -51,64 +61,210 @@ def load_theme_css():
 load_theme_css()
 
 # ===================== HELPER FUNCTIONS =====================
-def extract_xray_data(text):
-    emails = list(set(re.findall(r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}', text)))
-    dates = list(set(re.findall(r'\d{4}-\d{2}-\d{2}|\d{2}/\d{2}/\d{4}', text)))
-    return emails[:5], dates[:5]
-
 def generate_pdf_report(doc_name, history):
-    def safe_text(text):
-        if not text: return ""
-        return text.encode('latin-1', 'replace').decode('latin-1')
-    pdf = FPDF()
-    pdf.add_page()
-    pdf.set_font("Arial", size=12)
-    pdf.set_font("Arial", 'B', 16)
-    pdf.cell(0, 10, txt=safe_text(f"DocQuest Report: {doc_name}"), ln=True, align='C')
-    pdf.ln(10)
-    pdf.set_font("Arial", size=11)
-    for chat in history:
-        if isinstance(chat, dict): q, a = chat.get('q', ''), chat.get('a', '')
-        else: q, a = chat[0], chat[1]
-        pdf.set_font("Arial", 'B', 11)
-        if pdf.get_x() > pdf.l_margin: pdf.ln()
-        pdf.multi_cell(0, 7, txt=f"Q: {safe_text(q)}")
-        pdf.set_font("Arial", '', 11)
-        if pdf.get_x() > pdf.l_margin: pdf.ln()
-        pdf.multi_cell(0, 7, txt=f"A: {safe_text(a)}")
-        pdf.ln(5)
-    return bytes(pdf.output(dest='S'))
-
-def text_to_speech_bytes(text, slow=False):
+    # Builders live in the session, so each export only lays out the new Q/A pairs.
+    return st.session_state.reports.render(doc_name, history)
+
+def text_to_speech_bytes(text, slow=False, lang="en"):
+    try:
+        return io.BytesIO(get_speech_service().synthesize(text, lang, slow).audio())
+    except Exception as e:
+        logging.warning(f"Text-to-speech failed: {e}")
+        return None
+
+def play_answer(text, lang):
+    """Plays the first sentence as soon as it is synthesized, then the rest of the
+    answer once the remaining segments are done."""
     try:
-        tts = gTTS(text=text, lang='en', slow=slow)
-        fp = io.BytesIO()
-        tts.write_to_fp(fp)
-        fp.seek(0)
-        return fp
-    except: return None
+        job = get_speech_service().synthesize(text, lang)
+        if not len(job): return
+        st.audio(job.first(), format="audio/mp3")
+        if len(job) > 1:
+            st.caption("Rest of the answer")
+            st.audio(job.rest(), format="audio/mp3")
+    except Exception as e:
+        st.warning(f"Text-to-speech failed: {e}")
 
 def perform_translation(text, target_lang):
     if target_lang == "English": return text
-    lang_map = {"Spanish": "es", "French": "fr", "German": "de", "Hindi": "hi", "Telugu": "te"}
     try:
-        translator = GoogleTranslator(source='auto', target=lang_map.get(target_lang, "en"))
-        return translator.translate(text)
-    except: return f"[Error] {text}"
+        return get_translation_service().translate(text, target_lang)
+    except Exception as e:
+        logging.warning(f"Translation failed: {e}")
+        return f"[Error] {text}"
+
+def translate_history(history, target_lang):
+    """Re-renders the answers of history entries (e.g. one page read from the history
+    store) in target_lang with one bulk request, reusing the translation cache.
+    Entries keep their English answer in 'a_en'."""
+    stale = [c for c in history if isinstance(c, dict) and c.get("lang", "English") != target_lang and c.get("a_en")]
+    if not stale: return
+    try:
+        translated = get_translation_service().translate_many([c["a_en"] for c in stale], target_lang)
+    except Exception as e:
+        logging.warning(f"History translation failed: {e}")
+        return
+    for chat, text in zip(stale, translated):
+        chat["a"], chat["lang"] = text, target_lang
+
+start_metrics_server()
+# With SMARTDOC_API_URL set, parsing, indexes, models and background jobs live in the
+# smartdoc-api service, and this app is only its frontend.
+API = get_api_client()
 
 # ===================== SESSION STATE =====================
-if "history" not in st.session_state: st.session_state.history = {}
+if "session_id" not in st.session_state:
+    # The session id lives in the URL, so reloading the page or restarting the app keeps the history.
+    st.session_state.session_id = st.query_params.get("session") or new_session_id()
+    st.query_params["session"] = st.session_state.session_id
+if "history_pages" not in st.session_state: st.session_state.history_pages = {}
+if "reports" not in st.session_state: st.session_state.reports = ReportStore()
 if "uploaded_files" not in st.session_state: st.session_state.uploaded_files = []
 if "xray_data" not in st.session_state: st.session_state.xray_data = {}
 if "trigger_processing" not in st.session_state: st.session_state.trigger_processing = False
 if "current_question" not in st.session_state: st.session_state.current_question = ""
-if "quiz_data" not in st.session_state: st.session_state.quiz_data = None 
-if "mindmap_edges" not in st.session_state: st.session_state.mindmap_edges = []
+if "doc_digests" not in st.session_state: st.session_state.doc_digests = {}
 
 # ===================== CACHED FUNCTIONS =====================
+ALL_DOCUMENTS = "📚 All documents"
+
 @st.cache_resource
-def get_query_engine(_model, _document_data, doc_id):
-    return download_gemini_embedding(_model, _document_data)
+def get_corpus():
+    # One shared index for every upload; documents are selected by metadata filter.
+    return CorpusIndex()
+
+def documents_in_scope(docs, selected_file_name):
+    if not docs: return []
+    if selected_file_name == ALL_DOCUMENTS: return list(docs)
+    return [d for d in docs if d.name == selected_file_name]
+
+def scope_of(scope_docs):
+    """Returns [(digest, name, pages)] for the uploads, plus a content hash
+    identifying that scope."""
+    scope = []
+    for d in scope_docs:
+        digest = content_hash(d.getvalue())
+        # Page / section Documents, so chunks follow the document's structure.
+        scope.append((digest, d.name, get_document_store().get_or_parse(d, digest).pages))
+    return scope, scope_key([digest for digest, _, _ in scope])
+
+def get_scoped_query_engine(model, scope_docs, streaming=False, budget=None):
+    """Adds any upload not yet in the shared corpus and returns a query engine filtered
+    to scope_docs, plus a content hash identifying that scope. budget is the number of
+    context tokens packed into each prompt (see context.ContextPacker)."""
+    corpus = get_corpus()
+    scope, scope_digest = scope_of(scope_docs)
+    for digest, name, documents in scope:
+        corpus.ensure_document(digest, lambda: load_document_nodes(model, documents, digest, embed_model=corpus.embed_model),
+                               name=name)
+    return corpus.as_query_engine(doc_ids=[digest for digest, _, _ in scope], llm=model, streaming=streaming,
+                                 context_budget=budget), scope_digest
+
+def schedule_insights(scope_docs, kinds=tuple(INSIGHTS), replace=False):
+    """Queues summary / mind map / quiz jobs for the scope on the background runner
+    and returns the scope id their results are stored under."""
+    scope, scope_id = scope_of(scope_docs)
+    corpus, runner = get_corpus(), get_job_runner()
+    for kind in kinds:
+        runner.submit(scope_id, kind, compute_insight, kind, corpus, scope, replace=replace,
+                      members=[digest for digest, _, _ in scope])
+    return scope_id
+
+def selected_doc_ids(selected_file_name):
+    digests = st.session_state.doc_digests
+    if selected_file_name == ALL_DOCUMENTS: return [digest for _, digest in digests.values()]
+    return [digests[selected_file_name][1]] if selected_file_name in digests else []
+
+def selected_scope_id(selected_file_name):
+    doc_ids = selected_doc_ids(selected_file_name)
+    return scope_key(doc_ids) if doc_ids else None
+
+def insight_job(selected_file_name, kind, replace=False):
+    """Returns the summary / mind map / quiz job of the selected scope, scheduling it
+    again when replace is set."""
+    if API is not None:
+        doc_ids = selected_doc_ids(selected_file_name)
+        return API.insight(kind, doc_ids, replace=replace) if doc_ids else None
+    if replace: schedule_insights(documents_in_scope(docs, selected_file_name), [kind], replace=True)
+    return get_job_runner().get(selected_scope_id(selected_file_name), kind)
+
+def loaded_history(doc_key):
+    """Returns (entries newest first, has_older) for the chat view. Loaded pages are
+    kept in session state, so a rerun only reads the messages added since; see
+    load_older_history."""
+    store, session_id = get_history_store(), st.session_state.session_id
+    loaded = st.session_state.history_pages.get(doc_key)
+    if loaded and loaded["entries"]:
+        newer, more = store.latest(session_id, doc_key, after=loaded["entries"][0]["id"])
+        # More than a page added elsewhere (e.g. another tab): start again from the newest page.
+        if not more:
+            loaded["entries"][:0] = newer
+            return loaded["entries"], loaded["has_older"]
+    entries, has_older = store.latest(session_id, doc_key)
+    st.session_state.history_pages[doc_key] = {"entries": entries, "has_older": has_older}
+    return entries, has_older
+
+def load_older_history(doc_key):
+    """Reads the page before the oldest loaded entry."""
+    loaded = st.session_state.history_pages[doc_key]
+    older, loaded["has_older"] = get_history_store().latest(st.session_state.session_id, doc_key,
+                                                            before=loaded["entries"][-1]["id"])
+    loaded["entries"].extend(older)
+
+def job_result(job, label):
+    """Shows progress for a queued or running job and returns its result once done."""
+    if job is None: return None
+    if job.pending:
+        st.info(f"⏳ {label} is being prepared in the background ({job.elapsed:.0f}s)...")
+        if st.button("🔄 Refresh", key=f"refresh_{job.kind}"): st.rerun()
+        return None
+    if job.status == FAILED: st.error(f"{label} failed: {job.error}")
+    return job.result if job.status == DONE else None
+
+def stream_answer(response, target_lang, placeholder):
+    """Renders a StreamingResponse token by token, or when translating, sends each
+    sentence for translation as soon as it completes and shows the translations in
+    order as they come back. A sentence that fails to translate is shown in English.
+    Returns (english_text, displayed_text)."""
+    tokens, pending = [], []
+    buffer = SentenceBuffer()
+    service = get_translation_service() if target_lang != "English" else None
+
+    def submit(segments):
+        # (future, English sentence, separator); the separators keep line breaks and markdown.
+        for sentence, separator in segments:
+            future = service.submit(sentence.strip(), target_lang) if sentence.strip() else None
+            pending.append((future, sentence, separator))
+
+    def translated(future, sentence, log=False):
+        if future is None: return sentence
+        if future.exception() is not None:
+            if log: logging.warning(f"Translation failed: {future.exception()}")
+            return sentence
+        return future.result()
+
+    def translated_prefix():
+        done = []
+        for future, sentence, separator in pending:
+            if future is not None and not future.done(): break
+            done.append(translated(future, sentence) + separator)
+        return "".join(done)
+
+    for token in response.response_gen:
+        tokens.append(token)
+        if service is None:
+            shown = "".join(tokens)
+        else:
+            submit(buffer.feed_segments(token))
+            shown = translated_prefix()
+        placeholder.markdown(f"<div class='bot-bubble'><strong>A:</strong> {shown}▌</div>", unsafe_allow_html=True)
+    if service is None:
+        shown = "".join(tokens)
+    else:
+        submit(buffer.flush_segments())
+        shown = "".join(translated(future, sentence, log=True) + separator for future, sentence, separator in pending)
+    placeholder.empty()
+    return "".join(tokens), shown
 
 # ===================== SIDEBAR =====================
 with st.sidebar:
@@ -149,11 +305,39 @@ with st.sidebar:
                 st.markdown("**Dates:**")
                 for d in data['dates']: st.markdown(f"`{d}`")
 
+    cache_stats = get_answer_cache().stats()
+    if cache_stats["exact_hits"] + cache_stats["semantic_hits"] + cache_stats["misses"]:
+        st.caption(f"⚡ Answer cache hit rate: {cache_stats['hit_rate']:.0%} ({cache_stats['semantic_hits']} semantic)")
+
+    if TRACING_ENABLED:
+        with st.expander("🩺 Diagnostics", expanded=False):
+            summary = stage_summary()
+            if summary:
+                st.caption("Stage latency over recent requests (ms)")
+                st.dataframe([{k: (round(v, 1) if isinstance(v, float) else v) for k, v in row.items()} for row in summary],
+                             hide_index=True, use_container_width=True)
+                st.caption("Recent spans")
+                st.dataframe([{"stage": r["name"], "ms": round(r["duration_ms"], 1),
+                               **{k: v for k, v in r.items() if k not in ("name", "duration_ms", "trace_id", "span_id", "parent_id", "started_at")}}
+                              for r in recent_spans(20)], hide_index=True, use_container_width=True)
+            else:
+                st.caption("No spans recorded yet.")
+            st.caption("LLM scheduler")
+            try:
+                st.json(API.health()["scheduler"] if API else get_scheduler().stats(), expanded=False)
+            except Exception as e:
+                st.caption(f"Unavailable: {e}")
+
     if st.button("🗑 Clear Session"):
-        st.session_state.history = {}
+        # History is append-only: a new session id starts an empty one.
+        st.session_state.session_id = new_session_id()
+        st.query_params["session"] = st.session_state.session_id
+        st.session_state.history_pages = {}
+        st.session_state.reports = ReportStore()
         st.session_state.xray_data = {}
-        st.session_state.quiz_data = None
-        st.session_state.mindmap_edges = []
+        if API is None:
+            for _, digest in st.session_state.doc_digests.values(): get_job_runner().cancel(digest)
+        st.session_state.doc_digests = {}
         st.cache_resource.clear()
         st.rerun()
 
@@ -166,20 +350,48 @@ st.markdown("## 📘 CognitiveDoc – Smart Document Q&A System")
 st.markdown("### 📤 Upload Document")
 docs = st.file_uploader("", type=["pdf","txt","docx"], accept_multiple_files=True, label_visibility="collapsed")
 
+# Uploads by name -> (size, content hash); a new upload starts its background analysis.
+known_digests = st.session_state.doc_digests
+current_digests = {}
 if docs:
     st.session_state.uploaded_files = [d.name for d in docs]
     for d in docs:
-        if d.name not in st.session_state.xray_data:
+        known = known_digests.get(d.name)
+        # Hashed on every rerun: another file with the same name and size must not reuse the digest.
+        current_digests[d.name] = (d.size, content_hash(d.getvalue()))
+        if API is not None:
+            # The service parses and indexes the upload and queues its insights.
+            if known != current_digests[d.name] or d.name not in st.session_state.xray_data:
+                try:
+                    ingested = API.ingest(d.name, d.getvalue())
+                    st.session_state.xray_data[d.name] = {'emails': ingested['emails'], 'dates': ingested['dates']}
+                except Exception as e:
+                    st.warning(f"Could not upload {d.name}: {e}")
+            continue
+        if known != current_digests[d.name] or d.name not in st.session_state.xray_data:
+            try:
+                parsed = get_document_store().get_or_parse(d, current_digests[d.name][1])
+                st.session_state.xray_data[d.name] = {'emails': parsed.emails, 'dates': parsed.dates}
+            except Exception as e:
+                st.warning(f"Could not read {d.name}: {e}")
+        if known != current_digests[d.name]:
             try:
-                raw_text = d.getvalue().decode('utf-8', errors='ignore')
-                emails, dates = extract_xray_data(raw_text)
-                st.session_state.xray_data[d.name] = {'emails': emails, 'dates': dates}
-            except: pass
+                schedule_insights([d])
+            except Exception as e:
+                st.warning(f"Could not analyze {d.name}: {e}")
+# Documents on the API service may be shared with other sessions, so they stay there.
+for name, (_, digest) in (known_digests.items() if API is None else ()):
+    if current_digests.get(name, (None, None))[1] != digest:
+        # Cancel first, so no job of a scope containing the document indexes it again.
+        get_job_runner().cancel(digest)
+        get_corpus().remove_document(digest)
+st.session_state.doc_digests = current_digests
 
 if st.session_state.uploaded_files:
     col_sel, col_lang = st.columns([3, 1])
     with col_sel:
-        selected_file_name = st.selectbox("Select Active Document", st.session_state.uploaded_files)
+        scopes = st.session_state.uploaded_files + ([ALL_DOCUMENTS] if len(st.session_state.uploaded_files) > 1 else [])
+        selected_file_name = st.selectbox("Select Active Document", scopes)
     with col_lang:
         target_lang = st.selectbox("Output Language", ["English", "Spanish", "French", "German", "Hindi", "Telugu"])
 else:
@@ -192,6 +404,13 @@ if menu_selection == "💬 Chat Intelligence":
     st.markdown(f"## 💬 Chat Intelligence")
     if selected_file_name:
         st.caption(f"Analyzing: {selected_file_name}")
+        try:
+            summary_job = insight_job(selected_file_name, "summary")
+        except Exception as e:
+            summary_job = None
+            logging.warning(f"Summary unavailable: {e}")
+        if summary_job is not None and summary_job.status == DONE:
+            with st.expander("📝 Summary"): st.markdown(summary_job.result)
         
         # Suggestions & Deep Dive
         suggestions = ["Summarize main points", "What is this doc about", "List some features"]
@@ -216,60 +435,112 @@ if menu_selection == "💬 Chat Intelligence":
             else:
                 status_box = st.status("🧠 Processing...", expanded=True)
                 try:
-                    doc_obj = next((d for d in docs if d.name == selected_file_name), None)
-                    if doc_obj:
-                        document_data = load_data(doc_obj)
-                        if not isinstance(document_data, list): document_data = [document_data]
-                        document_data = [d for d in document_data if getattr(d, "text", None)]
-                        
+                    scope_docs = documents_in_scope(docs, selected_file_name)
+                    if scope_docs and API is not None:
+                        # The service applies the persona, packs the context and caches answers.
+                        if st.session_state.current_question == "CONDUCT_DEEP_DIVE":
+                            status_box.write("🕵️ Running deep investigation...")
+                            question, api_persona = DEEP_DIVE_PROMPT, "Deep Dive"
+                        else:
+                            question, api_persona = st.session_state.current_question, persona
+                        doc_ids = selected_doc_ids(selected_file_name)
+                        response = API.stream_query(question, doc_ids, api_persona)
+                        english_text, response_text = stream_answer(response, target_lang, st.empty())
+                        sources, usage, doc_digest = response.sources, response.usage, scope_key(doc_ids)
+                        if response.cached: status_box.write("⚡ Answer served from cache")
+                    elif scope_docs:
                         model = load_model()
-                        query_engine = get_query_engine(model, document_data, selected_file_name)
-                        
                         if st.session_state.current_question == "CONDUCT_DEEP_DIVE":
                             status_box.write("🕵️ Running deep investigation...")
-                            prompt = "Generate a comprehensive investigation report: 1. Introduction, 2.Main info , 3. Hidden Details, 4. Conclusion."
+                            prompt = DEEP_DIVE_PROMPT
+                            cache_persona = "Standard"
+                            budget = context_budget("Deep Dive")
                         else:
-                            prompt = st.session_state.current_question
-                            if persona == "ELI5 (Simple)": prompt += " (Explain like I'm 5)"
-                            elif persona == "Executive (Brief)": prompt += " (Executive summary only)"
-                            elif persona == "Skeptic (Critical)": prompt += " (Analyze critically and give more elaborate answer)"
+                            prompt = persona_prompt(st.session_state.current_question, persona)
+                            cache_persona = persona
+                            budget = context_budget(persona)
+                        query_engine, doc_digest = get_scoped_query_engine(model, scope_docs, streaming=True, budget=budget)
 
-                        response = query_engine.query(prompt)
-                        response_text = response.response
-                        
-                        if target_lang != "English":
-                            status_box.write(f"🌍 Translating...")
-                            response_text = perform_translation(response_text, target_lang)
+                        answer_cache = get_answer_cache()
+                        model_name = getattr(model, "model", "gemini")
+                        # Exact lookups skip the query embedding, so the semantic cache tier does too.
+                        embed_fn = None if get_corpus().skips_query_embedding(prompt) else get_corpus().embed_query
+                        cached = answer_cache.get(doc_digest, prompt, cache_persona, model_name, embed_fn=embed_fn)
+                        usage = None
+                        if cached:
+                            status_box.write("⚡ Answer served from cache")
+                            english_text, sources = cached["answer"], cached["sources"]
+                            response_text = english_text
+                            if target_lang != "English":
+                                status_box.write(f"🌍 Translating...")
+                                response_text = perform_translation(response_text, target_lang)
+                        else:
+                            # A streaming response only calls the LLM while it is consumed.
+                            with track_usage() as usage:
+                                response = traced_query(query_engine, prompt)
+                                sources = sources_from_response(response)
+                                english_text, response_text = stream_answer(response, target_lang, st.empty())
+                            logging.info(f"Query tokens: {usage.to_dict()} (context budget {budget})")
+                            answer_cache.put(doc_digest, prompt, cache_persona, model_name, english_text, sources, embed_fn=embed_fn)
+                            usage = usage.to_dict()
 
-                        source = response.source_nodes[0].node.text[:250] + "..." if response.source_nodes else ""
+                    if scope_docs:
+                        source = sources[0]["text"][:250] + "..." if sources else ""
                         
-                        if selected_file_name not in st.session_state.history: st.session_state.history[selected_file_name] = []
                         display_q = "🕵️ Deep Dive Report" if st.session_state.current_question == "CONDUCT_DEEP_DIVE" else st.session_state.current_question
                         
-                        st.session_state.history[selected_file_name].append({"q": display_q, "a": response_text, "src": source})
+                        get_history_store().append(st.session_state.session_id, doc_digest, selected_file_name,
+                                                   {"q": display_q, "a": response_text, "a_en": english_text, "lang": target_lang,
+                                                    "src": source, "usage": usage})
                         status_box.update(label="✅ Done!", state="complete", expanded=False)
                 except Exception as e:
                     status_box.update(label="❌ Error", state="error")
                     st.error(str(e))
 
-        if selected_file_name in st.session_state.history:
+        history_store, session_id = get_history_store(), st.session_state.session_id
+        doc_key = selected_scope_id(selected_file_name)
+        # Only the newest page is read at first; older ones load on request.
+        page, has_older = loaded_history(doc_key) if doc_key else ([], False)
+        if page:
+            translate_history(page, target_lang)
             st.divider()
-            for i, chat in enumerate(reversed(st.session_state.history[selected_file_name]), 1):
-                if isinstance(chat, dict): q, a, src = chat.get('q',""), chat.get('a',""), chat.get('src',"")
-                else: q, a, src = chat[0], chat[1], chat[2]
+            e1, e2, _ = st.columns([1, 1, 4])
+            with e1:
+                if st.button("📥 Export PDF"):
+                    entries = history_store.entries(session_id, doc_key)
+                    translate_history(entries, target_lang)
+                    pdf = generate_pdf_report(selected_file_name, entries)
+                    st.download_button("Download", pdf, f"{selected_file_name}.pdf", "application/pdf")
+            with e2:
+                documents = history_store.documents(session_id)
+                if len(documents) > 1 and st.button("🗂 Export all"):
+                    histories = {}
+                    for key, name in documents:
+                        entries = history_store.entries(session_id, key)
+                        translate_history(entries, target_lang)
+                        histories[name if name not in histories else f"{name}-{key[:8]}"] = entries
+                    archive = st.session_state.reports.archive(histories)
+                    st.download_button("Download ZIP", archive, "cognitivedoc_reports.zip", "application/zip")
+            for chat in page:
+                q, a, src = chat["q"], chat["a"], chat["src"]
                 
                 st.markdown(f"<div class='user-bubble'><strong>Q:</strong> {q}</div>", unsafe_allow_html=True)
                 st.markdown(f"<div class='bot-bubble'><strong>A:</strong> {a}</div>", unsafe_allow_html=True)
                 
-                c1, c2, c3 = st.columns([1, 4, 1])
+                usage = chat["usage"]
+                if usage: st.caption(f"🧮 {usage['prompt_tokens']:,} prompt + {usage['completion_tokens']:,} completion tokens")
+
+                c1, c2 = st.columns([1, 5])
                 with c1: 
                     if src: 
                         with st.expander("🔍 Source"): st.info(src)
-                
-                with c3:
-                    if st.button("📥 PDF", key=f"pdf_{i}"):
-                         pdf = generate_pdf_report(selected_file_name, st.session_state.history[selected_file_name])
-                         st.download_button("Download", pdf, f"{selected_file_name}.pdf", "application/pdf")
+                with c2:
+                    if a and st.button("🔊 Listen", key=f"tts_{chat['id']}"):
+                        play_answer(a, language_code(chat["lang"]))
+            if has_older and st.button("⬆️ Load older messages"):
+                load_older_history(doc_key)
+                st.rerun()
+
     else:
         st.info("👈 Upload a document to start chatting.")
 
@@ -278,50 +549,33 @@ elif menu_selection == "🧠 Visual Mind Map":
     st.markdown(f"## 🧠 Conceptual Mind Map")
     if selected_file_name:
         st.write(f"Visualizing concepts for: **{selected_file_name}**")
-        
-        if st.button("Generate Mind Map") or not st.session_state.mindmap_edges:
-            with st.spinner("AI is analyzing document structure..."):
-                try:
-                    # 1. Init Model
-                    doc_obj = next((d for d in docs if d.name == selected_file_name), None)
-                    if doc_obj:
-                        document_data = load_data(doc_obj)
-                        if not isinstance(document_data, list): document_data = [document_data]
-                        document_data = [d for d in document_data if getattr(d, "text", None)]
-                        model = load_model()
-                        query_engine = get_query_engine(model, document_data, selected_file_name)
-                        
-                        # 2. Ask LLM for Structure
-                        prompt = "Identify the top 10 most important concepts in this document. Then, identify how they are related. Format the output strictly as: Concept A -> Concept B. Return only 5 lines of these relationships."
-                        response = query_engine.query(prompt)
-                        raw_edges = str(response.response).split('\n')
-                        
-                        # 3. Parse Edges
-                        st.session_state.mindmap_edges = []
-                        for edge in raw_edges:
-                            if "->" in edge:
-                                parts = edge.split("->")
-                                if len(parts) == 2:
-                                    st.session_state.mindmap_edges.append((parts[0].strip(), parts[1].strip()))
-                except Exception as e:
-                    st.error(f"Analysis failed: {e}")
+        replace = st.button("Generate Mind Map")
+
+        # Edges are precomputed in the background after upload
+        try:
+            job = insight_job(selected_file_name, "mindmap", replace=replace)
+        except Exception as e:
+            job = None
+            st.error(f"Analysis failed: {e}")
+        mindmap_edges = job_result(job, "Mind map")
 
         # Draw Graph
-        if st.session_state.mindmap_edges:
+        if mindmap_edges:
             try:
+                import graphviz
                 graph = graphviz.Digraph()
                 graph.attr(bgcolor='transparent')
                 graph.attr('node', style='filled', fillcolor='#4aa9ff', fontcolor='white', shape='box')
                 
-                for start, end in st.session_state.mindmap_edges:
+                for start, end in mindmap_edges:
                     graph.edge(start, end)
                 
                 st.graphviz_chart(graph)
-                st.success(f"Generated 10 connections from your document.")
+                st.success(f"Generated {len(mindmap_edges)} connections from your document.")
             except Exception as e:
                 st.error("Graphviz is not installed or configured correctly.")
-                st.write("Raw Relations Found:", st.session_state.mindmap_edges)
-        else:
+                st.write("Raw Relations Found:", mindmap_edges)
+        elif job is None or not job.pending:
             st.info("Click Generate to analyze the PDF.")
             
     else:
@@ -332,55 +586,23 @@ elif menu_selection == "🎮 Gamified Quiz":
     st.markdown(f"## 🎮 Knowledge Check")
     if selected_file_name:
         st.write(f"Testing knowledge on: **{selected_file_name}**")
+        scope_id = selected_scope_id(selected_file_name)
+        replace = st.button("🎲 Generate New Quiz")
+
+        # Questions are precomputed in the background after upload
+        try:
+            job = insight_job(selected_file_name, "quiz", replace=replace)
+        except Exception as e:
+            job = None
+            st.error(f"Quiz generation failed: {e}")
+        quiz_data = job_result(job, "Quiz")
         
-        if st.button("🎲 Generate New Quiz"):
-            with st.spinner("AI is creating questions from your document..."):
-                try:
-                    # 1. Init Model
-                    doc_obj = next((d for d in docs if d.name == selected_file_name), None)
-                    if doc_obj:
-                        document_data = load_data(doc_obj)
-                        if not isinstance(document_data, list): document_data = [document_data]
-                        document_data = [d for d in document_data if getattr(d, "text", None)]
-                        model = load_model()
-                        query_engine = get_query_engine(model, document_data, selected_file_name)
-
-                        # 2. Ask LLM for Quiz JSON
-                        prompt = """
-                        Generate 5 multiple choice questions based on the document. 
-                        Return the output in this strict format:
-                        Q1: [Question Text] | [Option1, Option2, Option3, Option4] | [Correct Option]
-                        Q2: ...
-                        Q3: ...
-                        Do not add markdown formatting like ** or ##.
-                        """
-                        response = query_engine.query(prompt)
-                        raw_text = str(response.response)
-                        
-                        # 3. Parse Text
-                        new_quiz = []
-                        lines = raw_text.split('\n')
-                        for line in lines:
-                            if "|" in line:
-                                parts = line.split("|")
-                                if len(parts) >= 3:
-                                    q_text = parts[0].split(":")[1].strip() if ":" in parts[0] else parts[0].strip()
-                                    options = parts[1].replace("[", "").replace("]", "").split(",")
-                                    correct = parts[2].replace("[", "").replace("]", "").strip()
-                                    # Clean up
-                                    options = [o.strip() for o in options]
-                                    new_quiz.append({"q": q_text, "opts": options, "ans": correct})
-                        
-                        st.session_state.quiz_data = new_quiz
-                except Exception as e:
-                    st.error(f"Quiz generation failed: {e}")
-        
-        if st.session_state.quiz_data:
-            for idx, q_item in enumerate(st.session_state.quiz_data):
+        if quiz_data:
+            for idx, q_item in enumerate(quiz_data):
                 st.markdown(f"<div class='quiz-card'><strong>Q{idx+1}: {q_item['q']}</strong></div>", unsafe_allow_html=True)
                 # Fallback if options parsing failed
                 opts = q_item['opts'] if len(q_item['opts']) > 1 else ["True", "False", "Yes", "No"]
-                choice = st.radio(f"Select answer:", opts, key=f"quiz_{idx}")
+                choice = st.radio(f"Select answer:", opts, key=f"quiz_{scope_id}_{job.submitted}_{idx}")
                 
                 if st.button(f"Check Answer {idx+1}"):
                     # Loose matching for robustness
@@ -389,7 +611,7 @@ elif menu_selection == "🎮 Gamified Quiz":
                         st.balloons()
                     else:
                         st.error(f"❌ Incorrect. The answer is: {q_item['ans']}")
-        else:
+        elif job is None or not job.pending:
             st.info("Click 'Generate New Quiz' to start.")
     else:
         st.info("👈 Upload a document to generate a quiz.")
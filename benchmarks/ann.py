@@ -0,0 +1,90 @@
+"""
+Recall@k vs. latency of IVFVectorStore against exact search (MmapVectorStore).
+
+Vectors are drawn from a Gaussian mixture so they cluster like real chunk
+embeddings. For each nprobe the benchmark reports recall@k against the exact
+top-k and p50/p95 single-query latency.
+
+    python -m benchmarks.ann --nodes 1000000 --dim 768 --nprobe 1 4 8 16 32
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from QAWithPDF.ann_index import IVFVectorStore
+from QAWithPDF.vector_store import MmapVectorStore, _normalize
+
+
+def clustered_vectors(rng, count, dim, clusters, spread=0.35):
+    centers = rng.standard_normal((clusters, dim), dtype=np.float32)
+    out = np.empty((count, dim), dtype=np.float32)
+    for start in range(0, count, 65536):
+        stop = min(start + 65536, count)
+        out[start:stop] = centers[rng.integers(0, clusters, stop - start)]
+        out[start:stop] += spread * rng.standard_normal((stop - start, dim), dtype=np.float32)
+    return _normalize(out)
+
+
+def _latencies(search, queries):
+    latencies, results = [], []
+    for q in queries:
+        start = time.perf_counter()
+        results.append(search(q))
+        latencies.append(time.perf_counter() - start)
+    return results, {
+        "p50_ms": float(np.percentile(latencies, 50)) * 1000,
+        "p95_ms": float(np.percentile(latencies, 95)) * 1000,
+    }
+
+
+def run(nodes, dim, queries, top_k, nprobes, nlist=None, seed=0):
+    rng = np.random.default_rng(seed)
+    vectors = clustered_vectors(rng, nodes, dim, clusters=max(8, nodes // 500))
+    ids = [f"node-{i}" for i in range(nodes)]
+    query_vectors = _normalize(vectors[rng.integers(0, nodes, queries)] + 0.1 * rng.standard_normal((queries, dim), dtype=np.float32))
+
+    exact = MmapVectorStore(matrix=vectors, ids=ids, ref_doc_ids=["None"] * nodes)
+    exact_results, exact_latency = _latencies(lambda q: exact.query_batch(q[None, :], top_k)[0], query_vectors)
+
+    ivf = IVFVectorStore(matrix=vectors, ids=ids, ref_doc_ids=["None"] * nodes, nlist=nlist)
+    start = time.perf_counter()
+    ivf.train()
+    ivf._refresh()
+    build_s = time.perf_counter() - start
+
+    results = {
+        "nodes": nodes, "dim": dim, "queries": queries, "top_k": top_k,
+        "nlist": len(ivf._centroids), "ivf_build_s": build_s,
+        "exact": exact_latency, "ivf": [],
+    }
+    for nprobe in nprobes:
+        approx_results, latency = _latencies(lambda q: ivf._search(q, top_k, nprobe), query_vectors)
+        recall = np.mean([
+            len(set(approx[1]) & set(truth[1])) / top_k for approx, truth in zip(approx_results, exact_results)
+        ])
+        results["ivf"].append({"nprobe": nprobe, f"recall@{top_k}": float(recall), **latency})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nodes", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--nlist", type=int, default=None)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--out", help="write results as JSON to this path")
+    args = parser.parse_args()
+
+    results = run(args.nodes, args.dim, args.queries, args.top_k, args.nprobe, args.nlist)
+    print(json.dumps(results, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
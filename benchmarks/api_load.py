@@ -0,0 +1,213 @@
+"""
+Load test of the smartdoc-api service against fake model backends.
+
+Starts `python -m QAWithPDF.api` in a scratch directory, so its caches start
+cold. The backend is fake_backend below: FakeGemini with --llm-latency-ms per
+answer behind an unthrottled LLMScheduler, and FakeEmbedding with
+--embed-latency-ms per call. The test uploads a synthetic corpus and then keeps
+--concurrency clients busy for --duration seconds with a mix of /query,
+/query/stream and /insights requests over single documents and all documents.
+It reports requests/sec, p50/p95/p99 latency and errors per endpoint, plus time
+to first token for streams. --url tests an already running service instead.
+
+    python -m benchmarks.api_load --concurrency 32 --duration 20 --out api.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import aiohttp
+import numpy as np
+
+from benchmarks.pipeline import REPO_ROOT, make_queries
+from benchmarks.synthetic import generate_corpus
+
+# Share of each request type in the mix.
+MIX = (("query", 0.5), ("stream", 0.3), ("insight", 0.2))
+
+
+def fake_backend():
+    """
+    --backend benchmarks.api_load:fake_backend for smartdoc-api. Latencies come
+    from SMARTDOC_BENCH_LLM_LATENCY_MS and SMARTDOC_BENCH_EMBED_LATENCY_MS.
+    """
+    from QAWithPDF.fakes import FakeEmbedding, FakeGemini
+    from QAWithPDF.scheduler import LLMScheduler, ScheduledLLM
+
+    llm = FakeGemini(latency=float(os.getenv("SMARTDOC_BENCH_LLM_LATENCY_MS", "200")) / 1000)
+    scheduler = LLMScheduler(rpm=0, tpm=0, max_concurrency=int(os.getenv("SMARTDOC_LLM_CONCURRENCY", "16")))
+    return (ScheduledLLM(llm, scheduler=scheduler),
+            FakeEmbedding(latency=float(os.getenv("SMARTDOC_BENCH_EMBED_LATENCY_MS", "20")) / 1000))
+
+
+def start_server(port, workdir, llm_latency_ms, embed_latency_ms, llm_concurrency, workers):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [REPO_ROOT, os.environ.get("PYTHONPATH")])),
+               SMARTDOC_BENCH_LLM_LATENCY_MS=str(llm_latency_ms), SMARTDOC_BENCH_EMBED_LATENCY_MS=str(embed_latency_ms),
+               SMARTDOC_LLM_CONCURRENCY=str(llm_concurrency))
+    command = [sys.executable, "-m", "QAWithPDF.api", "--port", str(port), "--workers", str(workers),
+               "--backend", "benchmarks.api_load:fake_backend", "--no-answer-cache"]
+    return subprocess.Popen(command, cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+async def wait_ready(session, url, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            async with session.get(url + "/health") as response:
+                if response.status == 200:
+                    return
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"API service at {url} did not become ready")
+
+
+async def upload(session, url, paths):
+    doc_ids = []
+    for path in paths:
+        with open(path, "rb") as f:
+            data = f.read()
+        async with session.post(url + "/documents", data=data, params={"name": os.path.basename(path)}) as response:
+            response.raise_for_status()
+            doc_ids.append((await response.json())["doc_id"])
+    return doc_ids
+
+
+async def one_request(session, url, kind, question, doc_ids, rng):
+    """
+    Returns (endpoint, seconds, first_token_seconds or None, ok).
+    """
+    scope = [rng.choice(doc_ids)] if rng.random() < 0.7 else None
+    persona = rng.choice(["Standard", "Executive (Brief)", "Skeptic (Critical)"])
+    start = time.perf_counter()
+    first = None
+    try:
+        if kind == "query":
+            async with session.post(url + "/query", json={"question": question, "doc_ids": scope, "persona": persona}) as r:
+                await r.json()
+                ok = r.status == 200
+        elif kind == "stream":
+            async with session.post(url + "/query/stream",
+                                    json={"question": question, "doc_ids": scope, "persona": persona}) as r:
+                ok = r.status == 200
+                async for line in r.content:
+                    if first is None and line.startswith(b"data: "):
+                        first = time.perf_counter() - start
+                    if line.startswith(b"event: error"):
+                        ok = False
+        else:
+            insight = rng.choice(["summary", "mindmap", "quiz"])
+            scope = scope or doc_ids
+            async with session.post(url + f"/insights/{insight}", json={"doc_ids": scope}) as r:
+                await r.read()
+            params = {"doc_ids": ",".join(scope), "wait": "30"}
+            async with session.get(url + f"/insights/{insight}", params=params) as r:
+                ok = r.status == 200 and (await r.json())["status"] == "done"
+    except aiohttp.ClientError:
+        ok = False
+    return kind, time.perf_counter() - start, first, ok
+
+
+async def load(url, doc_ids, questions, concurrency, duration, seed):
+    results = []
+    deadline = time.monotonic() + duration
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    timeout = aiohttp.ClientTimeout(total=120)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        async def client(i):
+            rng = random.Random(seed * 1000 + i)
+            kinds, weights = zip(*MIX)
+            while time.monotonic() < deadline:
+                kind = rng.choices(kinds, weights)[0]
+                results.append(await one_request(session, url, kind, rng.choice(questions), doc_ids, rng))
+
+        start = time.monotonic()
+        await asyncio.gather(*(client(i) for i in range(concurrency)))
+        elapsed = time.monotonic() - start
+    return results, elapsed
+
+
+def summarize(results, elapsed):
+    def stats(rows):
+        latencies = np.array([seconds for _, seconds, _, _ in rows]) * 1000
+        firsts = [first * 1000 for _, _, first, _ in rows if first is not None]
+        summary = {
+            "requests": len(rows), "errors": sum(not ok for _, _, _, ok in rows),
+            "requests_per_s": len(rows) / elapsed,
+            "p50_ms": float(np.percentile(latencies, 50)) if len(rows) else None,
+            "p95_ms": float(np.percentile(latencies, 95)) if len(rows) else None,
+            "p99_ms": float(np.percentile(latencies, 99)) if len(rows) else None,
+        }
+        if firsts:
+            summary["first_token_p50_ms"] = float(np.percentile(firsts, 50))
+            summary["first_token_p99_ms"] = float(np.percentile(firsts, 99))
+        return summary
+
+    by_kind = {kind: stats([row for row in results if row[0] == kind]) for kind, _ in MIX}
+    return {"total": stats(results), "endpoints": by_kind}
+
+
+async def run_async(args):
+    workdir = tempfile.mkdtemp(prefix="bench_api_")
+    url, server = args.url, None
+    if not url:
+        url = f"http://127.0.0.1:{args.port}"
+        server = start_server(args.port, workdir, args.llm_latency_ms, args.embed_latency_ms, args.llm_concurrency,
+                              args.workers)
+    try:
+        async with aiohttp.ClientSession() as session:
+            await wait_ready(session, url)
+            paths = generate_corpus(os.path.join(workdir, "corpus"), args.files, pages=args.pages, seed=args.seed)
+            start = time.perf_counter()
+            doc_ids = await upload(session, url, paths)
+            upload_s = time.perf_counter() - start
+            async with session.get(url + "/health") as response:
+                health = await response.json()
+        results, elapsed = await load(url, doc_ids, make_queries(200, args.seed), args.concurrency, args.duration,
+                                      args.seed)
+        async with aiohttp.ClientSession() as session:
+            async with session.get(url + "/health") as response:
+                health_after = await response.json()
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+    return {
+        "url": url, "concurrency": args.concurrency, "duration_s": elapsed, "files": len(doc_ids),
+        "upload_s": upload_s, "llm_latency_ms": args.llm_latency_ms, "llm_concurrency": args.llm_concurrency,
+        "corpus_documents": health["corpus_documents"], "scheduler": health_after["scheduler"],
+        **summarize(results, elapsed),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="load-test a running service instead of starting one")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--files", type=int, default=6)
+    parser.add_argument("--pages", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=32, help="concurrent clients")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds of load")
+    parser.add_argument("--llm-latency-ms", type=float, default=200.0)
+    parser.add_argument("--embed-latency-ms", type=float, default=20.0)
+    parser.add_argument("--llm-concurrency", type=int, default=16, help="LLM requests in flight on the server")
+    parser.add_argument("--workers", type=int, default=32, help="server threads for blocking work")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write results as JSON to this path")
+    args = parser.parse_args()
+
+    results = asyncio.run(run_async(args))
+    print(json.dumps(results, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
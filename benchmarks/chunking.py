@@ -0,0 +1,124 @@
+"""
+Structure-aware chunking versus the previous SentenceSplitter settings.
+
+For every chunking config, indexes a synthetic corpus of paragraphed TXT, PDF and
+DOCX files (plus --input-dir) the way the app does: the "sentence" baseline gets
+one whole-file Document per upload (load_data) and "structure" configs get the
+page / section Documents (stream_documents). Reports chunk count (= embedding
+inputs), chunk tokens, build time, index size on disk and the answer-source hit
+rate: known-item queries quote a sentence from the corpus, and a hit means a
+retrieved top-k chunk contains that sentence. "split_rate" is the share of query
+sentences that no chunk contains whole, i.e. that a chunk boundary cut through.
+
+    python -m benchmarks.chunking --files 12 --queries 200 --chunk-tokens 800 512
+"""
+import argparse
+import json
+import os
+import random
+import re
+import tempfile
+import time
+
+from benchmarks.synthetic import generate_corpus
+from QAWithPDF.batch import discover_files
+from QAWithPDF.chunking import ChunkingConfig
+from QAWithPDF.data_ingestion import load_data, stream_documents
+from QAWithPDF.embedding import _index_nodes, _load_or_build_index
+from QAWithPDF.fakes import FakeEmbedding
+from QAWithPDF.index_cache import _dir_size
+from QAWithPDF.streaming import split_sentences
+
+
+def _normalize(text):
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+def make_queries(pages, count, seed=0):
+    """
+    Returns sentences of at least 8 words drawn from the page texts.
+    """
+    rng = random.Random(seed)
+    sentences = [s for page in pages for s in split_sentences(page.text) if len(s.split()) >= 8]
+    return [rng.choice(sentences) for _ in range(min(count, len(sentences)))]
+
+
+def evaluate(config, paths, queries, top_k):
+    start = time.perf_counter()
+    indexes = []
+    for path in paths:
+        with open(path, "rb") as f:
+            documents = list(stream_documents(f)) if config.strategy == "structure" else load_data(f)
+        index, _, _ = _load_or_build_index(documents, embed_model=FakeEmbedding(), chunking=config)
+        indexes.append(index)
+    build_s = time.perf_counter() - start
+
+    from llama_index.core.utils import get_tokenizer
+    tokenize = get_tokenizer()
+    chunks = [node.get_content() for index in indexes for node in _index_nodes(index)]
+    tokens = [len(tokenize(chunk)) for chunk in chunks]
+    normalized = [_normalize(chunk) for chunk in chunks]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for i, index in enumerate(indexes):
+            index.storage_context.persist(persist_dir=os.path.join(tmp, str(i)))
+        size = _dir_size(tmp)
+
+    # Merge the per-file top-k by score, as a query over the shared corpus would.
+    retrievers = [index.as_retriever(similarity_top_k=top_k) for index in indexes]
+    hits = split = 0
+    for query in queries:
+        target = _normalize(query)
+        if not any(target in chunk for chunk in normalized):
+            split += 1
+        found = [hit for retriever in retrievers for hit in retriever.retrieve(query)]
+        found.sort(key=lambda hit: -(hit.score or 0.0))
+        hits += any(target in _normalize(hit.node.get_content()) for hit in found[:top_k])
+    return {
+        "strategy": config.strategy, "chunk_tokens": config.key_params()[0], "chunks": len(chunks),
+        "avg_tokens": sum(tokens) / len(tokens) if tokens else 0, "max_tokens": max(tokens, default=0),
+        "total_tokens": sum(tokens), "build_s": build_s, "index_bytes": size,
+        f"source_hit@{top_k}": hits / len(queries) if queries else None,
+        "split_rate": split / len(queries) if queries else None,
+    }
+
+
+def run(input_dir, files, pages, chunk_tokens, queries, top_k, seed=0):
+    paths = discover_files(input_dir) if input_dir and os.path.isdir(input_dir) else []
+    if files:
+        paths += generate_corpus(tempfile.mkdtemp(prefix="bench_chunking_"), files, pages=pages, seed=seed,
+                                 paragraph_sentences=4)
+    all_pages = []
+    for path in paths:
+        with open(path, "rb") as f:
+            all_pages += list(stream_documents(f))
+    query_set = make_queries(all_pages, queries, seed)
+
+    configs = [ChunkingConfig("sentence")] + [ChunkingConfig("structure", tokens) for tokens in chunk_tokens]
+    return {
+        "files": len(paths), "pages": len(all_pages), "queries": len(query_set), "top_k": top_k,
+        "configs": [evaluate(config, paths, query_set, top_k) for config in configs],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--input-dir", default="Data")
+    parser.add_argument("--files", type=int, default=12)
+    parser.add_argument("--pages", type=int, default=8)
+    parser.add_argument("--chunk-tokens", type=int, nargs="+", default=[800, 512])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write results as JSON to this path")
+    args = parser.parse_args()
+
+    results = run(args.input_dir, args.files, args.pages, args.chunk_tokens, args.queries, args.top_k, args.seed)
+    print(json.dumps(results, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+LLM input size with and without token-budgeted context packing.
+
+Indexes a synthetic corpus, plus a lightly edited copy of one file (a re-uploaded
+revision, so "All documents" queries see near-duplicate chunks), into one
+CorpusIndex. It then asks known-item questions over all documents, each quoting a
+sentence from the corpus. It compares the previous top-2 retrieval with
+ContextPacker at each persona's budget. For each config it reports prompt and
+completion tokens per query from track_usage(), the context chunks sent,
+near-duplicates dropped, query latency, and the source hit rate: the share of
+questions whose quoted sentence is in the context sent to the LLM.
+
+The LLM is FakeGemini behind ScheduledLLM (no rate limits), so token counts are
+those of the real prompt template.
+
+    python -m benchmarks.context --files 12 --queries 100
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import tempfile
+import time
+
+from benchmarks.chunking import make_queries
+from benchmarks.synthetic import generate_corpus
+from QAWithPDF.context import PERSONA_BUDGETS, context_budget
+from QAWithPDF.corpus import CorpusIndex
+from QAWithPDF.data_ingestion import stream_documents
+from QAWithPDF.embedding import load_document_nodes
+from QAWithPDF.fakes import FakeEmbedding, FakeGemini
+from QAWithPDF.index_cache import content_hash
+from QAWithPDF.scheduler import LLMScheduler, ScheduledLLM, track_usage
+from QAWithPDF.tracing import recent_spans
+
+
+def _normalize(text):
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+def build_corpus(paths, llm, embed_model):
+    documents = []
+    for path in paths:
+        with open(path, "rb") as f:
+            data = f.read()
+            f.seek(0)
+            pages = list(stream_documents(f))
+        digest = content_hash(data)
+        documents.append((digest, load_document_nodes(llm, pages, digest, embed_model=embed_model), path))
+    corpus = CorpusIndex(embed_model=embed_model)
+    for digest, nodes, path in documents:
+        corpus.add_document(digest, nodes, name=os.path.basename(path))
+    return corpus
+
+
+def add_revision(paths, out_dir):
+    """
+    Copies the first TXT file with one extra paragraph, like a re-uploaded revision.
+    """
+    source = next(path for path in paths if path.endswith(".txt"))
+    revision = os.path.join(out_dir, "revision_" + os.path.basename(source))
+    with open(source, "r", encoding="utf-8") as f:
+        text = f.read()
+    with open(revision, "w", encoding="utf-8") as f:
+        f.write(text + "\n\nRevision note: figures were re-checked after the review.\n")
+    return revision
+
+
+def evaluate(name, corpus, llm, queries, budget):
+    prompt_tokens, completion_tokens, chunks, duplicates, latencies = [], [], [], 0, []
+    hits = 0
+    for query in queries:
+        query_engine = corpus.as_query_engine(llm=llm, context_budget=budget)
+        start = time.perf_counter()
+        with track_usage() as usage:
+            response = query_engine.query(query)
+        latencies.append(time.perf_counter() - start)
+        prompt_tokens.append(usage.prompt_tokens)
+        completion_tokens.append(usage.completion_tokens)
+        chunks.append(len(response.source_nodes))
+        if budget is not None:
+            packing = next(record for record in recent_spans() if record["name"] == "context_packing")
+            duplicates += packing["duplicates"]
+        target = _normalize(query)
+        hits += any(target in _normalize(item.node.get_content()) for item in response.source_nodes)
+    latencies.sort()
+    return {
+        "config": name, "budget": budget,
+        "prompt_tokens_mean": statistics.mean(prompt_tokens), "prompt_tokens_max": max(prompt_tokens),
+        "completion_tokens_mean": statistics.mean(completion_tokens),
+        "chunks_mean": statistics.mean(chunks), "duplicates_dropped": duplicates,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p95_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000,
+        "source_hit_rate": hits / len(queries),
+    }
+
+
+def run(files, pages, queries, seed=0):
+    out_dir = tempfile.mkdtemp(prefix="bench_context_")
+    paths = generate_corpus(out_dir, files, pages=pages, seed=seed, paragraph_sentences=4)
+    paths.append(add_revision(paths, out_dir))
+    llm = ScheduledLLM(FakeGemini(), scheduler=LLMScheduler(rpm=0, tpm=0))
+    corpus = build_corpus(paths, llm, FakeEmbedding())
+
+    all_pages = []
+    for path in paths:
+        with open(path, "rb") as f:
+            all_pages += list(stream_documents(f))
+    query_set = make_queries(all_pages, queries, seed)
+
+    configs = [("top-2 (previous)", None)] + [(persona, context_budget(persona)) for persona in PERSONA_BUDGETS]
+    return {
+        "files": len(paths), "queries": len(query_set),
+        "configs": [evaluate(name, corpus, llm, query_set, budget) for name, budget in configs],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=12)
+    parser.add_argument("--pages", type=int, default=8)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write results as JSON to this path")
+    args = parser.parse_args()
+
+    results = run(args.files, args.pages, args.queries, args.seed)
+    print(json.dumps(results, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
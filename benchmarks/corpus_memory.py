@@ -0,0 +1,98 @@
+"""
+Memory of one index + query engine per uploaded file versus one shared
+CorpusIndex, for 1, 10 and 100 files of synthetic, pre-embedded chunks.
+
+    python -m benchmarks.corpus_memory --files 1 10 100 --chunks-per-file 30
+"""
+import argparse
+import gc
+import json
+import random
+import tracemalloc
+
+from llama_index.core import Settings, VectorStoreIndex
+from llama_index.core.llms import MockLLM
+from llama_index.core.schema import TextNode
+
+from QAWithPDF.corpus import CorpusIndex
+from QAWithPDF.fakes import FakeEmbedding, HashEmbedder
+
+WORDS = "contract clause payment term party liability notice renewal invoice delivery warranty scope".split()
+
+
+def make_files(files, chunks_per_file, dim, seed=0):
+    rng = random.Random(seed)
+    embedder = HashEmbedder(dim)
+    corpus = []
+    for f in range(files):
+        texts = [" ".join(rng.choice(WORDS) for _ in range(120)) for _ in range(chunks_per_file)]
+        corpus.append([
+            TextNode(id_=f"file{f}-chunk{c}", text=text, embedding=vector)
+            for c, (text, vector) in enumerate(zip(texts, embedder(texts)))
+        ])
+    return corpus
+
+
+def _measure(build):
+    gc.collect()
+    tracemalloc.start()
+    kept = build()
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del kept
+    return current / (1024 * 1024), peak / (1024 * 1024)
+
+
+def per_file_engines(files):
+    return [VectorStoreIndex([node.model_copy() for node in nodes]).as_query_engine() for nodes in files]
+
+
+def shared_corpus(files):
+    corpus = CorpusIndex(max_documents=len(files), embed_model=Settings.embed_model)
+    for f, nodes in enumerate(files):
+        corpus.add_document(f"doc-{f}", [node.model_copy() for node in nodes])
+    return corpus, corpus.as_query_engine()
+
+
+def run(file_counts, chunks_per_file, dim):
+    Settings.llm = MockLLM()
+    Settings.embed_model = FakeEmbedding(dim)
+    # Warm up lazy imports and tokenizer caches so they are not billed to the first run.
+    warmup = make_files(1, 1, dim)
+    per_file_engines(warmup)
+    shared_corpus(warmup)
+    results = []
+    for count in file_counts:
+        files = make_files(count, chunks_per_file, dim)
+        per_file_mb, per_file_peak = _measure(lambda: per_file_engines(files))
+        corpus_mb, corpus_peak = _measure(lambda: shared_corpus(files))
+        results.append({
+            "files": count,
+            "chunks": count * chunks_per_file,
+            "per_file_engines_mb": per_file_mb,
+            "per_file_engines_peak_mb": per_file_peak,
+            "shared_corpus_mb": corpus_mb,
+            "shared_corpus_peak_mb": corpus_peak,
+            "per_file_overhead_kb": (per_file_mb - corpus_mb) * 1024 / count,
+        })
+    return {"chunks_per_file": chunks_per_file, "dim": dim, "results": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--chunks-per-file", type=int, default=30)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--out", help="write results as JSON to this path")
+    args = parser.parse_args()
+
+    results = run(args.files, args.chunks_per_file, args.dim)
+    print(json.dumps(results, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
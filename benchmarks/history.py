@@ -0,0 +1,92 @@
+"""
+Chat view rerender cost at growing history lengths.
+
+For each size N, fills a fresh ChatHistoryStore with N Q/A pairs for one
+document, plus N pairs in another session sharing the file. It then times the
+data work a Streamlit rerun does for the chat view:
+- "previous": walk the whole in-session history, newest first, and build the
+  Q/A bubbles of every entry (what every rerun cost before paging);
+- "paged": read the latest PAGE_SIZE entries from the store and build only
+  their bubbles.
+"rerun" is the read the app does on later reruns, once that page is loaded:
+only messages newer than the newest loaded one. "older_page" is one Load older
+messages click, a page read before the oldest loaded id.
+
+"elements" counts the Streamlit elements each approach renders (two bubbles,
+source expander and Listen button per entry), which is what dominates in the
+browser. Also reports the append latency, and the first page read by a new store
+instance, as after a restart or on another replica.
+
+    python -m benchmarks.history --sizes 10 100 1000 10000 --out history.json
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+
+from benchmarks.report import make_history
+from QAWithPDF.chat_history import PAGE_SIZE, ChatHistoryStore
+
+ELEMENTS_PER_ENTRY = 4
+
+
+def render_bubbles(entries):
+    return [(f"<div class='user-bubble'><strong>Q:</strong> {chat['q']}</div>",
+             f"<div class='bot-bubble'><strong>A:</strong> {chat['a']}</div>") for chat in entries]
+
+
+def _median_ms(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+
+def run(sizes, repeat):
+    results = []
+    for size in sizes:
+        path = os.path.join(tempfile.mkdtemp(prefix="bench_history_"), "history.sqlite3")
+        store = ChatHistoryStore(path)
+        history = [dict(chat, a_en=chat["a"], lang="English") for chat in make_history(size)]
+        start = time.perf_counter()
+        for chat in history:
+            store.append("session", "doc", "doc.pdf", chat)
+            store.append("other-session", "doc", "doc.pdf", chat)
+        append_ms = (time.perf_counter() - start) / (2 * size) * 1000
+
+        previous_ms = _median_ms(lambda: render_bubbles(reversed(history)), repeat)
+        paged_ms = _median_ms(lambda: render_bubbles(store.latest("session", "doc")[0]), repeat)
+        restart_ms = _median_ms(lambda: ChatHistoryStore(path).latest("session", "doc"), max(1, repeat // 10))
+        page, has_older = store.latest("session", "doc")
+        rerun_ms = _median_ms(lambda: store.latest("session", "doc", after=page[0]["id"]), repeat)
+        older_ms = _median_ms(lambda: store.latest("session", "doc", before=page[-1]["id"]), repeat)
+        results.append({
+            "entries": size, "append_ms": append_ms,
+            "previous_ms": previous_ms, "previous_elements": size * ELEMENTS_PER_ENTRY,
+            "paged_ms": paged_ms, "paged_elements": len(page) * ELEMENTS_PER_ENTRY, "has_older": has_older,
+            "rerun_ms": rerun_ms, "older_page_ms": older_ms,
+            "restart_first_page_ms": restart_ms, "db_bytes": sum(os.path.getsize(f) for f in (path, path + "-wal") if os.path.exists(f)),
+        })
+    return {"page_size": PAGE_SIZE, "sizes": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--out", help="write results as JSON to this path")
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.repeat)
+    print(json.dumps(results, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
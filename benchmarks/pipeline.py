@@ -0,0 +1,197 @@
+"""
+End-to-end pipeline benchmark with offline fake models (fakes.FakeGemini and
+fakes.FakeEmbedding), so it needs no network or API key.
+
+Generates a synthetic TXT/PDF/DOCX corpus, then times four stages: load_data per
+file, index build through download_gemini_embedding per file, retrieval per
+query and full query (retrieval + answer synthesis) per query. Each stage reports
+throughput, p50/p95 latency and peak traced memory. Timings and memory come from
+two separate fresh subprocesses, because tracemalloc slows everything it traces,
+and both run in a scratch directory so the on-disk caches start cold.
+
+    python -m benchmarks.pipeline --files 30 --pages 10 --queries 100 --out bench.json
+    python -m benchmarks.pipeline --files 30 --pages 10 --queries 100 --compare bench.json
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from benchmarks.synthetic import TOPICS, generate_corpus
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Lower is better for these; throughput_per_s is compared the other way round.
+LATENCY_KEYS = ("p50_ms", "p95_ms", "peak_mb")
+
+
+def make_queries(count, seed=0):
+    rng = random.Random(seed)
+    return [f"What does the document say about {rng.choice(TOPICS)} and {rng.choice(TOPICS)}?" for _ in range(count)]
+
+
+def _stage(fn, items, trace_memory):
+    latencies = []
+    results = []
+    if trace_memory:
+        gc.collect()
+        tracemalloc.start()
+    start = time.perf_counter()
+    for item in items:
+        t = time.perf_counter()
+        results.append(fn(item))
+        latencies.append(time.perf_counter() - t)
+    total = time.perf_counter() - start
+    stats = {"items": len(items), "total_s": total}
+    if trace_memory:
+        stats["peak_mb"] = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        tracemalloc.stop()
+    else:
+        stats.update(
+            throughput_per_s=len(items) / total if total else 0.0,
+            p50_ms=float(np.percentile(latencies, 50)) * 1000 if latencies else 0.0,
+            p95_ms=float(np.percentile(latencies, 95)) * 1000 if latencies else 0.0,
+        )
+    return results, stats
+
+
+def _run_child(config, trace_memory):
+    from QAWithPDF.data_ingestion import load_data
+    from QAWithPDF.embedding import download_gemini_embedding
+    from QAWithPDF.fakes import FakeEmbedding, FakeGemini
+
+    llm = FakeGemini(latency=config["llm_latency_ms"] / 1000)
+    embed_model = FakeEmbedding(dim=config["dim"], latency=config["embed_latency_ms"] / 1000)
+
+    def load(path):
+        with open(path, "rb") as f:
+            return load_data(f)
+
+    documents, load_stats = _stage(load, config["paths"], trace_memory)
+    engines, index_stats = _stage(
+        lambda docs: download_gemini_embedding(llm, docs, embed_model=embed_model), documents, trace_memory)
+    pairs = [(engines[i % len(engines)], q) for i, q in enumerate(config["queries"])]
+    _, retrieve_stats = _stage(lambda pair: pair[0].retriever.retrieve(pair[1]), pairs, trace_memory)
+    _, query_stats = _stage(lambda pair: pair[0].query(pair[1]), pairs, trace_memory)
+    return {"load": load_stats, "index": index_stats, "retrieve": retrieve_stats, "query": query_stats}
+
+
+def _spawn(config_path, trace_memory):
+    workdir = tempfile.mkdtemp(prefix="bench_pipeline_")
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [REPO_ROOT, os.environ.get("PYTHONPATH")])))
+    command = [sys.executable, "-m", "benchmarks.pipeline", "--child", config_path]
+    if trace_memory:
+        command.append("--trace-memory")
+    output = subprocess.run(command, cwd=workdir, env=env, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, check=True,
+                              capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(files, pages, words_per_page, formats, queries, dim, embed_latency_ms, llm_latency_ms, seed=0):
+    workdir = tempfile.mkdtemp(prefix="bench_corpus_")
+    paths = generate_corpus(os.path.join(workdir, "corpus"), files, pages, words_per_page, formats, seed)
+    config = {
+        "paths": paths, "queries": make_queries(queries, seed), "dim": dim,
+        "embed_latency_ms": embed_latency_ms, "llm_latency_ms": llm_latency_ms,
+    }
+    config_path = os.path.join(workdir, "config.json")
+    with open(config_path, "w") as f:
+        json.dump(config, f)
+
+    timings = _spawn(config_path, trace_memory=False)
+    memory = _spawn(config_path, trace_memory=True)
+    stages = {name: dict(stats, peak_mb=memory[name]["peak_mb"]) for name, stats in timings.items()}
+    return {
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "corpus": {
+            "files": files, "pages_per_file": pages, "words_per_page": words_per_page, "formats": list(formats),
+            "bytes": sum(os.path.getsize(path) for path in paths), "seed": seed,
+        },
+        "queries": queries, "dim": dim, "embed_latency_ms": embed_latency_ms, "llm_latency_ms": llm_latency_ms,
+        "stages": stages,
+    }
+
+
+def compare(baseline, current, tolerance=0.10):
+    """
+    Relative change of every stage metric between two result files. A metric is a
+    regression when it is worse than the baseline by more than tolerance.
+
+    Returns:
+    - List[dict] with stage, metric, baseline, current, change and regression
+    """
+    rows = []
+    for stage, stats in current["stages"].items():
+        before = baseline.get("stages", {}).get(stage, {})
+        for metric in LATENCY_KEYS + ("throughput_per_s",):
+            if metric not in stats or not before.get(metric):
+                continue
+            change = stats[metric] / before[metric] - 1
+            worse = -change if metric == "throughput_per_s" else change
+            rows.append({
+                "stage": stage, "metric": metric, "baseline": before[metric], "current": stats[metric],
+                "change": change, "regression": worse > tolerance,
+            })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=12)
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--words-per-page", type=int, default=400)
+    parser.add_argument("--formats", nargs="+", default=["txt", "pdf", "docx"])
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--embed-latency-ms", type=float, default=0.0, help="simulated latency per embedding call")
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0, help="simulated latency per LLM call")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write results as JSON to this path")
+    parser.add_argument("--compare", help="baseline JSON from an earlier run; exits 1 on a regression")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed relative slowdown for --compare")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--trace-memory", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        with open(args.child) as f:
+            config = json.load(f)
+        print(json.dumps(_run_child(config, args.trace_memory)))
+        return 0
+
+    results = run(args.files, args.pages, args.words_per_page, args.formats, args.queries, args.dim,
+                  args.embed_latency_ms, args.llm_latency_ms, args.seed)
+    print(json.dumps(results, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            rows = compare(json.load(f), results, args.tolerance)
+        for row in rows:
+            flag = "REGRESSION" if row["regression"] else ""
+            print(f"{row['stage']:>9} {row['metric']:>17} {row['baseline']:12.3f} -> {row['current']:12.3f} "
+                  f"({row['change']:+.1%}) {flag}")
+        return 1 if any(row["regression"] for row in rows) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,77 @@
+"""
+PDF report export cost at growing chat-history lengths.
+
+For each size N, times three exports of an N-entry history:
+- "full": a fresh ReportBuilder laying out all N Q/A pairs (what every click
+  cost before reports were built incrementally);
+- "append": an export after one more Q/A pair was added to a history that was
+  already exported, which only lays out the new pair;
+- "repeat": a second click with no change, served from the cached bytes;
+- "copy": the deep copy of the open N-entry document that each new version
+  makes before serializing (see ReportBuilder), the O(n) part of "append".
+
+Also times a ZIP export of --documents histories of size N each.
+
+    python -m benchmarks.report --sizes 10 100 1000 --out report.json
+"""
+import argparse
+import copy
+import json
+import time
+
+from benchmarks.synthetic import make_pages
+from QAWithPDF.report import ReportBuilder, ReportStore
+
+
+def make_history(entries, seed=0):
+    answers = make_pages(entries, 120, seed=seed)
+    return [{"q": f"Question {i}: what does section {i} say?", "a": answer, "src": ""}
+            for i, answer in enumerate(answers)]
+
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def run(sizes, documents):
+    ReportBuilder("warmup.pdf").render(make_history(1))  # keep the fpdf import out of the first timing
+    results = []
+    for size in sizes:
+        history = make_history(size + 1)
+        full_s, pdf = _timed(ReportBuilder("report.pdf").render, history[:size])
+
+        builder = ReportBuilder("report.pdf")
+        builder.render(history[:size])
+        append_s, _ = _timed(builder.render, history)
+        repeat_s, _ = _timed(builder.render, history)
+        copy_s, _ = _timed(copy.deepcopy, builder._pdf)
+
+        histories = {f"doc_{i}.pdf": make_history(size, seed=i) for i in range(documents)}
+        archive_s, archive = _timed(ReportStore().archive, histories)
+        results.append({
+            "entries": size, "pdf_bytes": len(pdf), "full_s": full_s, "append_s": append_s, "repeat_s": repeat_s,
+            "copy_s": copy_s,
+            "speedup_append": full_s / append_s if append_s else None,
+            "archive_documents": documents, "archive_s": archive_s, "archive_bytes": len(archive),
+        })
+    return {"sizes": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--documents", type=int, default=3, help="histories in the ZIP export")
+    parser.add_argument("--out", help="write results as JSON to this path")
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.documents)
+    print(json.dumps(results, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Latency and quality of vector, lexical (BM25) and hybrid retrieval.
+
+Indexes the documents in --input-dir (default Data/) plus a synthetic corpus that
+mentions clause numbers, part codes and emails, then runs known-item queries: each
+query is drawn from one chunk, which counts as the right answer. "identifier"
+queries ask about a rare identifier from the chunk, "phrase" queries reuse a run
+of its words. Reports hit@k, MRR and p50/p95 latency per retrieval mode.
+
+--embed-latency-ms adds a simulated round trip to every query embedding, which is
+what the lexical fast path saves. With the default fake backend the "vector" side
+is a hashed bag of words, so quality numbers mostly reflect lexical overlap; use
+--backend gemini for real embeddings.
+
+    python -m benchmarks.retrieval --synthetic-files 20 --queries 200 --embed-latency-ms 80
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import generate_corpus
+from QAWithPDF.batch import discover_files, load_backend
+from QAWithPDF.bm25 import IDENTIFIER_RE, HybridRetriever, tokenize
+from QAWithPDF.data_ingestion import load_data
+from QAWithPDF.embedding import _index_nodes, _load_or_build_index
+from QAWithPDF.fakes import FakeEmbedding
+
+MODES = [
+    ("vector", {"mode": "vector"}),
+    ("lexical", {"mode": "lexical"}),
+    ("hybrid", {"mode": "hybrid", "fast_path": False}),
+    ("hybrid+fast_path", {"mode": "hybrid", "fast_path": True}),
+]
+
+
+def make_queries(nodes, count, seed=0):
+    """
+    Returns [(kind, query, node_id)] known-item queries.
+    """
+    rng = random.Random(seed)
+    document_frequency = {}
+    node_terms = {}
+    for node in nodes:
+        terms = set(tokenize(node.get_content()))
+        node_terms[node.node_id] = terms
+        for term in terms:
+            document_frequency[term] = document_frequency.get(term, 0) + 1
+
+    queries = []
+    for attempt in range(count * 20):
+        if len(queries) >= count:
+            break
+        node = rng.choice(nodes)
+        if attempt % 2 == 0:
+            rare = sorted(t for t in node_terms[node.node_id] if IDENTIFIER_RE.fullmatch(t) and document_frequency[t] == 1)
+            if rare:
+                queries.append(("identifier", f"What does the document say about {rng.choice(rare)}?", node.node_id))
+        else:
+            words = node.get_content().split()
+            if len(words) > 12:
+                start = rng.randrange(len(words) - 8)
+                queries.append(("phrase", " ".join(words[start:start + 8]), node.node_id))
+    return queries
+
+
+def evaluate(retriever, queries, top_k):
+    latencies, by_kind = [], {}
+    for kind, query, target in queries:
+        start = time.perf_counter()
+        hits = retriever.retrieve(query)
+        latencies.append(time.perf_counter() - start)
+        ids = [hit.node.node_id for hit in hits[:top_k]]
+        rank = ids.index(target) + 1 if target in ids else None
+        stats = by_kind.setdefault(kind, {"queries": 0, "hits": 0, "mrr": 0.0, "latencies": []})
+        stats["latencies"].append(latencies[-1])
+        stats["queries"] += 1
+        stats["hits"] += rank is not None
+        stats["mrr"] += 1.0 / rank if rank else 0.0
+    quality = {
+        kind: {
+            "queries": s["queries"], f"hit@{top_k}": s["hits"] / s["queries"], "mrr": s["mrr"] / s["queries"],
+            "p50_ms": float(np.percentile(s["latencies"], 50)) * 1000,
+        }
+        for kind, s in sorted(by_kind.items())
+    }
+    return {
+        "p50_ms": float(np.percentile(latencies, 50)) * 1000,
+        "p95_ms": float(np.percentile(latencies, 95)) * 1000,
+        "quality": quality,
+    }
+
+
+def run(input_dir, synthetic_files, queries, top_k, backend, embed_latency_ms, seed=0):
+    paths = discover_files(input_dir) if input_dir and os.path.isdir(input_dir) else []
+    if synthetic_files:
+        workdir = tempfile.mkdtemp(prefix="bench_retrieval_")
+        paths += generate_corpus(workdir, synthetic_files, pages=5, seed=seed, identifier_rate=0.05)
+    documents = []
+    for path in paths:
+        with open(path, "rb") as f:
+            documents += load_data(f)
+
+    _, embed_model = load_backend(backend)
+    if isinstance(embed_model, FakeEmbedding):
+        embed_model = FakeEmbedding(dim=embed_model.dim, latency=embed_latency_ms / 1000)
+    index, _, bm25 = _load_or_build_index(documents, embed_model=embed_model)
+    nodes = _index_nodes(index)
+    query_set = make_queries(nodes, queries, seed)
+
+    results = {
+        "files": len(paths), "chunks": len(nodes), "queries": len(query_set), "top_k": top_k,
+        "backend": backend, "embed_latency_ms": embed_latency_ms, "modes": {},
+    }
+    for name, options in MODES:
+        retriever = HybridRetriever(index.as_retriever(similarity_top_k=10), bm25, index.docstore,
+                                    similarity_top_k=top_k, **options)
+        results["modes"][name] = evaluate(retriever, query_set, top_k)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--input-dir", default="Data")
+    parser.add_argument("--synthetic-files", type=int, default=20)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=2)
+    parser.add_argument("--backend", default="fake", help="fake, gemini or package.module:factory")
+    parser.add_argument("--embed-latency-ms", type=float, default=80.0,
+                        help="simulated query-embedding round trip for the fake backend")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write results as JSON to this path")
+    args = parser.parse_args()
+
+    results = run(args.input_dir, args.synthetic_files, args.queries, args.top_k, args.backend,
+                  args.embed_latency_ms, args.seed)
+    print(json.dumps(results, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Cold-start cost: import time of the modules the app loads up front versus the
+optional feature modules it now imports lazily, and first- versus second-
+interaction latency of a query with offline fake models.
+
+Every measurement runs in a fresh interpreter so nothing is already imported.
+
+    python -m benchmarks.startup --repeat 5 --out startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# What StreamlitApp.py imports at module top on every rerun.
+APP_MODULES = [
+    "streamlit",
+    "QAWithPDF.data_ingestion",
+    "QAWithPDF.model_api",
+    "QAWithPDF.embedding",
+    "QAWithPDF.corpus",
+    "QAWithPDF.answer_cache",
+    "QAWithPDF.streaming",
+    "QAWithPDF.translation",
+    "QAWithPDF.speech",
+    "QAWithPDF.tracing",
+]
+# Imported on first use only.
+LAZY_MODULES = [
+    "gtts",
+    "fpdf",
+    "deep_translator",
+    "graphviz",
+    "google.generativeai",
+    "llama_index.llms.gemini",
+    "llama_index.embeddings.gemini",
+]
+
+IMPORT_SNIPPET = """
+import importlib, json, sys, time
+start = time.perf_counter()
+try:
+    importlib.import_module(sys.argv[1])
+    print(json.dumps({"seconds": time.perf_counter() - start}))
+except ImportError as e:
+    print(json.dumps({"missing": str(e)}))
+"""
+
+INTERACTION_SNIPPET = """
+import json, sys, time
+start = time.perf_counter()
+from QAWithPDF.data_ingestion import load_data
+from QAWithPDF.embedding import download_gemini_embedding
+from QAWithPDF.fakes import FakeEmbedding, FakeGemini
+imports_s = time.perf_counter() - start
+
+def interaction(llm, embed_model):
+    start = time.perf_counter()
+    with open(sys.argv[1], "rb") as f:
+        engine = download_gemini_embedding(llm, load_data(f), embed_model=embed_model)
+    str(engine.query("What does the document say about payment terms?"))
+    return time.perf_counter() - start
+
+llm, embed_model = FakeGemini(), FakeEmbedding()
+first_s = interaction(llm, embed_model)
+second_s = interaction(llm, embed_model)
+print(json.dumps({"imports_s": imports_s, "first_interaction_s": first_s, "second_interaction_s": second_s}))
+"""
+
+
+def _python(snippet, *args, cwd=None):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [REPO_ROOT, os.environ.get("PYTHONPATH")])))
+    output = subprocess.run([sys.executable, "-c", snippet, *args], cwd=cwd or REPO_ROOT, env=env,
+                            check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def import_time(module, repeat):
+    runs = [_python(IMPORT_SNIPPET, module) for _ in range(repeat)]
+    if "missing" in runs[0]:
+        return {"module": module, "missing": runs[0]["missing"]}
+    return {"module": module, "median_ms": statistics.median(r["seconds"] for r in runs) * 1000}
+
+
+def run(repeat):
+    from benchmarks.synthetic import generate_corpus
+
+    workdir = tempfile.mkdtemp(prefix="bench_startup_")
+    path = generate_corpus(os.path.join(workdir, "corpus"), files=1, pages=5, formats=("txt",))[0]
+    interactions = [_python(INTERACTION_SNIPPET, path, cwd=tempfile.mkdtemp(dir=workdir)) for _ in range(repeat)]
+    return {
+        "repeat": repeat,
+        "app_imports": [import_time(module, repeat) for module in APP_MODULES],
+        "lazy_imports": [import_time(module, repeat) for module in LAZY_MODULES],
+        "interaction": {
+            key: statistics.median(run[key] for run in interactions)
+            for key in ("imports_s", "first_interaction_s", "second_interaction_s")
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3, help="fresh interpreters per measurement")
+    parser.add_argument("--out", help="write results as JSON to this path")
+    args = parser.parse_args()
+
+    results = run(args.repeat)
+    print(json.dumps(results, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Deterministic synthetic TXT, PDF and DOCX corpora for the benchmarks.
+
+    python -m benchmarks.synthetic out_dir --files 20 --pages 10 --formats txt pdf docx
+"""
+import argparse
+import os
+import random
+
+import docx
+import fitz  # PyMuPDF
+
+TOPICS = [
+    "contract", "payment", "liability", "renewal", "invoice", "delivery", "warranty", "termination",
+    "model", "training", "dataset", "gradient", "feature", "accuracy", "validation", "regression",
+    "patient", "diagnosis", "treatment", "dosage", "symptom", "clinical", "trial", "outcome",
+]
+FILLER = "the of and to in is for that with as on by this be are from at which or an it".split()
+
+
+def _identifier(rng):
+    kind = rng.randrange(3)
+    if kind == 0:
+        return f"clause {rng.randint(1, 20)}.{rng.randint(1, 9)}.{rng.randint(1, 9)}"
+    if kind == 1:
+        return f"part {rng.choice('ABCDEFGHJK')}{rng.choice('LMNPQRSTUV')}-{rng.randint(1000, 9999)}"
+    return f"{rng.choice(TOPICS)}{rng.randint(1, 999)}@example.com"
+
+
+def _sentence(rng, identifier_rate=0.0):
+    words = [rng.choice(TOPICS if rng.random() < 0.4 else FILLER) for _ in range(rng.randint(8, 20))]
+    if rng.random() < identifier_rate:
+        words.insert(rng.randrange(1, len(words)), _identifier(rng))
+    return " ".join(words).capitalize() + "."
+
+
+def make_pages(pages, words_per_page, seed=0, identifier_rate=0.0, paragraph_sentences=0):
+    """
+    Returns pages of pseudo-prose, each roughly words_per_page words long. With
+    identifier_rate > 0, that share of sentences mentions a clause number, part
+    code or email address, for exact-lookup queries. With paragraph_sentences > 0,
+    pages are split into paragraphs of about that many sentences, separated by
+    blank lines.
+    """
+    rng = random.Random(seed)
+    out = []
+    for _ in range(pages):
+        sentences, count = [], 0
+        while count < words_per_page:
+            sentence = _sentence(rng, identifier_rate)
+            sentences.append(sentence)
+            count += len(sentence.split())
+        if paragraph_sentences:
+            paragraphs, start = [], 0
+            while start < len(sentences):
+                size = rng.randint(max(1, paragraph_sentences // 2), paragraph_sentences * 3 // 2 + 1)
+                paragraphs.append(" ".join(sentences[start:start + size]))
+                start += size
+            out.append("\n\n".join(paragraphs))
+        else:
+            out.append(" ".join(sentences))
+    return out
+
+
+def write_txt(path, pages):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n\f\n".join(pages))
+
+
+def write_pdf(path, pages):
+    pdf = fitz.open()
+    for text in pages:
+        page = pdf.new_page()
+        page.insert_textbox(fitz.Rect(50, 50, page.rect.width - 50, page.rect.height - 50), text, fontsize=9)
+    pdf.save(path)
+    pdf.close()
+
+
+def write_docx(path, pages):
+    document = docx.Document()
+    for number, text in enumerate(pages, 1):
+        document.add_heading(f"Section {number}", level=1)
+        for paragraph in text.split("\n\n"):
+            document.add_paragraph(paragraph)
+    document.save(path)
+
+
+WRITERS = {"txt": write_txt, "pdf": write_pdf, "docx": write_docx}
+
+
+def generate_corpus(out_dir, files=10, pages=10, words_per_page=400, formats=("txt", "pdf", "docx"), seed=0,
+                    identifier_rate=0.0, paragraph_sentences=0):
+    """
+    Writes files documents to out_dir, cycling through formats. The same arguments
+    always produce the same text.
+
+    Returns:
+    - List[str]: paths of the generated files
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    for i in range(files):
+        file_type = formats[i % len(formats)]
+        path = os.path.join(out_dir, f"doc_{i:04d}.{file_type}")
+        WRITERS[file_type](path, make_pages(pages, words_per_page, seed=seed * 100003 + i,
+                                                   identifier_rate=identifier_rate,
+                                                   paragraph_sentences=paragraph_sentences))
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("out_dir")
+    parser.add_argument("--files", type=int, default=10)
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--words-per-page", type=int, default=400)
+    parser.add_argument("--formats", nargs="+", choices=sorted(WRITERS), default=["txt", "pdf", "docx"])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--identifier-rate", type=float, default=0.0)
+    parser.add_argument("--paragraph-sentences", type=int, default=0)
+    args = parser.parse_args()
+
+    for path in generate_corpus(args.out_dir, args.files, args.pages, args.words_per_page, args.formats, args.seed,
+                                args.identifier_rate, args.paragraph_sentences):
+        print(path)
+
+
+if __name__ == "__main__":
+    main()
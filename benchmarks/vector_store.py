@@ -0,0 +1,112 @@
+"""
+Compares llama-index's JSON SimpleVectorStore with MmapVectorStore.
+
+Reports load time and resident memory (each measured in a fresh subprocess)
+and single-query / batch-query latency on synthetic vectors.
+
+    python -m benchmarks.vector_store --nodes 20000 --dim 768
+"""
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+from llama_index.core.schema import TextNode
+from llama_index.core.vector_stores.simple import SimpleVectorStore
+from llama_index.core.vector_stores.types import VectorStoreQuery
+
+from QAWithPDF.vector_store import MmapVectorStore, convert_simple_store, load_vector_store
+
+
+def _rss_mb():
+    """
+    Current resident set size. ru_maxrss is only a fallback: its high-water mark
+    survives exec, so it would include the parent's memory.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _load_in_child(persist_dir, queries, top_k):
+    baseline = _rss_mb()
+    start = time.perf_counter()
+    store = load_vector_store(persist_dir)
+    load_s = time.perf_counter() - start
+    rss_after_load = _rss_mb() - baseline
+    query_vectors = np.load(queries)
+    latencies = []
+    for vector in query_vectors:
+        start = time.perf_counter()
+        store.query(VectorStoreQuery(query_embedding=vector.tolist(), similarity_top_k=top_k))
+        latencies.append(time.perf_counter() - start)
+    result = {
+        "backend": type(store).__name__,
+        "load_s": load_s,
+        "rss_after_load_mb": rss_after_load,
+        "rss_after_queries_mb": _rss_mb() - baseline,
+        "query_p50_ms": statistics.median(latencies) * 1000,
+        "query_p95_ms": float(np.percentile(latencies, 95)) * 1000,
+    }
+    if isinstance(store, MmapVectorStore):
+        start = time.perf_counter()
+        store.query_batch(query_vectors, top_k)
+        result["batch_query_ms_per_query"] = (time.perf_counter() - start) * 1000 / len(query_vectors)
+    print(json.dumps(result))
+
+
+def run(nodes, dim, queries, top_k, seed=0):
+    rng = np.random.default_rng(seed)
+    workdir = tempfile.mkdtemp(prefix="bench_vs_")
+    json_dir = os.path.join(workdir, "json")
+    store = SimpleVectorStore()
+    vectors = rng.standard_normal((nodes, dim), dtype=np.float32)
+    store.add([TextNode(id_=f"node-{i}", text="", embedding=vectors[i].tolist()) for i in range(nodes)])
+    store.persist(os.path.join(json_dir, "default__vector_store.json"))
+    mmap_dir = convert_simple_store(json_dir, os.path.join(workdir, "mmap"))
+    query_path = os.path.join(workdir, "queries.npy")
+    np.save(query_path, rng.standard_normal((queries, dim), dtype=np.float32))
+
+    results = {"nodes": nodes, "dim": dim, "queries": queries, "top_k": top_k, "backends": []}
+    for persist_dir in (json_dir, mmap_dir):
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.vector_store", "--child", persist_dir, query_path, str(top_k)],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        results["backends"].append(json.loads(output.strip().splitlines()[-1]))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nodes", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--top-k", type=int, default=2)
+    parser.add_argument("--out", help="write results as JSON to this path")
+    parser.add_argument("--child", nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        persist_dir, queries, top_k = args.child
+        _load_in_child(persist_dir, queries, int(top_k))
+        return
+
+    results = run(args.nodes, args.dim, args.queries, args.top_k)
+    print(json.dumps(results, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,9 @@
+import json
 import logging
 import os
 from datetime import datetime
 
-LOG_FILE=f"{datetime.now().strftime('%m_%d_%Y_%H_%M_%S')}.log"
+LOG_FILE=os.getenv("SMARTDOC_LOG_FILE") or f"{datetime.now().strftime('%m_%d_%Y_%H_%M_%S')}.log"
 
 log_path=os.path.join(os.getcwd(),"logs")
 
@@ -11,8 +12,33 @@ os.makedirs(log_path,exist_ok=True)
 LOG_FILEPATH=os.path.join(log_path,LOG_FILE)
 
 
-logging.basicConfig(level=logging.INFO, 
-                    filename=LOG_FILEPATH,
-                    format="[%(asctime)s] %(lineno)d %(name)s - %(levelname)s - %(message)s"
-                    
-)
\ No newline at end of file
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line. Tracing spans (extra={"span": {...}}) are merged
+    into the record so every span field is a top-level key.
+    """
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        span = getattr(record, "span", None)
+        if span:
+            entry.update(span)
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+handler = logging.FileHandler(LOG_FILEPATH, encoding="utf-8")
+if os.getenv("SMARTDOC_LOG_FORMAT", "text") == "json":
+    handler.setFormatter(JsonFormatter())
+else:
+    handler.setFormatter(logging.Formatter("[%(asctime)s] %(lineno)d %(name)s - %(levelname)s - %(message)s"))
+
+logging.basicConfig(level=logging.INFO,
+                    handlers=[handler]
+)
@@ -6,6 +6,10 @@ setup(
     author= 'vishal m',
     author_email= 'vishalmuthukumar3@gmail.com',
     packages= find_packages(),
-    install_requires = []
+    py_modules= ['logger'],
+    install_requires = [],
+    entry_points= {
+        'console_scripts': ['smartdoc-batch=QAWithPDF.batch:main', 'smartdoc-api=QAWithPDF.api:main'],
+    },
 
 )
\ No newline at end of file
@@ -0,0 +1,24 @@
+import io
+
+from QAWithPDF.batch import load_backend
+from QAWithPDF.data_ingestion import load_data
+from QAWithPDF.scheduler import ScheduledLLM, track_usage
+
+
+def test_fake_backend_is_scheduled_and_counts_usage():
+    llm, _ = load_backend("fake")
+    assert isinstance(llm, ScheduledLLM)
+    with track_usage() as usage:
+        llm.complete("What does the report say?")
+    assert usage.calls == 1 and usage.prompt_tokens > 0
+
+
+def test_load_data_keeps_sections_apart_on_request():
+    text = "\n\n".join(f"Section {i}. " + "words " * 12000 for i in range(4))
+    upload = io.BytesIO(text.encode("utf-8"))
+    upload.name = "notes.txt"
+    pages = load_data(upload, pages=True)
+    upload.seek(0)
+    [whole] = load_data(upload)
+    assert len(pages) > 1
+    assert "".join(page.text for page in pages) == whole.text
@@ -0,0 +1,48 @@
+import pytest
+
+from QAWithPDF.bm25 import BM25Index, is_exact_lookup, skips_query_embedding
+from QAWithPDF.context import PERSONA_INSTRUCTIONS, persona_prompt
+from QAWithPDF.insights import DEEP_DIVE_PROMPT, MINDMAP_PROMPT, QUIZ_PROMPT, SUMMARY_PROMPT
+
+
+@pytest.fixture
+def bm25():
+    # Plain numbers that also occur in the persona and insight prompts, next to real identifiers.
+    index = BM25Index()
+    index.add("a", "Section 1 lists 5 risks and the top 10 suppliers for 2024, and main findings on page 2.")
+    index.add("b", "Clause 4.2.1 sets a 30 day notice period. Invoice inv-2024-001 is disputed.")
+    index.add("c", "Questions go to billing@example.com, see 2024/03/01 minutes.")
+    return index
+
+
+@pytest.mark.parametrize("persona", ["Standard", *PERSONA_INSTRUCTIONS])
+def test_persona_prompts_are_not_exact_lookups(bm25, persona):
+    assert not is_exact_lookup(persona_prompt("What are the main risks?", persona), bm25)
+
+
+@pytest.mark.parametrize("prompt", [SUMMARY_PROMPT, MINDMAP_PROMPT, QUIZ_PROMPT, DEEP_DIVE_PROMPT])
+def test_insight_prompts_are_not_exact_lookups(bm25, prompt):
+    assert not is_exact_lookup(prompt, bm25)
+
+
+@pytest.mark.parametrize("query", [
+    "What does clause 4.2.1 say?",
+    "Why is INV-2024-001 disputed?",
+    "Who reads billing@example.com?",
+    "What was decided on 2024/03/01?",
+])
+def test_identifiers_are_exact_lookups(bm25, query):
+    assert is_exact_lookup(query, bm25)
+
+
+def test_unindexed_identifier_is_not_exact_lookup(bm25):
+    assert not is_exact_lookup("What does clause 9.9.9 say?", bm25)
+
+
+def test_only_exact_lookups_skip_query_embedding(bm25):
+    assert skips_query_embedding("What does clause 4.2.1 say?", bm25, mode="hybrid", fast_path=True)
+    assert not skips_query_embedding(persona_prompt("What are the risks?", "ELI5 (Simple)"), bm25, mode="hybrid",
+                                     fast_path=True)
+    assert not skips_query_embedding("What does clause 4.2.1 say?", bm25, mode="hybrid", fast_path=False)
+    assert not skips_query_embedding("What does clause 4.2.1 say?", bm25, mode="vector")
+    assert skips_query_embedding("What are the risks?", bm25, mode="lexical")
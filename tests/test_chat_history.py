@@ -0,0 +1,28 @@
+from QAWithPDF.chat_history import ChatHistoryStore
+
+
+def make_store(tmp_path, count):
+    store = ChatHistoryStore(str(tmp_path / "history.sqlite3"))
+    for i in range(count):
+        store.append("session", "doc", "doc.pdf", {"q": f"q{i}", "a": f"a{i}", "a_en": f"a{i}", "lang": "English"})
+    return store
+
+
+def test_keyset_pages_cover_the_history_once(tmp_path):
+    store = make_store(tmp_path, 25)
+    page, has_older = store.latest("session", "doc", limit=10)
+    loaded = list(page)
+    while has_older:
+        page, has_older = store.latest("session", "doc", limit=10, before=loaded[-1]["id"])
+        loaded.extend(page)
+    assert [chat["q"] for chat in loaded] == [f"q{i}" for i in reversed(range(25))]
+
+
+def test_after_reads_only_new_messages(tmp_path):
+    store = make_store(tmp_path, 12)
+    page, _ = store.latest("session", "doc", limit=10)
+    assert store.latest("session", "doc", after=page[0]["id"]) == ([], False)
+
+    store.append("session", "doc", "doc.pdf", {"q": "new", "a": "a", "a_en": "a", "lang": "English"})
+    newer, more = store.latest("session", "doc", after=page[0]["id"])
+    assert [chat["q"] for chat in newer] == ["new"] and not more
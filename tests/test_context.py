@@ -0,0 +1,33 @@
+import pytest
+from llama_index.core.schema import NodeWithScore, QueryBundle, TextNode
+
+from QAWithPDF.context import PERSONA_BUDGETS, ContextPacker, context_budget
+
+CHUNK_TOKENS = 800
+
+
+def full_chunks(count):
+    # Distinct words per chunk so none of them is dropped as a near-duplicate.
+    return [NodeWithScore(node=TextNode(text=" ".join(f"w{i}x{j}" for j in range(40)),
+                                        metadata={"tokens": CHUNK_TOKENS}), score=1.0)
+            for i in range(count)]
+
+
+def packed_chunks(persona):
+    packer = ContextPacker(budget=context_budget(persona, chunk_tokens=CHUNK_TOKENS))
+    return len(packer.postprocess_nodes(full_chunks(12), QueryBundle("What are the risks?")))
+
+
+def test_persona_budgets_differ():
+    budgets = [context_budget(persona, chunk_tokens=CHUNK_TOKENS)
+               for persona in ("Executive (Brief)", "ELI5 (Simple)", "Standard", "Skeptic (Critical)")]
+    assert budgets == sorted(set(budgets))
+
+
+@pytest.mark.parametrize("persona", list(PERSONA_BUDGETS))
+def test_every_persona_fits_two_full_chunks(persona):
+    assert packed_chunks(persona) >= 2
+
+
+def test_standard_packs_more_than_executive():
+    assert packed_chunks("Standard") > packed_chunks("Executive (Brief)")
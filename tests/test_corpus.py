@@ -0,0 +1,28 @@
+import threading
+
+from llama_index.core.schema import TextNode
+
+from QAWithPDF.corpus import CorpusIndex
+from QAWithPDF.fakes import FakeEmbedding
+
+
+def test_document_removed_while_loading_is_not_added():
+    corpus = CorpusIndex(embed_model=FakeEmbedding(dim=8))
+    loading, removed = threading.Event(), threading.Event()
+
+    def load_nodes():
+        loading.set()
+        removed.wait()
+        return [TextNode(text="Clause 4.2.1 covers payment.", embedding=[0.1] * 8)]
+
+    worker = threading.Thread(target=corpus.ensure_document, args=("doc", load_nodes))
+    worker.start()
+    loading.wait()
+    corpus.remove_document("doc")
+    removed.set()
+    worker.join()
+    assert not corpus.has_document("doc")
+
+    # Uploading it again later indexes it as usual.
+    corpus.ensure_document("doc", lambda: [TextNode(text="Clause 4.2.1 covers payment.", embedding=[0.1] * 8)])
+    assert corpus.has_document("doc")
@@ -0,0 +1,44 @@
+import io
+import threading
+
+from QAWithPDF.document_store import DocumentStore
+
+
+def upload(text, name="notes.txt"):
+    f = io.BytesIO(text.encode("utf-8"))
+    f.name = name
+    return f
+
+
+def test_concurrent_parses_of_one_upload_share_one_parse(monkeypatch):
+    store = DocumentStore()
+    parse, started, release = store._parse, threading.Event(), threading.Event()
+    calls = []
+
+    def slow_parse(uploaded_file, digest):
+        calls.append(digest)
+        started.set()
+        release.wait(5)
+        return parse(uploaded_file, digest)
+
+    monkeypatch.setattr(store, "_parse", slow_parse)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(store.get_or_parse(upload("Contact a@example.com."))))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    started.wait(5)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert len(results) == 4 and all(parsed is results[0] for parsed in results)
+    assert store.stats()["misses"] == 1 and store.stats()["hits"] == 3
+
+
+def test_text_is_joined_from_pages():
+    parsed = DocumentStore().get_or_parse(upload("First section.\n\nSecond section, 2024-01-31."))
+    assert parsed.text == "".join(page.text for page in parsed.pages)
+    assert parsed.documents[0].text == parsed.text
+    assert parsed.dates == ["2024-01-31"]
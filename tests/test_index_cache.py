@@ -0,0 +1,30 @@
+import os
+
+from QAWithPDF.index_cache import MARKER_FILE, TMP_PREFIX, IndexCache
+from QAWithPDF.tracing import metrics
+
+
+def write_entry(root, name, size):
+    os.makedirs(os.path.join(root, name))
+    with open(os.path.join(root, name, "data"), "wb") as f:
+        f.write(b"x" * size)
+    with open(os.path.join(root, name, MARKER_FILE), "w") as f:
+        f.write("{}")
+
+
+def test_entries_being_written_are_neither_listed_nor_evicted(tmp_path):
+    cache = IndexCache(root=str(tmp_path), max_bytes=100)
+    write_entry(str(tmp_path), "old", 80)
+    write_entry(str(tmp_path), f"{TMP_PREFIX}new-1-2", 80)
+
+    assert [key for key, _, _ in cache.entries()] == ["old"]
+    cache.evict()
+    assert os.path.exists(tmp_path / f"{TMP_PREFIX}new-1-2" / MARKER_FILE)
+    assert cache.evictions == 0
+
+
+def test_hits_and_misses_are_exported(tmp_path):
+    metrics.reset()
+    cache = IndexCache(root=str(tmp_path))
+    assert cache.load_index("missing") is None
+    assert 'smartdoc_stage_items_total{stage="index_cache",kind="misses"} 1' in metrics.render()
@@ -0,0 +1,49 @@
+import threading
+
+from QAWithPDF.jobs import CANCELLED, DONE, JobRunner, cancelled
+
+
+def test_cancel_drops_combined_scopes_of_the_document():
+    runner = JobRunner(max_workers=1)
+    release = threading.Event()
+    blocker = runner.submit("busy", "quiz", release.wait)
+    combined = runner.submit("a+b", "summary", lambda: "both", members=["a", "b"])
+    other = runner.submit("c+d", "summary", lambda: "other", members=["c", "d"])
+
+    assert runner.cancel("a") == 1
+    assert combined.status == CANCELLED
+    assert runner.get("a+b", "summary") is None
+    release.set()
+    blocker.future.result()
+    other.future.result()
+    assert other.status == DONE
+
+
+def test_running_job_sees_its_cancellation():
+    runner = JobRunner(max_workers=1)
+    started, release = threading.Event(), threading.Event()
+    seen = []
+
+    def work():
+        started.set()
+        release.wait()
+        seen.append(cancelled())
+
+    job = runner.submit("a+b", "mindmap", work, members=["a", "b"])
+    started.wait()
+    runner.cancel("b")
+    release.set()
+    job.future.result()
+    assert seen == [True]
+    assert job.status == CANCELLED
+    assert not cancelled()
+
+
+def test_finished_jobs_are_pruned_oldest_first():
+    runner = JobRunner(max_workers=1, max_finished=2)
+    for doc_id in ("a", "b", "c"):
+        runner.submit(doc_id, "summary", lambda: doc_id).future.result()
+    runner.submit("d", "summary", lambda: "d").future.result()
+    # Pruned when "d" is submitted, while "d" itself is still pending.
+    assert runner.get("a", "summary") is None
+    assert runner.get("c", "summary").status == DONE and runner.get("d", "summary").status == DONE
@@ -0,0 +1,107 @@
+import gc
+import time
+
+from llama_index.core.llms import CompletionResponse
+
+from QAWithPDF.fakes import FakeGemini
+from QAWithPDF.ratelimit import RateLimiter
+from QAWithPDF.scheduler import BACKGROUND, INTERACTIVE, LLMScheduler, ScheduledLLM, track_usage
+from QAWithPDF.tracing import count_tokens, metrics
+
+closed = []
+
+
+class ClosingGemini(FakeGemini):
+    # Records when the upstream stream is closed, like an HTTP response being released.
+    def stream_complete(self, prompt, formatted=False, **kwargs):
+        def gen():
+            try:
+                yield from super(ClosingGemini, self).stream_complete(prompt, formatted=formatted, **kwargs)
+            finally:
+                closed.append(prompt)
+
+        return gen()
+
+
+def make_llm():
+    closed.clear()
+    scheduler = LLMScheduler(rpm=0, tpm=0, max_concurrency=1)
+    return ScheduledLLM(ClosingGemini(), scheduler=scheduler), scheduler
+
+
+def test_abandoned_stream_releases_its_key():
+    llm, scheduler = make_llm()
+    stream = llm.stream_complete("What is in the contract?")
+    first = next(stream)
+    assert isinstance(first, CompletionResponse)
+    assert scheduler._inflight
+
+    stream.close()
+    del stream
+    gc.collect()
+    assert scheduler._inflight == {}
+    assert closed == ["What is in the contract?"]
+
+    # The same prompt now makes a new call instead of resuming the abandoned stream.
+    text = list(llm.stream_complete("What is in the contract?"))[-1].text
+    assert scheduler.coalesced == 0
+    assert text == " ".join(FakeGemini()._answer_words("What is in the contract?"))
+    assert scheduler._inflight == {}
+
+
+def test_unstarted_stream_releases_its_key():
+    llm, scheduler = make_llm()
+    stream = llm.stream_complete("Never read")
+    del stream
+    gc.collect()
+    assert scheduler._inflight == {}
+
+
+def test_stream_stays_shared_while_one_consumer_remains():
+    llm, scheduler = make_llm()
+    leader = llm.stream_complete("Shared prompt")
+    next(leader)
+    follower = llm.stream_complete("Shared prompt")
+    assert scheduler.coalesced == 1
+
+    leader.close()
+    del leader
+    gc.collect()
+    assert scheduler._inflight
+    assert list(follower)[-1].text == " ".join(FakeGemini()._answer_words("Shared prompt"))
+    assert scheduler._inflight == {}
+    assert closed == ["Shared prompt"]
+
+
+def test_interactive_request_overtakes_background_when_quota_is_exhausted():
+    scheduler = LLMScheduler(rpm=0, tpm=0, max_concurrency=1)
+    scheduler._requests = RateLimiter(2, burst=1)
+    order = []
+    scheduler.call("warm", lambda: None)
+
+    futures = []
+    for name, level in (("a", BACKGROUND), ("b", BACKGROUND), ("chat", INTERACTIVE)):
+        futures.append(scheduler.submit(name, lambda name=name: order.append(name), level=level))
+        # The worker reaches "a" while the quota is still exhausted.
+        time.sleep(0.1)
+    for future in futures:
+        future.result(timeout=10)
+    assert order == ["chat", "a", "b"]
+
+
+def test_coalesced_calls_count_tokens_once():
+    metrics.reset()
+    llm, scheduler = make_llm()
+    leader = llm.stream_complete("Counted once")
+    next(leader)
+    with track_usage() as usage:
+        follower = llm.stream_complete("Counted once")
+        text = list(follower)[-1].text
+    list(leader)
+
+    assert scheduler.coalesced == 1
+    prompt = count_tokens("Counted once")
+    assert metrics._counters[("llm_tokens", "prompt")] == prompt
+    assert metrics._counters[("llm_tokens", "completion")] == count_tokens(text)
+    # The follower still reports the tokens of the answer it received.
+    assert usage.prompt_tokens == prompt and usage.completion_tokens == count_tokens(text)
@@ -0,0 +1,36 @@
+import os
+
+from QAWithPDF.fakes import FakeSpeech
+from QAWithPDF.speech import SpeechCache, SpeechService, speech_key
+
+ANSWER = "First sentence. " + " ".join(f"Sentence number {i} of the answer." for i in range(20))
+
+
+def test_first_segment_and_rest_play_the_answer_once():
+    job = SpeechService(FakeSpeech()).synthesize(ANSWER)
+    assert len(job) > 1
+    assert job.first() + job.rest() == job.audio()
+    assert job.first() not in job.rest()
+
+
+def test_cache_evicts_least_recently_used_segments(tmp_path):
+    cache = SpeechCache(cache_dir=str(tmp_path), max_bytes=350)
+    for i in range(3):
+        cache.put(str(i), b"x" * 100)
+        os.utime(tmp_path / f"{i}.mp3", (i, i))
+    assert cache.get("0") is not None  # played again, so "1" is now the oldest
+    cache.put("3", b"x" * 100)
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["0.mp3", "2.mp3", "3.mp3"]
+    assert cache.evictions == 1
+    assert sum(size for _, _, size in cache.entries()) <= 350
+
+
+def test_cached_segments_are_reused(tmp_path):
+    backend = FakeSpeech()
+    service = SpeechService(backend, cache=SpeechCache(cache_dir=str(tmp_path)))
+    service.synthesize(ANSWER).audio()
+    calls = backend.calls
+    service.synthesize(ANSWER).audio()
+    assert backend.calls == calls
+    assert (tmp_path / f"{speech_key('First sentence.', 'en', False)}.mp3").exists()
@@ -0,0 +1,19 @@
+from QAWithPDF.streaming import SentenceBuffer
+
+
+def stream(text, size=3):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def test_segments_rebuild_the_streamed_text():
+    text = "## Terms\n\n- Payment is due in 30 days.\n- Late fees apply! See clause 4.2.1 below.\nDone"
+    buffer = SentenceBuffer()
+    segments = [segment for token in stream(text) for segment in buffer.feed_segments(token)]
+    segments += buffer.flush_segments()
+    assert "".join(sentence + separator for sentence, separator in segments) == text
+
+
+def test_feed_returns_stripped_sentences():
+    buffer = SentenceBuffer()
+    sentences = [s for token in stream("First one. Second one!\nThird") for s in buffer.feed(token)]
+    assert sentences + buffer.flush() == ["First one.", "Second one!", "Third"]
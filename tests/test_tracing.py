@@ -0,0 +1,46 @@
+import io
+import threading
+
+import pytest
+
+from QAWithPDF import tracing
+from QAWithPDF.data_ingestion import load_data
+from QAWithPDF.exception import customexception
+from QAWithPDF.scheduler import LLMScheduler
+
+
+def test_llm_request_nests_under_the_submitting_span():
+    scheduler = LLMScheduler(rpm=0, tpm=0, max_concurrency=1)
+    with tracing.span("synthesis") as synthesis:
+        scheduler.call("key", lambda: "done")
+    request = next(record for record in tracing.recent_spans() if record["name"] == "llm_request")
+    assert request["parent_id"] == synthesis.span_id
+    assert request["trace_id"] == synthesis.trace_id
+
+
+def test_concurrent_metric_writes_do_not_share_a_temp_file(tmp_path):
+    path = str(tmp_path / "metrics.prom")
+    errors = []
+
+    def write():
+        try:
+            for _ in range(50):
+                tracing.write_metrics(path)
+        except OSError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=write) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert [p.name for p in tmp_path.iterdir()] == ["metrics.prom"]
+
+
+def test_load_data_wraps_errors_once():
+    upload = io.BytesIO(b"not a zip")
+    upload.name = "broken.docx"
+    with pytest.raises(customexception) as info:
+        load_data(upload)
+    assert not isinstance(info.value.error_message, customexception)